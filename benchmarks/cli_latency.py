@@ -0,0 +1,65 @@
+"""
+Compares end-to-end latency of running a case through the meny CLI directly
+(meny file.py <case> <args>) against selecting the same case in the interactive menu.
+
+Run from the repository root:
+    python benchmarks/cli_latency.py [-n 20]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CASES_SOURCE = """
+def add(a: int, b: int):
+    return a + b
+"""
+
+DIRECT = "import sys; from meny.cli import cli; sys.argv[0] = 'meny'; cli()"
+# The interactive path uses the simple frontend since the fancy frontend requires a terminal
+INTERACTIVE = (
+    "import sys, meny; meny.set_default_frontend('simple'); "
+    "from meny.cli import cli; sys.argv[0] = 'meny'; cli()"
+)
+
+
+def timeit(argv, stdin: str, n: int):
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        subprocess.run(argv, input=stdin, text=True, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name: str, times):
+    print(
+        f"{name:<12} median {statistics.median(times) * 1000:7.1f} ms"
+        f"   min {min(times) * 1000:7.1f} ms   max {max(times) * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20, help="Number of runs per path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        casefile = Path(tmpdir) / "cases.py"
+        casefile.write_text(CASES_SOURCE)
+
+        report("baseline", timeit([sys.executable, "-c", "pass"], "", args.n))
+        report("direct", timeit([sys.executable, "-c", DIRECT, str(casefile), "1", "1", "2"], "", args.n))
+        report("interactive", timeit([sys.executable, "-c", INTERACTIVE, str(casefile)], "1 1 2\n", args.n))
+
+
+if __name__ == "__main__":
+    main()
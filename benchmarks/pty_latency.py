@@ -0,0 +1,527 @@
+"""
+Measures the frontends as seen from a terminal: menus are started on a pseudo-terminal, keystrokes
+are sent to them and what they write is parsed with a minimal VT100 screen model. For menus of
+10, 1,000 and 10,000 cases in both frontends, it measures
+
+    startup     time until the menu is first drawn
+    keystroke   time from a keystroke (typing a case, or a backspace) until the screen is updated,
+                and the number of bytes written for it
+    iteration   time from selecting a case (which does nothing) until the menu is drawn again,
+                and the number of bytes written for it
+
+Times are until the last byte of the update, which is taken to be done when nothing more is
+written for a moment (--settle). The medians of the keystrokes and iterations, and the bytes written,
+are compared with a baseline (startup, which is measured once, and the 95th percentiles are too
+noisy), and the script exits with 1 if some measurement got worse than the tolerance allows:
+
+    python benchmarks/pty_latency.py                   # compare with benchmarks/pty_latency_baseline.json
+    python benchmarks/pty_latency.py --save-baseline   # measure and store a new baseline
+
+The baseline is only meaningful on the machine it was measured on. Requires a POSIX system.
+"""
+
+import argparse
+import codecs
+import fcntl
+import json
+import os
+import platform
+import pty
+import re
+import select
+import signal
+import statistics
+import struct
+import sys
+import tempfile
+import termios
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "pty_latency_baseline.json"
+
+# Runs the cases of the module given as first argument with the frontend given as second argument.
+# Input is not remembered (such that the same keys can be sent every iteration) and history is off.
+MENU = (
+    "import sys, importlib, meny; meny.config.DEFAULT_REMEMBER = meny.config.DEFAULT_HISTORY = False; "
+    "meny.menu(importlib.import_module(sys.argv[1]), frontend=sys.argv[2])"
+)
+
+# Bits of Screen attributes
+BOLD, UNDERLINE, REVERSE = 1, 2, 4
+_SGR_ON = {1: BOLD, 4: UNDERLINE, 7: REVERSE}
+_SGR_OFF = {22: BOLD, 24: UNDERLINE, 27: REVERSE}
+
+_TOKEN = re.compile(
+    r"\x1b\[(?P<csi>[0-9;?>=!]*[ -/]*[@-~])"
+    r"|\x1b\](?P<osc>[^\x07\x1b]*)(?:\x07|\x1b\\)"
+    r"|\x1b(?P<charset>[()*+].)"
+    r"|\x1b(?P<esc>[^\[\]()*+])"
+    r"|(?P<ctrl>[\x00-\x1a\x1c-\x1f\x7f])"
+    r"|(?P<text>[^\x00-\x1f\x7f]+)"
+)
+_CSI = re.compile(r"([?>=!]?)([0-9;]*)[ -/]*([@-~])")
+
+# Measurements that are compared with the baseline
+COMPARED = ("startup_bytes", "keystroke_ms", "keystroke_bytes", "iteration_ms", "iteration_bytes")
+
+
+class Screen:
+    """
+    Minimal VT100 (xterm) screen model, which supports what curses and readline write to an xterm:
+    cursor movement, erasing, scrolling, the alternate screen and the bold, underline and reverse
+    attributes. Colors are ignored.
+    """
+
+    def __init__(self, rows: int = 24, cols: int = 80):
+        self.rows = rows
+        self.cols = cols
+        self.attr = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._pending = ""  # Incomplete escape sequence at the end of what was fed
+        self._main: Optional[tuple] = None  # Main screen, while the alternate screen is shown
+        self.reset()
+
+    def reset(self):
+        self.chars = [[" "] * self.cols for _ in range(self.rows)]
+        self.attrs = [[0] * self.cols for _ in range(self.rows)]
+        self.y = self.x = 0
+        self.saved = (0, 0)
+        self.top, self.bottom = 0, self.rows - 1  # Scrolling region
+        self._wrap = False  # Cursor is past the last column, the next character goes on the next line
+
+    def line(self, y: int) -> str:
+        return "".join(self.chars[y]).rstrip()
+
+    def text(self) -> str:
+        return "\n".join(self.line(y) for y in range(self.rows)).rstrip("\n")
+
+    def snapshot(self) -> tuple:
+        """Content, attributes and cursor of the screen, for comparing screens"""
+        return (
+            tuple("".join(chars) for chars in self.chars),
+            tuple(tuple(attrs) for attrs in self.attrs),
+            (self.y, self.x),
+        )
+
+    def feed(self, data: bytes):
+        text = self._pending + self._decoder.decode(data)
+        self._pending = ""
+        pos = 0
+        while pos < len(text):
+            match = _TOKEN.match(text, pos)
+            if match is None:  # Escape sequence that has not been fully written yet, or unsupported
+                if len(text) - pos < 64:
+                    self._pending = text[pos:]
+                    return
+                pos += 1
+                continue
+            pos = match.end()
+            kind = match.lastgroup
+            if kind == "text":
+                self._put(match.group(kind))
+            elif kind == "ctrl":
+                self._control(match.group(kind))
+            elif kind == "csi":
+                self._csi(match.group(kind))
+            elif kind == "esc":
+                self._esc(match.group(kind))
+
+    def _put(self, text: str):
+        for char in text:
+            if self._wrap:
+                self.x = 0
+                self._linefeed()
+                self._wrap = False
+            self.chars[self.y][self.x] = char
+            self.attrs[self.y][self.x] = self.attr
+            if self.x == self.cols - 1:
+                self._wrap = True
+            else:
+                self.x += 1
+
+    def _linefeed(self):
+        if self.y == self.bottom:
+            self._scroll(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _scroll(self, n: int):
+        """Scrolls the scrolling region n lines up, or -n lines down if n is negative"""
+        for _ in range(min(abs(n), self.bottom - self.top + 1)):
+            if n > 0:
+                del self.chars[self.top], self.attrs[self.top]
+                self.chars.insert(self.bottom, [" "] * self.cols)
+                self.attrs.insert(self.bottom, [0] * self.cols)
+            else:
+                del self.chars[self.bottom], self.attrs[self.bottom]
+                self.chars.insert(self.top, [" "] * self.cols)
+                self.attrs.insert(self.top, [0] * self.cols)
+
+    def _erase(self, y: int, start: int, end: int):
+        self.chars[y][start:end] = [" "] * (end - start)
+        self.attrs[y][start:end] = [0] * (end - start)
+
+    def _move(self, y: int, x: int):
+        self.y = min(max(y, 0), self.rows - 1)
+        self.x = min(max(x, 0), self.cols - 1)
+        self._wrap = False
+
+    def _control(self, char: str):
+        if char == "\r":
+            self._move(self.y, 0)
+        elif char in "\n\x0b\x0c":
+            self._linefeed()
+            self._wrap = False
+        elif char == "\b":
+            self._move(self.y, self.x - 1)
+        elif char == "\t":
+            self._move(self.y, (self.x // 8 + 1) * 8)
+
+    def _esc(self, char: str):
+        if char == "7":
+            self.saved = (self.y, self.x)
+        elif char == "8":
+            self._move(*self.saved)
+        elif char == "D":
+            self._linefeed()
+        elif char == "E":
+            self._move(self.y, 0)
+            self._linefeed()
+        elif char == "M":
+            if self.y == self.top:
+                self._scroll(-1)
+            else:
+                self._move(self.y - 1, self.x)
+        elif char == "c":
+            self.attr = 0
+            self.reset()
+
+    def _csi(self, sequence: str):
+        private, params, final = _CSI.match(sequence).groups()
+        args = [int(arg) if arg else 0 for arg in params.split(";")] if params else []
+        n = max(args[0], 1) if args else 1
+        if private == "?":
+            if final in "hl" and any(arg in (47, 1047, 1049) for arg in args):
+                self._alternate(final == "h")
+            return
+        if private:
+            return
+        if final in "Hf":
+            self._move((args[0] if args else 1) - 1, (args[1] if len(args) > 1 else 1) - 1)
+        elif final == "A":
+            self._move(self.y - n, self.x)
+        elif final in "Be":
+            self._move(self.y + n, self.x)
+        elif final in "Ca":
+            self._move(self.y, self.x + n)
+        elif final == "D":
+            self._move(self.y, self.x - n)
+        elif final == "E":
+            self._move(self.y + n, 0)
+        elif final == "F":
+            self._move(self.y - n, 0)
+        elif final == "d":
+            self._move(n - 1, self.x)
+        elif final in "G`":
+            self._move(self.y, n - 1)
+        elif final == "K":
+            mode = args[0] if args else 0
+            start, end = {0: (self.x, self.cols), 1: (0, self.x + 1)}.get(mode, (0, self.cols))
+            self._erase(self.y, start, end)
+        elif final == "J":
+            mode = args[0] if args else 0
+            if mode == 0:
+                self._erase(self.y, self.x, self.cols)
+                rows = range(self.y + 1, self.rows)
+            elif mode == 1:
+                self._erase(self.y, 0, self.x + 1)
+                rows = range(self.y)
+            else:
+                rows = range(self.rows)
+            for y in rows:
+                self._erase(y, 0, self.cols)
+        elif final == "X":
+            self._erase(self.y, self.x, min(self.x + n, self.cols))
+        elif final == "P":
+            for chars, blank in ((self.chars[self.y], " "), (self.attrs[self.y], 0)):
+                del chars[self.x : self.x + n]
+                chars.extend([blank] * (self.cols - len(chars)))
+        elif final == "@":
+            for chars, blank in ((self.chars[self.y], " "), (self.attrs[self.y], 0)):
+                chars[self.x : self.x] = [blank] * n
+                del chars[self.cols :]
+        elif final in "LM" and self.top <= self.y <= self.bottom:
+            top, self.top = self.top, self.y
+            self._scroll(n if final == "M" else -n)
+            self.top = top
+        elif final == "S":
+            self._scroll(n)
+        elif final == "T":
+            self._scroll(-n)
+        elif final == "r":
+            top = (args[0] if args else 1) - 1
+            bottom = (args[1] if len(args) > 1 and args[1] else self.rows) - 1
+            if 0 <= top < bottom < self.rows:
+                self.top, self.bottom = top, bottom
+            self._move(0, 0)
+        elif final == "s":
+            self.saved = (self.y, self.x)
+        elif final == "u":
+            self._move(*self.saved)
+        elif final == "m":
+            for arg in args or [0]:
+                if arg == 0:
+                    self.attr = 0
+                elif arg in _SGR_ON:
+                    self.attr |= _SGR_ON[arg]
+                elif arg in _SGR_OFF:
+                    self.attr &= ~_SGR_OFF[arg]
+
+    def _alternate(self, on: bool):
+        if on and self._main is None:
+            self._main = (self.chars, self.attrs, self.y, self.x)
+            self.reset()
+        elif not on and self._main is not None:
+            self.chars, self.attrs, self.y, self.x = self._main
+            self._main = None
+            self.top, self.bottom = 0, self.rows - 1
+
+
+class FrontendExited(Exception):
+    """The menu process exited while waiting for it to write to the terminal"""
+
+
+class PtyMenu:
+    """
+    A menu running in a child process on a pseudo-terminal. What it writes is fed to screen, a
+    Screen, as it is read.
+    """
+
+    def __init__(self, argv: List[str], rows: int = 24, cols: int = 80, env: Optional[Dict[str, str]] = None):
+        self.screen = Screen(rows, cols)
+        self.start = time.perf_counter()
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:  # Child, with the pseudo-terminal as stdin, stdout and stderr
+            try:
+                fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+                os.execvpe(argv[0], argv, {**os.environ, "TERM": "xterm", **(env or {})})
+            finally:
+                os._exit(127)
+
+    def __enter__(self) -> "PtyMenu":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(self.pid, 0)
+        os.close(self.fd)
+
+    def wait(
+        self,
+        until: Optional[Callable[[Screen], bool]] = None,
+        start: Optional[float] = None,
+        settle: float = 0.05,
+        timeout: float = 30.0,
+    ) -> Tuple[float, int]:
+        """
+        Reads what the menu writes until until(screen) is true (or until something has been written if
+        until is None), and nothing more is written for settle seconds.
+
+        Returns the time from start (default is now) until the last byte was read, and the number of
+        bytes read. Raises TimeoutError if this takes more than timeout seconds, and FrontendExited if
+        the menu exits.
+        """
+        start = time.perf_counter() if start is None else start
+        deadline = start + timeout
+        nbytes = 0
+        last = start
+        done = False
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"The screen was not as expected within {timeout} s:\n{self.screen.text()}")
+            if not select.select([self.fd], [], [], min(settle, remaining) if done else remaining)[0]:
+                if done:
+                    return last - start, nbytes
+                continue
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except OSError:  # Linux raises EIO when the other end of the pseudo-terminal is closed
+                data = b""
+            if not data:
+                raise FrontendExited(self.screen.text())
+            last = time.perf_counter()
+            nbytes += len(data)
+            self.screen.feed(data)
+            done = until is None or until(self.screen)
+
+    def send(self, keys: bytes, until: Optional[Callable[[Screen], bool]] = None, **kwargs) -> Tuple[float, int]:
+        """Writes keys to the menu, then waits as in wait, and returns the time since the keys were written"""
+        start = time.perf_counter()
+        os.write(self.fd, keys)
+        return self.wait(until, start=start, **kwargs)
+
+
+def write_cases(directory: Path, ncases: int) -> str:
+    """Writes a module with ncases cases that do nothing to directory, returns the name of the module"""
+    name = f"cases{ncases}"
+    source = "".join(f"def case_{i}():\n    pass\n\n\n" for i in range(ncases))
+    (directory / f"{name}.py").write_text(source)
+    return name
+
+
+def _summary(values: List[float]) -> Tuple[float, float]:
+    values = sorted(values)
+    return statistics.median(values), values[min(int(len(values) * 0.95), len(values) - 1)]
+
+
+def measure(
+    frontend: str,
+    module: str,
+    directory: Path,
+    keystrokes: int = 20,
+    iterations: int = 10,
+    rows: int = 24,
+    cols: int = 80,
+    settle: float = 0.05,
+) -> dict:
+    """Measurements of the frontend with the cases of module in directory, see the module docstring"""
+    argv = [sys.executable, "-c", MENU, module, frontend]
+    env = {"PYTHONPATH": os.pathsep.join([str(ROOT), str(directory)]), "LINES": str(rows), "COLUMNS": str(cols)}
+    with PtyMenu(argv, rows, cols, env) as menu:
+        startup, startup_bytes = menu.wait(start=menu.start, settle=max(settle, 0.2))
+
+        keystroke_times, keystroke_bytes = [], []
+        for i in range(keystrokes):
+            before = menu.screen.snapshot()
+            # Typing the first case and erasing it again, such that the input is empty when done
+            elapsed, nbytes = menu.send(
+                b"1" if i % 2 == 0 else b"\x7f", lambda screen: screen.snapshot() != before, settle=settle
+            )
+            keystroke_times.append(elapsed)
+            keystroke_bytes.append(nbytes)
+        if keystrokes % 2:
+            menu.send(b"\x7f", settle=settle)
+
+        # The screen after running a case, which every following iteration ends with
+        menu.send(b"1\n", settle=max(settle, 0.2))
+        frame = menu.screen.snapshot()
+        iteration_times, iteration_bytes = [], []
+        for _ in range(iterations):
+            elapsed, nbytes = menu.send(b"1\n", lambda screen: screen.snapshot() == frame, settle=settle)
+            iteration_times.append(elapsed)
+            iteration_bytes.append(nbytes)
+
+    keystroke_ms, keystroke_p95_ms = _summary([t * 1000 for t in keystroke_times])
+    iteration_ms, iteration_p95_ms = _summary([t * 1000 for t in iteration_times])
+    return {
+        "startup_ms": round(startup * 1000, 3),
+        "startup_bytes": startup_bytes,
+        "keystroke_ms": round(keystroke_ms, 3),
+        "keystroke_p95_ms": round(keystroke_p95_ms, 3),
+        "keystroke_bytes": statistics.median(keystroke_bytes),
+        "iteration_ms": round(iteration_ms, 3),
+        "iteration_p95_ms": round(iteration_p95_ms, 3),
+        "iteration_bytes": statistics.median(iteration_bytes),
+    }
+
+
+def run(frontends: List[str], cases: List[int], **kwargs) -> Dict[str, dict]:
+    """Measurements of every frontend with every number of cases, keyed by frontend/cases"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+        for ncases in cases:
+            module = write_cases(directory, ncases)
+            for frontend in frontends:
+                try:
+                    results[f"{frontend}/{ncases}"] = measure(frontend, module, directory, **kwargs)
+                except (FrontendExited, TimeoutError) as e:
+                    lines = str(e).strip().splitlines()
+                    results[f"{frontend}/{ncases}"] = {"error": f"{type(e).__name__}: {lines[-1] if lines else ''}"}
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, floor_ms: float) -> List[str]:
+    """
+    Measurements that are more than tolerance times the baseline. Times within floor_ms of the baseline
+    are not counted, to leave out noise.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if "error" in result and "error" not in base:
+            regressions.append(f"{key}: {result['error']}")
+            continue
+        for name in COMPARED:
+            if name not in result or name not in base:
+                continue
+            value = result[name]
+            slack = floor_ms if name.endswith("_ms") else 0
+            if value > base[name] * tolerance and value - base[name] > slack:
+                regressions.append(f"{key}: {name} {value:.1f} (baseline {base[name]:.1f})")
+    return regressions
+
+
+def report(results: Dict[str, dict], baseline: Dict[str, dict]):
+    columns = ["startup_ms", "keystroke_ms", "keystroke_p95_ms", "keystroke_bytes", "iteration_ms", "iteration_bytes"]
+    print(f"{'':<14}" + "".join(f"{column:>18}" for column in columns))
+    for key, result in results.items():
+        if "error" in result:
+            print(f"{key:<14}  {result['error']}")
+            continue
+        cells = []
+        for column in columns:
+            cell = f"{result[column]:.1f}"
+            if column in baseline.get(key, {}):
+                cell += f" ({result[column] / max(baseline[key][column], 1e-9):.2f}x)"
+            cells.append(f"{cell:>18}")
+        print(f"{key:<14}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frontends", nargs="+", default=["simple", "fancy"], choices=["simple", "fancy"])
+    parser.add_argument("--cases", nargs="+", type=int, default=[10, 1000, 10000], help="Sizes of menus")
+    parser.add_argument("-k", "--keystrokes", type=int, default=20, help="Number of keystrokes per menu")
+    parser.add_argument("-n", "--iterations", type=int, default=10, help="Number of menu iterations per menu")
+    parser.add_argument("--settle", type=float, default=0.05, help="Seconds without output for the screen to be done")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed ratio to the baseline")
+    parser.add_argument("--floor", type=float, default=2.0, help="Allowed slowdown in ms regardless of tolerance")
+    args = parser.parse_args()
+
+    results = run(
+        args.frontends, args.cases, keystrokes=args.keystrokes, iterations=args.iterations, settle=args.settle
+    )
+    if args.save_baseline:
+        data = {"python": platform.python_version(), "platform": platform.platform(), "results": results}
+        args.baseline.write_text(json.dumps(data, indent=2) + "\n")
+        report(results, {})
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    baseline = json.loads(args.baseline.read_text())["results"] if args.baseline.exists() else {}
+    report(results, baseline)
+    regressions = compare(results, baseline, args.tolerance, args.floor)
+    if regressions:
+        print("Slower than the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
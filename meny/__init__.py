@@ -1,7 +1,12 @@
 from .menu import cng as config
 from . import menu as _menu
-from .decorators import title, ignore
-from .utils import clear_screen, input_splitter, set_default_frontend, set_default_once
+from .decorators import title, ignore, timeout, stream
+from .cancellation import cancellation_token
+from .metrics import enable_metrics, disable_metrics
+from .tracing import enable_tracing, disable_tracing
+from .sinks import enable_result_sink, disable_result_sink
+from .recording import enable_recording, disable_recording, replay
+from .utils import clear_screen, input_splitter, set_default_frontend, set_default_once, get_package_cases
 from .menu import menu, build_menu, Menu
 from .casehandlers import _TreeHandler, _handle_casefunc
-from .exceptions import MenuQuit, MenuError
+from .exceptions import MenuQuit, MenuError, CaseCancelled
@@ -0,0 +1,217 @@
+"""
+Batch ("map") mode: runs a case once for every row of an argument source, e.g.
+
+    map 3 customers.csv
+    map 3 customers.jsonl 16
+
+Sources are CSV files (rows are argument strings, converted like input given in the menu, and a
+header row with the parameter names is skipped), JSON lines files (a line is a list of positional
+arguments, an object of keyword arguments or a single argument) or, if no source is given, the
+iterable of rows given programmatically for the case in case_args. Rows are read lazily and run on
+a thread pool, and in the worker processes if the menu uses the fork executor. The result of every
+row is written to the result sink as soon as it is done, and the progress is shown while running.
+"""
+
+import csv
+import json
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from inspect import getfullargspec, unwrap
+from pathlib import Path
+from time import perf_counter
+from types import FunctionType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Sized, Tuple
+
+import meny
+from meny import config as cng
+from meny import sinks as _sinks
+from meny.cancellation import INTERRUPT_MESSAGE, interruptible
+from meny.exceptions import CaseCancelled, MenuError
+from meny.funcmap import _get_case_name
+
+MAP = "map"
+
+
+class BatchResults(list):
+    """Return values of the rows of a batch in row order, rows that failed have their exception as value"""
+
+    @property
+    def errors(self) -> Dict[int, BaseException]:
+        return {row: value for row, value in enumerate(self) if isinstance(value, BaseException)}
+
+
+def _count_lines(path: Path) -> int:
+    count = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+def _csv_rows(path: Path, params: List[str]) -> Iterator[List[str]]:
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for i, row in enumerate(csv.reader(f)):
+            if row and not (i == 0 and row == params):
+                yield row
+
+
+def _jsonl_rows(path: Path) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def _python_row(row: Any) -> Tuple[list, dict]:
+    if isinstance(row, dict):
+        return [], row
+    if isinstance(row, (list, tuple)):
+        return list(row), {}
+    return [row], {}
+
+
+class Batch:
+    """
+    Rows of a batch, given as the argument to the case in the case handler. convert turns a row into
+    positional and keyword arguments.
+    """
+
+    def __init__(self, rows: Iterable, convert: Callable[[Any], Tuple[list, dict]], total: Optional[int] = None):
+        self.rows = rows
+        self.convert = convert
+        self.total = total
+        self.concurrency: Optional[int] = None  # Max number of rows that run at a time
+
+    def __repr__(self) -> str:
+        return f"<batch of {self.total if self.total is not None else 'unknown number of'} rows>"
+
+    @classmethod
+    def from_source(cls, casefunc: FunctionType, source: Optional[str], menu: "meny.Menu") -> "Batch":
+        """Raises MenuError if the source is not supported"""
+        if source is None:
+            rows = (menu.case_args or {}).get(casefunc)
+            if rows is None:
+                raise MenuError("Give a CSV or JSON lines file to map over, or give the rows in case_args")
+            return cls(rows, _python_row, len(rows) if isinstance(rows, Sized) else None)
+
+        path = Path(source.strip("\"'"))
+        if not path.is_file():
+            raise MenuError(f"Could not find file {path}")
+        if path.suffix == ".csv":
+            # Import here to fix circular imports
+            from meny.casehandlers import _handle_args
+
+            params = getfullargspec(unwrap(casefunc)).args
+            return cls(_csv_rows(path, params), lambda row: (_handle_args(casefunc, row), {}), _count_lines(path))
+        if path.suffix in (".jsonl", ".ndjson"):
+            return cls(_jsonl_rows(path), lambda line: _python_row(json.loads(line)), _count_lines(path))
+        raise MenuError(f"Unsupported file {path}, supported files are .csv, .jsonl and .ndjson")
+
+
+class Progress:
+    """Shows number of rows done, throughput and ETA on a single line"""
+
+    def __init__(self, total: Optional[int], stream=None):
+        self.total = total
+        self.stream = stream or sys.stdout
+        self.done = 0
+        self.errors = 0
+        self.start = perf_counter()
+        self._shown = 0.0
+
+    def line(self) -> str:
+        elapsed = perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"{self.done}"
+        if self.total is not None:
+            line += f"/{self.total} rows ({100 * self.done / max(self.total, 1):.0f}%)"
+        else:
+            line += " rows"
+        line += f", {self.errors} errors, {rate:.1f} rows/s"
+        if self.total is not None and rate > 0:
+            line += f", ETA {max(self.total - self.done, 0) / rate:.0f}s"
+        return line
+
+    def show(self, force: bool = False):
+        now = perf_counter()
+        if force or now - self._shown >= cng.MAP_PROGRESS_INTERVAL:
+            self._shown = now
+            self.stream.write("\r\x1b[2K" + self.line())
+            self.stream.flush()
+
+    def finish(self):
+        self.show(force=True)
+        self.stream.write(f" in {perf_counter() - self.start:.1f}s\n")
+        self.stream.flush()
+
+
+def run_batch(casefunc: FunctionType, batch: Batch, menu: "meny.Menu") -> BatchResults:
+    """
+    Runs casefunc for every row of batch, with at most batch.concurrency calls at a time (default is
+    meny.config.MAP_CONCURRENCY, else the size of the worker pool, else 8). Raises CaseCancelled if
+    interrupted with Ctrl-C, in which case rows that have not started are not run.
+    """
+    # Import here to fix circular imports
+    from meny.casehandlers import _call_casefunc
+
+    worker_pool = getattr(menu, "worker_pool", None)
+    concurrency = batch.concurrency
+    if concurrency is None:
+        concurrency = cng.MAP_CONCURRENCY or (worker_pool.size if worker_pool is not None else 8)
+    sink = _sinks._sink
+    title = getattr(menu, "title", "").strip()
+    name = _get_case_name(casefunc)
+    lock = threading.Lock()
+    results: Dict[int, Any] = {}
+    progress = Progress(batch.total)
+
+    def call(i: int, row: Any):
+        try:
+            args, kwargs = batch.convert(row)
+            value = _call_casefunc(casefunc, args, kwargs, menu)
+        except Exception as e:  # Errors of single rows should not stop the batch
+            value = e
+            record = {"row": i, "error": f"{type(e).__name__}: {e}"}
+        else:
+            record = {"row": i, "value": value}
+        if sink is not None:
+            sink.emit(title, name, record)
+        with lock:
+            results[i] = value
+            progress.done += 1
+            progress.errors += isinstance(value, Exception)
+
+    rows = enumerate(batch.rows)
+    pending: Set[Future] = set()
+    exhausted = False
+    pool = ThreadPoolExecutor(concurrency)
+    interrupted = False
+    with interruptible():
+        try:
+            while True:
+                # Keep a bounded number of rows in flight, such that rows are read lazily
+                while not exhausted and len(pending) < 2 * concurrency:
+                    try:
+                        i, row = next(rows)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(pool.submit(call, i, row))
+                if not pending:
+                    break
+                _, pending = wait(pending, timeout=cng.MAP_PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                progress.show()
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            interrupted = True
+        finally:
+            # After Ctrl-C, rows that are running are left to finish on their own, like cancelled cases
+            pool.shutdown(wait=not interrupted)
+    if interrupted:
+        progress.finish()
+        raise CaseCancelled(INTERRUPT_MESSAGE)
+    progress.total = progress.done  # The number of lines of a file is only an estimate of the number of rows
+    progress.finish()
+    return BatchResults(results[i] for i in sorted(results))
@@ -0,0 +1,259 @@
+"""
+Timeouts and cancellation of cases.
+
+A case with a timeout runs in a separate thread, such that the menu can stop waiting for it when
+the deadline passes or when Ctrl-C is pressed. Threads cannot be killed, so the case is given a
+cancellation token that it can check to stop cooperatively, see cancellation_token(). Cases that
+run in worker processes (the fork executor) are killed instead.
+
+A case that opens a nested menu is held while the nested menu runs, see nested_menu(): its clock is
+stopped and it is not cancelled, such that no thread is left behind reading input.
+"""
+
+import contextvars
+import queue
+import signal
+import threading
+import weakref
+from contextlib import contextmanager
+from time import monotonic
+from typing import Any, Callable, Optional, Tuple
+
+from meny import config as cng
+from meny.exceptions import CaseCancelled
+
+
+class CancelToken:
+    """Tells a running case whether it has been cancelled"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.held = False  # Whether a nested menu of the case is running, see nested_menu()
+
+    def cancel(self, reason: str) -> bool:
+        """Cancels the case unless it is held, returns whether it was cancelled"""
+        with self._lock:
+            if self.held:
+                return False
+            self.reason = reason
+            self._event.set()
+            return True
+
+    def hold(self):
+        """Keeps the case from being cancelled until release(), raises CaseCancelled if it already has been"""
+        with self._lock:
+            self.raise_if_cancelled()
+            self.held = True
+
+    def release(self):
+        self.held = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """Raises CaseCancelled if the case has been cancelled"""
+        if self._event.is_set():
+            raise CaseCancelled(self.reason)
+
+    def wait(self, seconds: float) -> bool:
+        """Like time.sleep, but returns early (with True) if the case is cancelled"""
+        return self._event.wait(seconds)
+
+
+_token: "contextvars.ContextVar[Optional[CancelToken]]" = contextvars.ContextVar("meny_cancel_token", default=None)
+
+
+def cancellation_token() -> CancelToken:
+    """
+    Get the cancellation token of the running case. Cases that run without a timeout get a token
+    that is never cancelled.
+    """
+    token = _token.get()
+    if token is None:
+        token = CancelToken()
+        _token.set(token)
+    return token
+
+
+def timeout_message(seconds: float) -> str:
+    return f"Timed out after {seconds:g} seconds"
+
+
+INTERRUPT_MESSAGE = "Interrupted by user"
+
+# The SIGINT handler that the outermost interruptible() replaced, which nested menus restore
+_outer_sigint: "contextvars.ContextVar[Any]" = contextvars.ContextVar("meny_outer_sigint", default=None)
+
+
+@contextmanager
+def interruptible():
+    """
+    Makes Ctrl-C raise KeyboardInterrupt in the main thread, also when the SIGINT handler has been
+    replaced (the meny CLI ignores SIGINT)
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    previous = signal.signal(signal.SIGINT, signal.default_int_handler)
+    reset = _outer_sigint.set(previous) if _outer_sigint.get() is None else None
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+        if reset is not None:
+            _outer_sigint.reset(reset)
+
+
+@contextmanager
+def nested_menu():
+    """
+    For a menu that runs inside a case: holds the case (see CancelToken.hold) while the menu runs, and
+    restores the SIGINT handler from outside the case, such that Ctrl-C is handled by the on_kbinterrupt
+    of the menus as it was before the case. If the menu raises, the case stays held, such that
+    _call_casefunc lets a KeyboardInterrupt from the menu through instead of cancelling the case.
+    """
+    token = _token.get()
+    if token is not None:
+        token.hold()
+    outer = _outer_sigint.get()
+    restore = outer is not None and threading.current_thread() is threading.main_thread()
+    if restore:
+        signal.signal(signal.SIGINT, outer)
+    try:
+        yield
+    finally:
+        if restore:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+    if token is not None:
+        token.release()
+
+
+# Requests to a _CaseThread for the items of the stream its case returned
+_NEXT = "next"
+_CLOSE = "close"
+
+
+class _CaseThread:
+    """
+    Runs a case in a separate thread. If the case returns a stream (an iterator, see meny.streaming), the
+    thread takes its items as well, one at a time when asked for, such that the timeout of the case also
+    applies to taking the items. The clock only runs while waiting for the thread, not while the items are
+    shown, and it is stopped while the case is held by a nested menu, which is not cancelled by Ctrl-C either.
+    """
+
+    def __init__(self, call: Callable[[], Any], timeout: Optional[float]):
+        self.token = CancelToken()
+        self.timeout = timeout
+        self.remaining = timeout
+        self.requests: "queue.Queue[str]" = queue.Queue()
+        self._outcomes: "queue.Queue[Tuple[bool, Any]]" = queue.Queue()
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=lambda: context.run(self._target, call), name="meny-case", daemon=True)
+
+    @staticmethod
+    def _outcome(call: Callable[[], Any]) -> Tuple[bool, Any]:
+        try:
+            return True, call()
+        except BaseException as e:
+            return False, e
+
+    def _target(self, call: Callable[[], Any]):
+        # Import here to fix circular imports
+        from meny.streaming import is_stream
+
+        _token.set(self.token)
+        returned, value = self._outcome(call)
+        self._outcomes.put((returned, value))
+        if not (returned and is_stream(value)):
+            return
+        while self.requests.get() == _NEXT:
+            returned, item = self._outcome(lambda: next(value))
+            self._outcomes.put((returned, item))
+            if not returned:  # StopIteration or exception, the stream is done
+                return
+        close = getattr(value, "close", None)
+        if close is not None:
+            self._outcome(close)
+
+    def wait(self) -> Tuple[bool, Any]:
+        """
+        Waits for the next outcome of the thread: (True, return value or item) or (False, exception). Raises
+        CaseCancelled if the timeout passes or Ctrl-C is pressed first, after which the thread is left to finish
+        on its own.
+        """
+        with interruptible():
+            while True:
+                try:
+                    start = monotonic()
+                    # Wait in small steps since waiting is not interruptible on all platforms
+                    step = cng.CANCEL_POLL_INTERVAL
+                    if self.remaining is not None and not self.token.held:
+                        step = max(0, min(self.remaining, step))
+                    try:
+                        return self._outcomes.get(timeout=step)
+                    except queue.Empty:
+                        pass
+                    finally:
+                        if self.remaining is not None and not self.token.held:
+                            self.remaining -= monotonic() - start
+                    if self.remaining is not None and self.remaining <= 0:
+                        if self.token.cancel(timeout_message(self.timeout)):
+                            break
+                except KeyboardInterrupt:
+                    if self.token.cancel(INTERRUPT_MESSAGE):
+                        break
+
+        # Give the case a chance to stop cooperatively
+        self._thread.join(cng.CANCEL_GRACE_PERIOD)
+        raise CaseCancelled(self.token.reason)
+
+    def run(self) -> Any:
+        # Import here to fix circular imports
+        from meny.streaming import is_stream
+
+        self._thread.start()
+        returned, value = self.wait()
+        if not returned:
+            raise value
+        return _ThreadStream(self) if is_stream(value) else value
+
+
+class _ThreadStream:
+    """Iterator over the items of the stream returned by the case of a _CaseThread, which takes them"""
+
+    def __init__(self, case_thread: _CaseThread):
+        self._case_thread = case_thread
+        self._done = False
+        # Also lets the thread finish if the stream is dropped without being closed
+        self._close = weakref.finalize(self, case_thread.requests.put, _CLOSE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        if self._done:
+            raise StopIteration
+        self._case_thread.requests.put(_NEXT)
+        returned, item = self._case_thread.wait()
+        if not returned:
+            self._done = True
+            raise item
+        return item
+
+    def close(self):
+        self._done = True
+        self._close()
+
+
+def run_with_timeout(call: Callable[[], Any], timeout: Optional[float]) -> Any:
+    """
+    Runs call in a separate thread and waits for it, see _CaseThread. Raises CaseCancelled if the timeout
+    passes or Ctrl-C is pressed before call returns. If call returns a stream, an iterator over its items is
+    returned, which raises CaseCancelled in the same way while waiting for an item.
+    """
+    return _CaseThread(call, timeout).run()
@@ -1,24 +1,61 @@
 from abc import abstractclassmethod, abstractmethod
-from typing import Any, Sequence, List
+from typing import Any, Callable, Optional, Sequence, List, Tuple
 import meny
-from meny.exceptions import MenuError
+from meny import config as cng
+from meny.cancellation import INTERRUPT_MESSAGE, CancelToken, _token, interruptible, run_with_timeout
+from meny.exceptions import CaseCancelled, MenuError
 from ast import literal_eval
 from inspect import getfullargspec, unwrap
 from types import FunctionType
-from meny.infos import _error_info_case
+from meny.infos import _error_info_case, _cancel_info_case
+from meny.funcmap import _get_case_name
+from meny.fileargs import file_arg, is_file_arg
+from meny import metrics as _metrics
+from meny import tracing as _tracing
+from meny import recording as _recording
+from meny import memtrace as _memtrace
+from meny.menylogger import DEBUG, WARNING, getLogger
+from meny import sinks as _sinks
+from meny import streaming as _streaming
+from meny.session import get_session
+from meny.batch import Batch, BatchResults, run_batch
+from contextlib import nullcontext
+from time import perf_counter
 
+# Logs the duration of every case at DEBUG level, see meny.menylogger.set_log_level
+_caselogger = getLogger("meny.cases", WARNING)
 
-def _handle_args(func: FunctionType, args: Sequence[str]) -> List:
+
+class Piped:
+    """
+    Return value of the previous stage of a pipeline (e.g. 3 "q1" | 5), given as the first argument
+    to the next stage as is, that is without being converted like argument strings are
+    """
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __repr__(self) -> str:
+        # Short, since the value can be large
+        return f"<piped {type(self.value).__name__}>"
+
+
+def _handle_args(func: FunctionType, args: Sequence[str], offset: int = 0) -> List:
     """
     Handles list of strings that are the arguments using ast.literal_eval.
 
     E.g. return is [1, "cat", 2.0, False]
                    int  str   float  bool
+
+    Arguments like @path are given as the memory-mapped file at path (see meny.fileargs), except to
+    parameters annotated with str.
+
+    offset: number of leading parameters that are given otherwise, e.g. the piped value of a pipeline
     """
     # Unwrap in case the function is wrapped
     func = unwrap(func)
     argsspec = getfullargspec(func)
-    params = argsspec.args
+    params = argsspec.args[offset:]
 
     if len(args) > len(params):
         raise MenuError(f"Got too many arguments, should be {len(params)}, but got {len(args)}")
@@ -28,8 +65,11 @@ def _handle_args(func: FunctionType, args: Sequence[str]) -> List:
     arg = None
     try:
         for i, (param, arg) in enumerate(zip(params, args)):
-            if argsspec.annotations.get(param, None) == str:
+            annotation = argsspec.annotations.get(param, None)
+            if annotation == str:
                 typed_arglist[i] = arg
+            elif is_file_arg(arg):
+                typed_arglist[i] = file_arg(arg, annotation)
             else:
                 typed_arglist[i] = literal_eval(arg)
     except (ValueError, SyntaxError) as e:
@@ -37,19 +77,83 @@ def _handle_args(func: FunctionType, args: Sequence[str]) -> List:
     return typed_arglist
 
 
+def _get_timeout(casefunc: FunctionType, menu: meny.Menu) -> Optional[float]:
+    """Timeout set by the timeout decorator, else the menu timeout (which does not apply to special cases)"""
+    timeout = getattr(unwrap(casefunc), cng._CASE_TIMEOUT, None)
+    if timeout is None and casefunc not in getattr(menu, "special_cases", {}).values():
+        timeout = getattr(menu, "timeout", None)
+    return timeout
+
+
+def _call_casefunc(casefunc: FunctionType, args: Sequence, kwargs: dict, menu: meny.Menu) -> Any:
+    """
+    Calls casefunc in the menu process, or in a worker process if the menu uses the fork executor.
+
+    Raises CaseCancelled if the case times out or is interrupted by Ctrl-C, also when the SIGINT handler
+    has been replaced (the meny CLI ignores SIGINT), such that Ctrl-C cancels just the case. Nested menus
+    that the case opens handle Ctrl-C themselves, see nested_menu.
+    """
+    timeout = _get_timeout(casefunc, menu)
+    worker_pool = getattr(menu, "worker_pool", None)
+    if worker_pool is not None and casefunc in worker_pool:
+        with interruptible():
+            try:
+                return worker_pool.call(casefunc, args, kwargs, timeout)
+            except KeyboardInterrupt:
+                raise CaseCancelled(INTERRUPT_MESSAGE) from None
+    if timeout is not None:
+        return run_with_timeout(lambda: casefunc(*args, **kwargs), timeout)
+    token = CancelToken()
+    reset = _token.set(token)
+    try:
+        with interruptible():
+            return casefunc(*args, **kwargs)
+    except KeyboardInterrupt:
+        if token.held:  # Raised by a nested menu of the case, see nested_menu
+            raise
+        raise CaseCancelled(INTERRUPT_MESSAGE) from None
+    finally:
+        _token.reset(reset)
+
+
 def _handle_casefunc(casefunc: FunctionType, args: List[str], menu: meny.Menu) -> Any:
+    if args and isinstance(args[0], Batch):
+        return run_batch(casefunc, args[0], menu)
+
     program_args = (menu.case_args or {}).get(casefunc, ())
     program_kwargs = (menu.case_kwargs or {}).get(casefunc, {})
     if program_args or program_kwargs:  # If programmatic arguments
         if args:
             raise MenuError("This function takes arguments progammatically" " and should not be given any arguments")
-        return casefunc(*program_args, **program_kwargs)
+        return _call_casefunc(casefunc, program_args, program_kwargs, menu)
+    elif args and isinstance(args[0], Piped):
+        return _call_casefunc(casefunc, [args[0].value, *_handle_args(casefunc, args[1:], 1)], {}, menu)
     elif args:
         # Raises TypeError if wrong number of arguments
-        return casefunc(*_handle_args(casefunc, args))
+        return _call_casefunc(casefunc, _handle_args(casefunc, args), {}, menu)
     else:
         # Will raise TypeError if casefunc() actually requires arguments
-        return casefunc()
+        return _call_casefunc(casefunc, (), {}, menu)
+
+
+def _log_case(menu: str, case: str, duration: float, error: Optional[BaseException] = None):
+    if not _caselogger.isEnabledFor(DEBUG):
+        return
+    outcome = "ok" if error is None else type(error).__name__
+    _caselogger.debug(
+        f"{case} in {menu} took {duration:.3f} s ({outcome})",
+        extra={"case": case, "menu": menu, "duration": duration},
+    )
+
+
+def _unobserved() -> bool:
+    """Whether nothing records case calls, such that they can be made without the overhead of _observed"""
+    return (
+        _metrics._metrics is None
+        and _tracing._tracer is None
+        and _memtrace._tracker is None
+        and not _caselogger.isEnabledFor(DEBUG)
+    )
 
 
 class _CaseHandler:
@@ -58,12 +162,100 @@ class _CaseHandler:
         # TODO: Should I catch TypeError in the handlers? What if actual TypeError occurs?
         #       Maybe should catch everything and just display it in big red text? Contemplate!
         try:
-            cls.onCall(menu, casefunc, args)
+            if _unobserved():
+                cls.onCall(menu, casefunc, args)
+            else:
+                cls._observed(menu, casefunc, args, lambda: cls.onCall(menu, casefunc, args))
         except (TypeError, MenuError) as e:
+            _recording.fail(e)
             _error_info_case(e, casefunc)
+        except CaseCancelled as e:
+            _recording.fail(e)
+            cls.onCancel(menu, casefunc, e)
+            _cancel_info_case(e, casefunc)
         finally:
             cls.afterCallReturn(menu, casefunc, args)
 
+    @classmethod
+    def pipe(cls, menu: meny.Menu, stages: List[Tuple[FunctionType, List[str]]]) -> None:
+        """
+        Runs the stages of a pipeline. Every stage after the first gets the return value of the
+        previous stage as its first argument. Only the return value of the last stage is recorded, and
+        the pipeline stops at the first stage that fails.
+        """
+        value = None
+        for i, (casefunc, args) in enumerate(stages):
+            if i > 0:
+                args = [Piped(value), *args]
+            if i == len(stages) - 1:
+                cls.__call__(menu, casefunc, args)
+                return
+
+            try:
+                if _unobserved():
+                    value = _handle_casefunc(casefunc, args, menu)
+                else:
+                    value = cls._observed(menu, casefunc, args, lambda: _handle_casefunc(casefunc, args, menu))
+            except (TypeError, MenuError) as e:
+                _recording.fail(e)
+                _error_info_case(e, casefunc)
+                return
+            except CaseCancelled as e:
+                _recording.fail(e)
+                _cancel_info_case(e, casefunc)
+                return
+
+    @classmethod
+    def _observed(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str], call: Callable[[], Any]) -> Any:
+        """
+        Calls call, and records its duration and outcome in metrics, as a tracing span and in the case log,
+        and its memory growth, if they are enabled. Special cases are not recorded.
+        """
+        if casefunc in getattr(menu, "special_cases", {}).values():
+            return call()
+
+        metrics = _metrics._metrics
+        title = getattr(menu, "title", "").strip()
+        name = _get_case_name(casefunc)
+        tracker = _memtrace._tracker
+        with _tracing.span(name, "case", menu=title, args=list(args)), (
+            tracker.measure(name) if tracker is not None else nullcontext()
+        ):
+            start = perf_counter()
+            try:
+                result = call()
+            except BaseException as e:
+                duration = perf_counter() - start
+                if metrics is not None:
+                    metrics.observe(title, name, duration, e)
+                _log_case(title, name, duration, e)
+                raise
+            duration = perf_counter() - start
+            if metrics is not None:
+                metrics.observe(title, name, duration)
+            _log_case(title, name, duration)
+            return result
+
+    @staticmethod
+    def _emit(menu: meny.Menu, casefunc: FunctionType, value: Any):
+        """Write return value of casefunc to the result sink, if there is one"""
+        sink = _sinks._sink
+        if isinstance(value, BatchResults):
+            return  # The rows have already been written as they were done
+        if sink is not None and casefunc not in getattr(menu, "special_cases", {}).values():
+            sink.emit(getattr(menu, "title", "").strip(), _get_case_name(casefunc), value)
+
+    @classmethod
+    def _result(cls, menu: meny.Menu, casefunc: FunctionType, value: Any) -> Any:
+        """
+        What to record as the return value of casefunc. Iterators are consumed as they are streamed (see
+        meny.streaming), other values are written to the result sink
+        """
+        if _streaming.is_stream(value):
+            return _streaming.consume(menu, casefunc, value)
+        cls._emit(menu, casefunc, value)
+        return value
+
     @classmethod
     @abstractmethod
     def onCall(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str]) -> None:
@@ -73,6 +265,14 @@ class _CaseHandler:
             Do whatever else to enforce handler behavior (related to unittests)
         """
 
+    @classmethod
+    @abstractmethod
+    def onCancel(cls, menu: meny.Menu, casefunc: FunctionType, cancelled: CaseCancelled) -> None:
+        """
+        Responsibility:
+            Record that casefunc was cancelled, happens before afterCallReturn
+        """
+
     @classmethod
     @abstractmethod
     def afterCallReturn(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str]) -> None:
@@ -83,31 +283,39 @@ class _CaseHandler:
 
 
 class _TreeHandler(_CaseHandler):
-    _stack: List[dict] = []
-
     @classmethod
     def onCall(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str]):
-        if len(cls._stack) == 0:
-            cls._stack.append({})
-        this_scope = cls._stack[-1]  # Get scope of current cls
+        stack = get_session().stack
+        this_scope = stack[-1]  # Get scope of current menu
         next_scope = this_scope.get(casefunc.__name__, {})  # Create / get next scope
         this_scope[casefunc.__name__] = next_scope  # Insert next scope into old scope
-        cls._stack.append(next_scope)
-        next_scope["return"] = _handle_casefunc(casefunc, args, menu)
+        stack.append(next_scope)
+        next_scope["return"] = cls._result(menu, casefunc, _handle_casefunc(casefunc, args, menu))
+
+    @classmethod
+    def onCancel(cls, menu: meny.Menu, casefunc: FunctionType, cancelled: CaseCancelled):
+        get_session().stack[-1]["return"] = cancelled
+        cls._emit(menu, casefunc, cancelled)
 
     @classmethod
     def afterCallReturn(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str]):
-        cls._stack.pop()
-        type(menu)._return = cls._stack[-1].copy()  # Set current return scope to previous
+        session = get_session()
+        session.stack.pop()
+        session.returns = session.stack[-1].copy()  # Set current return scope to previous
 
 
 class _FlatHandler(_CaseHandler):
-    _return: dict = {}
-
     @classmethod
     def onCall(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str]):
-        cls._return[casefunc.__name__] = _handle_casefunc(casefunc, args, menu)
+        flat = get_session().flat
+        flat[casefunc.__name__] = cls._result(menu, casefunc, _handle_casefunc(casefunc, args, menu))
+
+    @classmethod
+    def onCancel(cls, menu: meny.Menu, casefunc: FunctionType, cancelled: CaseCancelled):
+        get_session().flat[casefunc.__name__] = cancelled
+        cls._emit(menu, casefunc, cancelled)
 
     @classmethod
     def afterCallReturn(cls, menu: meny.Menu, casefunc: FunctionType, args: List[str]):
-        type(menu)._return = cls._return
+        session = get_session()
+        session.returns = session.flat
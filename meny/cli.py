@@ -1,11 +1,20 @@
 import argparse
 import sys
 from pathlib import Path
-from .menu import menu
+from .menu import menu, build_menu
+from .funcmap import resolve_case_key
+from .exceptions import CaseCancelled, MenuError
+from .cancellation import INTERRUPT_MESSAGE, interruptible
+from . import config as cng
+from .metrics import enable_metrics
+from . import menylogger, pager, recording, sinks, steps, streaming, tracing
 from .menylogger import getLogger, INFO
-from .utils import get_module_cases
+from .utils import get_module_cases, set_default_history
+from .dirindex import DirectoryIndex, join
+from .steps import COMMAND
 import importlib.util
 import importlib.machinery
+import inspect
 import traceback
 import pprint
 import string
@@ -14,6 +23,12 @@ import json
 import shutil
 import platform
 import signal
+import atexit
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
 
 logger = getLogger("meny.cli", INFO)
 
@@ -33,12 +48,14 @@ def load_module_from_path(path: Path):
     if spec is None:
         raise ImportError(f"Could not load {path}")
     module = importlib.util.module_from_spec(spec)
-    loader.exec_module(module)
-    sys.path.pop()
+    try:
+        loader.exec_module(module)
+    finally:
+        sys.path.pop()
     return module
 
 
-def menu_from_python_code(filepath: Path, repeat: bool):
+def cases_from_python_code(filepath: Path):
     try:
         module = load_module_from_path(filepath)
     except Exception as e:
@@ -53,7 +70,18 @@ def menu_from_python_code(filepath: Path, repeat: bool):
         logger.info(f"There are no defined functions in \x1b[33m{filepath}\x1b[0m")
         sys.exit(1)
 
-    return menu(cases, f"Functions in {filepath}", once=not repeat, return_mode="flat")
+    return cases
+
+
+def menu_from_python_code(filepath: Path, repeat: bool, memory_trace: bool = False):
+    cases = cases_from_python_code(filepath)
+    return menu(cases, f"Functions in {filepath}", once=not repeat, return_mode="flat", memory_trace=memory_trace)
+
+
+def run_python_case(filepath: Path, case: str, args: List[str]):
+    """Runs a case from a Python file directly, without opening a menu"""
+    cases = cases_from_python_code(filepath)
+    return build_menu(cases, f"Functions in {filepath}", once=True, return_mode="flat").run_case(case, args)
 
 
 class MenyTemplate(string.Template):
@@ -69,68 +97,490 @@ class MenyTemplate(string.Template):
     """  # type: ignore
 
 
-def get_casefunc(command: str, executable: str):
-    parse_template = MenyTemplate(command)
-    arg_components = []
-    signature_components = []
-    for _, named, braced, _ in re.findall(parse_template.pattern, command):
-        if named:
-            arg_components.append(f"{named}={named}")
-            signature_components.append(f"{named}: str")
-            continue
+def _call_command(command: str, executable: Optional[str]) -> int:
+    """Runs command in a shell as a traced span, returns its return code"""
+    with tracing.span(command, "shell") as span:
+        returncode = subprocess.call(command, shell=True, executable=executable)
+        span.set(returncode=returncode)
+        return returncode
+
+
+def get_casefunc(command: str, executable: Optional[str]):
+    """
+    Case function that runs command in a shell, with the parameters of the command template (@name, @{name} or
+    @{name=default}) as its parameters. Returns the function and its signature as text. Raises MenuError if the
+    template has an invalid parameter.
+    """
+    template = MenyTemplate(command)
+
+    def run(args: Dict[str, str]):
+        _call_command(_fill_template(template, args), executable)
+
+    f = _casefunc_with_params(run, _template_params([command]))
+    return f, f"f{inspect.signature(f)}"
+
+
+PARALLEL = "__parallel__"
+MATRIX = "__matrix__"
+CONCURRENCY = "__concurrency__"
+
+
+def _fill_template(template: MenyTemplate, values: Dict[str, str]) -> str:
+    """Substitutes values into template, identifiers without a value are left as is or get their default value"""
+
+    def replace(match: "re.Match") -> str:
+        if match.group("escaped") is not None:
+            return template.delimiter
+        identifier = match.group("named") or match.group("braced")
+        if identifier is None:
+            return match.group()
+        name, _, default = identifier.partition("=")
+        if name in values:
+            return str(values[name])
+        return default if "=" in identifier else match.group()
+
+    return template.pattern.sub(replace, template.template)
+
+
+def _template_params(commands: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Parameters of templated commands, mapped to their default values (None if no default)"""
+    params: Dict[str, Optional[str]] = {}
+    for command in commands:
+        for _, named, braced, _ in MenyTemplate.pattern.findall(command):
+            name, _, default = (named or braced).partition("=")
+            if name and params.get(name) is None:
+                params[name] = default if "=" in braced else None
+    return params
+
+
+class CommandRunner:
+    """
+    Runs shell commands concurrently. The output of the commands is printed line by line as it comes,
+    every line prefixed with the name of its command, padded to width.
+    """
+
+    def __init__(self, executable: Optional[str], width: int = 0):
+        self.executable = executable
+        self.width = width
+        self._lock = threading.Lock()
+        self._running: Set[subprocess.Popen] = set()
+
+    def run(self, name: str, command: str) -> int:
+        """Runs command and returns its return code"""
+        with tracing.span(command, "shell") as span:
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                executable=self.executable,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+            )
+            with self._lock:
+                self._running.add(process)
+            for line in process.stdout:
+                self.show(name, line.rstrip("\n"))
+            returncode = process.wait()
+            span.set(returncode=returncode)
+        with self._lock:
+            self._running.discard(process)
+        if returncode != 0:
+            self.show(name, f"\x1b[31mExited with return code {returncode}\x1b[0m")
+        return returncode
+
+    def show(self, name: str, line: str):
+        """Prints line prefixed with name"""
+        with self._lock:
+            print(f"[{name:<{self.width}}] {line}", flush=True)
+
+    def terminate(self):
+        """Terminates the commands that are running"""
+        with self._lock:
+            for process in self._running:
+                process.terminate()
+
+
+def run_commands(commands: Dict[str, str], executable: Optional[str], concurrency: int) -> Dict[str, int]:
+    """
+    Runs shell commands with CommandRunner, at most concurrency at a time. Returns the return code of
+    every command.
+    """
+    runner = CommandRunner(executable, max(map(len, commands), default=0))
+    with ThreadPoolExecutor(max(concurrency, 1)) as pool, interruptible():
+        futures = {name: pool.submit(runner.run, name, command) for name, command in commands.items()}
+        try:
+            return {name: future.result() for name, future in futures.items()}
+        except KeyboardInterrupt:
+            for future in futures.values():
+                future.cancel()
+            runner.terminate()
+            raise CaseCancelled(INTERRUPT_MESSAGE) from None
+
+
+def _short_name(command: str, length: int = 24) -> str:
+    return command if len(command) <= length else command[: length - 3] + "..."
+
+
+def get_group_casefunc(spec: dict, executable: Optional[str]):
+    """
+    Case function of a group of commands in a JSON spec, which is either
+
+        {"__parallel__": {"name": "command", ...}}  (or a list of commands)
+        {"__matrix__": {"param": ["value", ...], ...}, "__command__": "command with @param"}
+
+    A matrix runs the command for every combination of the values of its parameters. The commands
+    run concurrently, at most "__concurrency__" at a time (default is meny.config.JSON_CONCURRENCY).
+    Parameters of the commands that are not in a matrix are arguments to the case function.
+    Raises MenuError if the spec is malformed.
+    """
+    concurrency = spec.get(CONCURRENCY, cng.JSON_CONCURRENCY)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        raise MenuError(f"{CONCURRENCY} must be a positive integer, got {concurrency!r}")
+
+    if PARALLEL in spec:
+        group = spec[PARALLEL]
+        if isinstance(group, list):
+            group = {_short_name(command): command for command in group}
+        if not isinstance(group, dict) or not all(isinstance(command, str) for command in group.values()):
+            raise MenuError(f"{PARALLEL} must be a list of commands or an object of named commands")
+        templates = {name: MenyTemplate(command) for name, command in group.items()}
+        params = _template_params(group.values())
+        combinations: List[Dict[str, str]] = [{}]
+    else:
+        matrix, command = spec[MATRIX], spec.get(COMMAND)
+        if not isinstance(command, str):
+            raise MenuError(f"{MATRIX} must be given along with a {COMMAND} to run for every combination")
+        if not (isinstance(matrix, dict) and all(isinstance(values, list) and values for values in matrix.values())):
+            raise MenuError(f"{MATRIX} must be an object of parameters mapped to non-empty lists of values")
+        templates = {"": MenyTemplate(command)}
+        params = {name: default for name, default in _template_params([command]).items() if name not in matrix}
+        combinations = [dict(zip(matrix, values)) for values in product(*matrix.values())]
+
+    def run(args: Dict[str, str]) -> Dict[str, int]:
+        commands = {}
+        for combination in combinations:
+            combination_name = " ".join(f"{param}={value}" for param, value in combination.items())
+            for name, template in templates.items():
+                commands[name or combination_name] = _fill_template(template, {**args, **combination})
+        return run_commands(commands, executable, concurrency)
+
+    return _casefunc_with_params(run, params)
+
+
+def _casefunc_with_params(run: Callable[[Dict[str, str]], Any], params: Dict[str, Optional[str]]):
+    """
+    Function with params (mapped to default values, None if no default) as str parameters, which gives its
+    arguments to run as a dict. Parameters without a default come first, as they must. Raises MenuError if a
+    parameter is not a valid name.
+    """
+    try:
+        signature = inspect.Signature(
+            [
+                inspect.Parameter(
+                    name,
+                    inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                    default=inspect.Parameter.empty if default is None else default,
+                    annotation=str,
+                )
+                for name, default in sorted(params.items(), key=lambda param: param[1] is not None)
+            ]
+        )
+    except ValueError as e:
+        raise MenuError(f"Invalid parameter in command template: {e}") from e
 
-        if not braced:
-            continue
+    def f(*args, **kwargs):
+        # Raises TypeError for wrong arguments, like any other case function
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return run(dict(arguments.arguments))
 
-        if "=" in braced:
-            braced, default = braced.split("=")
-            signature_components.append(f"{braced}: str='{default}'")
-        else:
-            signature_components.append(f"{braced}: str")
+    f.__signature__ = signature
+    return f
+
+
+def get_step_casefunc(spec: dict, target: str, menutitle: str, executable: Optional[str]):
+    """
+    Case function of an entry of a JSON spec that runs the steps it needs first, see meny.steps.
+    Parameters of the commands of all the steps are arguments to the case function. Raises MenuError
+    if a needed step does not exist or if the steps need each other in a cycle.
+    """
+    graph_steps = steps.parse_steps({title: entry for title, entry in spec.items() if not _is_group(entry)})
+    order = steps.graph(graph_steps, target)
+    params = _template_params(graph_steps[name].command for name in order)
 
-        arg_components.append(f"{braced}={braced}")
+    def run(args: Dict[str, str]) -> Dict[str, Union[int, str]]:
+        runner = CommandRunner(executable, max(map(len, order)))
 
-    signature_components = list(dict.fromkeys(signature_components))
-    arg_components = list(dict.fromkeys(arg_components))
-    signature = ", ".join(signature_components)
-    args = ", ".join(arg_components)
+        def fill(text: str) -> str:
+            return _fill_template(MenyTemplate(text), args)
 
-    # Remove default argument from command string
-    if executable is not None:
-        executable = f"'{executable}'"
+        return steps.run_steps(graph_steps, target, runner, fill, key_prefix=f"{menutitle}/")
 
-    ns = {}
-    txt = f"def f({signature}): subprocess.call(template.safe_substitute({args}), shell=True, executable={executable})"
-    exec(txt, {**globals(), **locals()}, ns)
+    return _casefunc_with_params(run, params)
 
-    return ns["f"], txt
 
+def _is_group(entry) -> bool:
+    return isinstance(entry, dict) and (PARALLEL in entry or MATRIX in entry)
 
-def menu_from_json(filepath: Path, repeat: bool, executable: str):
+
+def _is_command(entry) -> bool:
+    """True if entry of JSON spec is a case, rather than a nested menu or a directive"""
+    return isinstance(entry, str) or _is_group(entry) or steps.is_step(entry)
+
+
+def _entry_casefunc(spec: dict, title: str, menutitle: str, executable: Optional[str]):
+    """Case function of an entry of a JSON spec that is a command, a group of commands or a step"""
+    entry = spec[title]
+    if isinstance(entry, str):
+        return get_casefunc(entry, executable)[0]
+    if _is_group(entry):
+        return get_group_casefunc(entry, executable)
+    return get_step_casefunc(spec, title, menutitle, executable)
+
+
+def load_json_spec(filepath: Path) -> dict:
     with open(filepath, "r") as f:
         try:
-            spec = json.load(f)
+            return json.load(f)
         except Exception as e:
             logger.error(f"Error when parsing {filepath}: {e}")
             sys.exit()
 
-    def _menu_from_json(spec: dict, menutitle: str):
-        once = not repeat or spec.get("__repeat__", False)
-        cases = {}
-        for title, command_or_dict in spec.items():
-            if isinstance(command_or_dict, str):
-                cases[title] = get_casefunc(command_or_dict, executable)[0]
-            if isinstance(command_or_dict, dict):
-                cases[title] = _menu_from_json(command_or_dict, menutitle=title)
-        return lambda: menu(cases, title=menutitle, once=once)
 
-    return _menu_from_json(spec, filepath.name)()
+def json_menu(spec: dict, menutitle: str, repeat: bool, executable: str, memory_trace: bool = False):
+    """Returns function that opens the menu of a (nested) JSON spec"""
+    once = not repeat or spec.get("__repeat__", False)
+    cases = {}
+    for title, command_or_dict in spec.items():
+        if _is_command(command_or_dict):
+            cases[title] = _entry_casefunc(spec, title, menutitle, executable)
+        elif isinstance(command_or_dict, dict):
+            cases[title] = json_menu(command_or_dict, title, repeat, executable, memory_trace)
+    return lambda: menu(cases, title=menutitle, once=once, memory_trace=memory_trace)
+
+
+def menu_from_json(filepath: Path, repeat: bool, executable: str, memory_trace: bool = False):
+    spec = load_json_spec(filepath)
+    try:
+        open_menu = json_menu(spec, filepath.name, repeat, executable, memory_trace)
+    except MenuError as e:
+        logger.error(f"Error in {filepath}: {e}")
+        sys.exit(1)
+    return open_menu()
+
+
+def run_json_case(filepath: Path, case: str, args: List[str], executable: str):
+    """
+    Runs a command from a JSON file directly, without opening a menu. If case refers to a nested
+    menu, then the first of args selects the case in the nested menu, and so on. Only the selected
+    command is turned into a case function.
+    """
+    spec = load_json_spec(filepath)
+    menutitle = filepath.name
+    args = list(args)
+    while True:
+        entries = {title: entry for title, entry in spec.items() if isinstance(entry, (str, dict))}
+        entrymap = {str(i): (title, entry) for i, (title, entry) in enumerate(entries.items(), start=1)}
+        key = resolve_case_key(entrymap, case)
+        if key is None:
+            raise MenuError(f"Could not find case {case!r}, available cases are: {list(entries)}")
+
+        title, entry = entrymap[key]
+        if _is_command(entry):
+            casefunc = _entry_casefunc(spec, title, menutitle, executable)
+            return build_menu([casefunc], once=True).run_case("1", args)
+
+        if not args:
+            raise MenuError(f"{title!r} is a nested menu, please specify one of its cases")
+        spec, menutitle = entry, title
+        case = args.pop(0)
+
+
+def _file_case(filepath: Path, repeat: bool, executable: str, memory_trace: bool = False):
+    """Case that opens the menu of a Python or JSON file in a directory menu"""
+
+    def f():
+        if filepath.suffix == ".json":
+            try:
+                spec = json.loads(filepath.read_text())
+            except (OSError, ValueError) as e:
+                raise MenuError(f"Could not parse {filepath}: {e}") from e
+            return json_menu(spec, filepath.name, repeat, executable, memory_trace)()
+
+        try:
+            module = load_module_from_path(filepath)
+        except Exception as e:
+            raise MenuError(f"Could not import {filepath}: {e!r}") from e
+        cases = get_module_cases(module)
+        if len(cases) == 0:
+            raise MenuError(f"There are no defined functions in {filepath}")
+        return menu(
+            cases, f"Functions in {filepath.name}", once=not repeat, return_mode="flat", memory_trace=memory_trace
+        )
+
+    f.__name__ = filepath.name
+    return f
+
+
+def _directory_case(index: DirectoryIndex, relpath: str, repeat: bool, executable: str, memory_trace: bool = False):
+    """Case that opens the menu of a subdirectory in a directory menu"""
+
+    def f():
+        cases = directory_cases(index, relpath, repeat, executable, memory_trace)
+        return menu(cases, f"Files in {relpath}", once=not repeat, memory_trace=memory_trace)
+
+    f.__name__ = relpath.rsplit("/", 1)[-1]
+    return f
+
+
+def directory_cases(
+    index: DirectoryIndex, relpath: str, repeat: bool, executable: str, memory_trace: bool = False
+) -> dict:
+    """
+    Cases of the directory at relpath: a submenu for every subdirectory that contains Python or JSON
+    files, then a submenu for every Python or JSON file. Files are not read before they are opened.
+    """
+    dirs, files = index.entries(relpath)
+    index.save()
+    cases = {}
+    for name in dirs:
+        cases[name + "/"] = _directory_case(index, join(relpath, name), repeat, executable, memory_trace)
+    for name in files:
+        cases[name] = _file_case(index.root / relpath / name, repeat, executable, memory_trace)
+    return cases
+
+
+def menu_from_directory(dirpath: Path, repeat: bool, executable: str, memory_trace: bool = False):
+    cases = directory_cases(DirectoryIndex(dirpath), "", repeat, executable, memory_trace)
+    if len(cases) == 0:
+        logger.info(f"There are no Python or JSON files in \x1b[33m{dirpath}\x1b[0m")
+        sys.exit(1)
+    return menu(cases, f"Files in {dirpath}", once=not repeat, memory_trace=memory_trace)
+
+
+def run_directory_case(dirpath: Path, case: str, args: List[str], executable: str):
+    """
+    Runs a case from a file in a directory tree directly, without opening a menu. case selects a
+    subdirectory or file in dirpath, and the following args select subdirectories and files until a
+    file is reached. The rest of args are given to run_python_case or run_json_case.
+    """
+    index = DirectoryIndex(dirpath)
+    relpath = ""
+    args = list(args)
+    while True:
+        dirs, files = index.entries(relpath)
+        names = dirs + files
+        entrymap = {str(i): (name, name) for i, name in enumerate(names, start=1)}
+        key = resolve_case_key(entrymap, case.rstrip("/"))
+        if key is None:
+            raise MenuError(f"Could not find {case!r} in {dirpath / relpath}, available entries are: {names}")
+        if not args:
+            raise MenuError(f"{entrymap[key][0]!r} is a menu, please specify one of its cases")
+
+        name = entrymap[key][0]
+        relpath = join(relpath, name)
+        case = args.pop(0)
+        if name in files:
+            index.save()
+            if name.endswith(".json"):
+                return run_json_case(index.root / relpath, case, args, executable)
+            return run_python_case(index.root / relpath, case, args)
+
+
+def print_value(value: Any):
+    """Pretty prints value, in the pager if it does not fit on the screen"""
+    pager.page(pager.pformat_lines(value), "Return values", fallback=lambda: pprint.pprint(value))
+
+
+def run_case_directly(filepath: Path, args: argparse.Namespace, executable: str):
+    """
+    Fast path for non interactive use: resolves a single case, runs it and prints its return
+    value as JSON (or writes it to the result sink), an item per line if it is an iterator. No frontend is
+    imported or rendered.
+    """
+    caseargs = list(args.args)
+    case = args.case if args.case is not None else caseargs.pop(0)
+    try:
+        if filepath.is_dir():
+            result = run_directory_case(filepath, case, caseargs, executable)
+        elif filepath.suffix == ".json":
+            result = run_json_case(filepath, case, caseargs, executable)
+        else:
+            result = run_python_case(filepath, case, caseargs)
+    except (MenuError, TypeError, CaseCancelled) as e:
+        logger.error(str(e))
+        sys.exit(2)
+
+    sink = sinks.get_result_sink()
+    # Iterators (e.g. of generator cases) are written an item at a time, as a JSON line or record per item
+    items = result if streaming.is_stream(result) else [result]
+    for item in items:
+        if sink is None:
+            print(json.dumps(item, default=repr), flush=True)
+        else:
+            sink.emit(filepath.name, case, item)
+    if sink is not None:
+        sinks.disable_result_sink()
+    sys.exit(0)
+
+
+def replay_session(filepath: Path, args: argparse.Namespace, executable: str):
+    """
+    Replays the recording given with --replay on the menu of filepath, then prints how long every input
+    took compared with the recording. Exits with 1 if the menus were not the same as when recording, or
+    if an input took more than --max-slowdown times as long as when recording.
+    """
+    try:
+        with recording.replay(args.replay, args.replay_pace) as replayer:
+            if filepath.is_dir():
+                menu_from_directory(filepath, args.repeat, executable)
+            elif filepath.suffix == ".json":
+                menu_from_json(filepath, args.repeat, executable)
+            else:
+                menu_from_python_code(filepath, args.repeat)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Could not replay {args.replay}: {e!r}")
+        sys.exit(2)
+
+    replayer.print_report()
+    if replayer.diverged is not None:
+        sys.exit(1)
+    if args.max_slowdown is not None:
+        slower = replayer.slower(args.max_slowdown)
+        if slower:
+            steps_ = ", ".join(str(row["step"]) for row in slower)
+            logger.error(f"Inputs took more than {args.max_slowdown} times as long as when recorded (steps {steps_})")
+            sys.exit(1)
+    sys.exit(0)
 
 
 def cli():
-    parser = argparse.ArgumentParser(prog="meny", description="Start a meny on a specified Python file or JSON")
+    parser = argparse.ArgumentParser(
+        prog="meny", description="Start a meny on a specified Python file, JSON or directory"
+    )
 
-    parser.add_argument("file", type=str, nargs=1, help="A python or json file to start a menu on")
+    parser.add_argument(
+        "file",
+        type=str,
+        nargs=1,
+        help="A python or json file to start a menu on, or a directory to get a menu of the python and json "
+        "files in the directory tree",
+    )
+    parser.add_argument(
+        "args",
+        type=str,
+        nargs="*",
+        help="Run a case directly instead of opening a menu. The first argument selects the case (like in the "
+        "menu), the rest are the arguments to the case. The return value is printed as JSON",
+    )
+    parser.add_argument(
+        "-c",
+        "--case",
+        help="Run the case with the given key or name directly instead of opening a menu. "
+        "Arguments to the case can be given after '--', e.g. meny file.py --case name -- 1 2",
+    )
     parser.add_argument(
         "-r",
         "--repeat",
@@ -148,7 +598,98 @@ def cli():
         "Python chooses (usually 'sh' and 'cmd' for Unix and Windows respectively)",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Write metrics of case calls (counts, errors and latency histograms) to PATH in the Prometheus "
+        "text format. The file is rewritten atomically after every case call",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        metavar="PATH",
+        help="Append a JSON line with case, duration and error to PATH for every case call",
+    )
+
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write spans of menus, cases and shell commands to PATH in the Chrome trace event format, "
+        "which can be opened in chrome://tracing or https://ui.perfetto.dev",
+    )
+
+    parser.add_argument(
+        "--memtrace",
+        help="Track memory growth per case with tracemalloc, and enable the 'm' special case that shows the "
+        "allocation sites that have grown the most since the menu started",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--output-format",
+        choices=tuple(sinks.SINKS),
+        help="Write the return value of every case as soon as it returns, in the given format, instead of "
+        "printing the return values when the menu exits. jsonl: JSON lines, msgpack: stream of msgpack maps "
+        "(requires msgpack), pickle: stream of pickles",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="PATH",
+        default="-",
+        help="File or FIFO to write return values to when using --output-format, default is stdout",
+    )
+
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="Write every input given to the menus, along with how long it took to handle and the outcome, to PATH "
+        "as JSON lines, such that the session can be replayed with --replay",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="Give the input recorded with --record to the menus instead of reading it from the terminal, then "
+        "show how long every input took compared with the recording",
+    )
+    parser.add_argument(
+        "--replay-pace",
+        choices=recording.PACES,
+        default="fast",
+        help="fast: replay without waiting (default), original: wait for as long as the user did when recording",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        metavar="RATIO",
+        type=float,
+        help="When replaying, exit with 1 if an input takes more than RATIO times as long as when recorded",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["debug", "info", "warning", "error"],
+        help="Level of the logs of meny, debug logs the duration of every case",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=menylogger.LOG_FORMATS,
+        default="text",
+        help="text (default) or json, which writes logs as JSON lines with the case, menu depth and duration",
+    )
+
+    args = parser.parse_intermixed_args()
+    menylogger.set_log_format(args.log_format)
+    if args.log_level:
+        menylogger.set_log_level(args.log_level)
+    if args.metrics or args.metrics_jsonl:
+        enable_metrics(args.metrics, args.metrics_jsonl)
+    if args.trace:
+        tracing.enable_tracing(args.trace)
+        atexit.register(tracing.disable_tracing)
+    if args.output_format:
+        sinks.enable_result_sink(args.output_format, args.output)
+        atexit.register(sinks.disable_result_sink)
+    if args.record:
+        recording.enable_recording(args.record)
+        atexit.register(recording.disable_recording)
 
     file = args.file[0]
     try:
@@ -157,26 +698,42 @@ def cli():
         logger.error(f"Could not find \x1b[33m{file}\x1b[0m")
         sys.exit(1)
 
-    try:
-        signal.signal(signal.SIGINT, lambda *__args__, **__kwargs__: None)
-        if filepath.suffix == ".json":
-            if platform.system() == "Windows":
-                executable = shutil.which("powershell")
-            else:
-                executable = shutil.which("bash")
+    executable = args.executable
+    if (filepath.suffix == ".json" or filepath.is_dir()) and not executable:
+        if platform.system() == "Windows":
+            executable = shutil.which("powershell")
+        else:
+            executable = shutil.which("bash")
 
-            if not executable:
-                executable = "sh"
+        if not executable:
+            executable = "sh"
 
-            executable = Path(executable).as_posix()  # Need this or will crash in windows due to backslash stuff
-            returnDict = menu_from_json(filepath, args.repeat, args.executable or executable)
+        executable = Path(executable).as_posix()  # Need this or will crash in windows due to backslash stuff
+
+    if args.case is not None or args.args:
+        run_case_directly(filepath, args, executable)
+
+    if args.replay:
+        replay_session(filepath, args, executable)
+
+    # Input history is opt-in for menus made with meny.menu, but on for the interactive menus of the meny command
+    set_default_history(True)
+    try:
+        signal.signal(signal.SIGINT, lambda *__args__, **__kwargs__: None)
+        if filepath.is_dir():
+            menu_from_directory(filepath, args.repeat, executable, args.memtrace)
+        elif filepath.suffix == ".json":
+            returnDict = menu_from_json(filepath, args.repeat, executable, args.memtrace)
         else:
-            returnDict = menu_from_python_code(filepath, args.repeat)
+            returnDict = menu_from_python_code(filepath, args.repeat, args.memtrace)
+            if args.output_format:
+                # Return values have already been written to the result sink
+                sys.exit(0)
             values = list(returnDict.values())
             if len(values) == 1 and values[0] is not None:
-                pprint.pprint(values[0])
+                print_value(values[0])
             elif len(values) > 1:
-                pprint.pprint(returnDict)
+                print_value(returnDict)
             else:
                 sys.exit(1)
     except Exception as e:
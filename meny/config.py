@@ -7,7 +7,57 @@ DEFAULT_ONCE = False
 DEFAULT_RETURN_MODE = "flat"
 DEFAULT_REMEMBER = True
 DEFAULT_CLEAR = False
+DEFAULT_EXECUTOR = "inline"
+# Persistent input history (see meny.history), off by default and turned on by the meny command
+DEFAULT_HISTORY = False
+# Timeout in seconds for cases, None means no timeout
+DEFAULT_TIMEOUT = None
+# Seconds a cancelled case gets to stop by itself before the menu continues without it
+CANCEL_GRACE_PERIOD = 0.5
+CANCEL_POLL_INTERVAL = 0.1
+# Directory for history files, None means $XDG_CACHE_HOME/meny/history or ~/.cache/meny/history
+HISTORY_DIR = None
+HISTORY_MAX_ENTRIES = 100_000
+# Number of most recent history entries given to readline in the simple frontend
+HISTORY_READLINE_ENTRIES = 1000
+# Directory for the indexes of directory menus, None means $XDG_CACHE_HOME/meny/index or ~/.cache/meny/index
+INDEX_DIR = None
+# Fork executor: max number of worker processes (None means number of CPUs), number of calls
+# after which a worker is recycled, and resident memory in bytes above which it is recycled
+WORKER_POOL_SIZE = None
+WORKER_MAX_CALLS = 1000
+WORKER_MAX_RSS = None
+# Map mode: max number of rows that run at a time (None means size of the worker pool when using the fork
+# executor, else 8), and seconds between progress updates
+MAP_CONCURRENCY = None
+MAP_PROGRESS_INTERVAL = 0.2
+# JSON menus: max number of commands of a __parallel__ or __matrix__ group that run at a time
+JSON_CONCURRENCY = 8
+# JSON menus: file in the working directory with the hashes of the steps at their last successful run
+STEP_STATE_FILE = ".meny-steps.json"
+# Fancy frontend: show output of cases in an output pane, which keeps at most the given number of
+# most recent lines and characters
+CAPTURE_OUTPUT = True
+OUTPUT_MAX_LINES = 10_000
+OUTPUT_MAX_CHARS = 1_000_000
+# Page output that does not fit on the screen: return values printed by the meny command, streamed results of
+# cases and the output pane of the fancy frontend (Ctrl-F). Only when stdin and stdout are terminals
+PAGER = True
+# Replay: durations shorter than this (in seconds) count as this when comparing with the recording
+REPLAY_MIN_DURATION = 0.01
+# Cases that return iterators (e.g. generators): what is recorded as the return value ("none", "count",
+# "head", "tail" or "spill", see meny.stream), number of items kept for "head" and "tail", whether items are
+# printed as they arrive, and directory of spill files (None means the temporary directory)
+STREAM_RECORD = "tail"
+STREAM_RECORD_ITEMS = 100
+STREAM_SHOW = True
+STREAM_SPILL_DIR = None
+# Number of allocation sites to show per case and in memory report when memory tracing
+MEMTRACE_TOP = 10
 _CASE_TITLE = "__meny_title__"
 _CASE_IGNORE = "__meny_ignore__"
+_CASE_TIMEOUT = "__meny_timeout__"
+_CASE_STREAM = "__meny_stream__"
 _DICT_KEY = "__meny_key_from_input_dict__"
 _ROOT = "__meny_root__"
+_MEMORY_KEY = "__meny_memory__"
@@ -1,11 +1,27 @@
 import curses
 import curses.ascii
 import inspect
+import os
 from functools import wraps
-from typing import Optional, Union
+from typing import List, Optional, Union
 
 import meny
 from meny import config as cng
+from meny import pager
+
+CTRL_F = "\x06"
+CTRL_G = "\x07"
+CTRL_N = "\x0e"
+CTRL_P = "\x10"
+CTRL_R = "\x12"
+ESC = "\x1b"
+
+# Max number of pending keys that are applied before the screen is rendered
+MAX_TYPEAHEAD = 1 << 16
+
+
+def _is_text(k: Union[int, str]) -> bool:
+    return isinstance(k, str) and k.isprintable()
 
 
 def recover_cursor(f):
@@ -46,6 +62,19 @@ class InputField(BaseWindow):
         self.cprint(self.inp_message, newline=0)
         self.begin_y, self.begin_x = self._window.getyx()
         self.first_token: str = ""
+        # Position of cursor in input. The input is kept here rather than read from the window, since
+        # reading from the window is limited to 1023 characters
+        self.pos: int = 0
+
+        # Position in menu history when recalling entries with Ctrl-P / Ctrl-N
+        self.history_position: Optional[int] = None
+        # Query for reverse search (Ctrl-R), is None when not searching
+        self.search_query: Optional[str] = None
+        self.search_position: Optional[int] = None
+        self.search_failed: bool = False
+        self.search_saved_inp: str = ""
+        # Names of cases that matched the last completion (tab), shown under input field
+        self.completions: List[str] = []
 
     @property
     def inp(self):
@@ -67,19 +96,30 @@ class InputField(BaseWindow):
             bytes_ = self._window.instr(self.begin_y, self.begin_x)
         return bytes_.decode(decode).strip()
 
-    def sync_window_with_inp(self):
+    def render(self):
         """
-        Sets the visibe window to match the content of self._inp
+        Draws the input, scrolled horizontally such that the cursor is visible if the input is wider
+        than the screen
         """
+        width = max(self.main.width - self.begin_x - 1, 1)
+        offset = max(self.pos - width, 0)
         self._window.move(self.begin_y, self.begin_x)
         self._window.clrtoeol()
-        self._window.addstr(self.inp)
+        self._window.addstr(self._inp[offset : offset + width])
+        self._window.move(self.begin_y, self.begin_x + self.pos - offset)
+
+    def sync_window_with_inp(self):
+        """
+        Sets the visibe window to match the content of self._inp, with the cursor at the end
+        """
+        self.pos = len(self._inp)
+        self.render()
 
     def handle_backspace(self, y: int, x: int):
-        if self.inp and x > self.begin_x:
-            self._window.move(y, x - 1)
-            self._window.delch()
-            self.inp = self.read_field()
+        if self.pos > 0:
+            self.inp = self._inp[: self.pos - 1] + self._inp[self.pos :]
+            self.pos -= 1
+            self.render()
 
     def handle_int_input(self, k: int, y: int, x: int):
         """
@@ -106,17 +146,83 @@ class InputField(BaseWindow):
             self.sync_window_with_inp()
 
         elif k == curses.KEY_RIGHT:
-            _, max_x = self._window.getmaxyx()
-            if (x < max_x) and (x < len(self.inp_message + self._inp)):
-                self._window.move(y, x + 1)
+            self.pos = min(self.pos + 1, len(self._inp))
+            self.render()
 
         elif k == curses.KEY_LEFT:
-            if x > len(self.inp_message):
-                self._window.move(y, x - 1)
+            self.pos = max(self.pos - 1, 0)
+            self.render()
 
         elif k in (curses.KEY_BACKSPACE, curses.ascii.BS, curses.ascii.DEL):
             self.handle_backspace(y, x)
 
+        elif k == curses.KEY_PPAGE:
+            self.main.scroll_output(up=True)
+
+        elif k == curses.KEY_NPAGE:
+            self.main.scroll_output(up=False)
+
+    def recall_history(self, older: bool):
+        """Replace input with previous (older=True) or next entry in history"""
+        history = self.main.cli.history
+        if not history:
+            return
+
+        if older:
+            position = history.previous(self.history_position)
+            if position is None:
+                return
+        else:
+            if self.history_position is None:
+                return
+            position = history.next(self.history_position)
+
+        self.history_position = position
+        self.inp = history[position] if position is not None else ""
+        self.sync_window_with_inp()
+
+    def start_search(self):
+        if not self.main.cli.history:
+            return
+        self.search_query = ""
+        self.search_position = None
+        self.search_failed = False
+        self.search_saved_inp = self.inp
+
+    def search(self, start: Optional[int]):
+        position = self.main.cli.history.search(self.search_query, start)
+        self.search_failed = position is None
+        if position is not None:
+            self.search_position = position
+            self.inp = self.main.cli.history[position]
+            self.sync_window_with_inp()
+
+    def handle_search_input(self, k: Union[int, str]):
+        """
+        Handles keys in reverse search mode. Typing extends the query, Ctrl-R finds older matches,
+        Enter (or any non-text key) accepts the match, Ctrl-G / Esc cancels the search.
+        """
+        if k == CTRL_R:
+            if self.search_query:
+                self.search(self.search_position)
+        elif k in (CTRL_G, ESC):
+            self.search_query = None
+            self.inp = self.search_saved_inp
+            self.sync_window_with_inp()
+        elif k in ("\b", "\x7f", curses.KEY_BACKSPACE, curses.ascii.BS, curses.ascii.DEL):
+            self.search_query = self.search_query[:-1]
+            self.search_position = None
+            self.search_failed = False
+            if self.search_query:
+                self.search(None)
+        elif isinstance(k, str) and k.isprintable():
+            self.search_query += k
+            # Current match may still match the extended query
+            self.search(None if self.search_position is None else self.search_position + 1)
+        else:
+            self.history_position = self.search_position
+            self.search_query = None
+
     def handle_str_input(self, k: str, y: int, x: int):
         if k == "\n":
             # Must capture newline explicitly, since insstr just treats it as space or something
@@ -125,19 +231,69 @@ class InputField(BaseWindow):
         elif k in ("\b", "\x7f"):
             # Some systems (erm, Windows at least) gives "\b" for backspace
             self.handle_backspace(y, x)
+        elif k == CTRL_P:
+            self.recall_history(older=True)
+        elif k == CTRL_N:
+            self.recall_history(older=False)
+        elif k == CTRL_R:
+            self.start_search()
+        elif k == "\t":
+            self.complete()
+        elif k == CTRL_F:
+            self.main.page_output()
         elif (k == "\x00") or (ord(k) == 0):
             # Windows key or some weird ass key, idk what to do about it, just return
             return
         else:
-            # Sometimes crash on funny keys, e.g. windows key
-            # use insstr since want to be able to insert new text in the middle
-            # of existing text
-            self._window.insstr(k)
-            self._window.move(y, x + 1)
-            self.inp = self.read_field()
+            self.insert_text(k, y, x)
+
+    def complete(self):
+        """
+        Completes the name of the case before the cursor to the longest common prefix of the names of
+        the cases that match, with a space after if only one case matches
+        """
+        prefix = self._inp[: self.pos]
+        if " " in prefix:  # Only the case is completed, not its arguments
+            return
+        names = self.main.cli.case_index.complete(prefix)
+        if not names:
+            return
+        completion = os.path.commonprefix(names)[len(prefix) :]
+        if len(names) == 1 and not self._inp[self.pos :].startswith(" "):
+            completion += " "
+        self.completions = names if len(names) > 1 else []
+        if completion:
+            self.insert_text(completion, *self._window.getyx())
+
+    def insert_text(self, text: str, y: int, x: int):
+        """Inserts text at cursor position"""
+        self.inp = self._inp[: self.pos] + text + self._inp[self.pos :]
+        self.pos += len(text)
+        self.render()
+
+    def handle_keys(self, keys: List[Union[int, str]]):
+        """
+        Applies keys in order. Runs of printable characters (e.g. pasted text) are inserted at once,
+        unless searching history.
+        """
+        self.completions = []
+        i = 0
+        while i < len(keys):
+            y, x = self._window.getyx()
+            if self.search_query is None and _is_text(keys[i]):
+                j = i + 1
+                while j < len(keys) and _is_text(keys[j]):
+                    j += 1
+                self.insert_text("".join(keys[i:j]), y, x)
+                i = j
+            else:
+                self.handle_input(keys[i], y, x)
+                i += 1
 
     def handle_input(self, k: Union[int, str], y: int, x: int):
-        if isinstance(k, str):
+        if self.search_query is not None:
+            self.handle_search_input(k)
+        elif isinstance(k, str):
             self.handle_str_input(k, y, x)
         elif isinstance(y, int):
             self.handle_int_input(k, y, x)
@@ -156,6 +312,11 @@ class MainWindow(BaseWindow):
         self.key2index = {key: index for index, key in enumerate(self.funcmap)}
         self.index2key = tuple(self.funcmap)
         self.curr_index: Optional[int] = None
+        self.width: int = 80  # Width of screen, set when running
+        self.height: int = 24  # Height of screen, set when running
+        self.output_y: int = 0  # Line of output pane header, set when running
+        self.output_scroll: int = 0  # Number of lines the output pane is scrolled up from the end
+        self.screen: Optional["curses._CursesWindow"] = None  # Window the pad is shown on, set when running
 
     @property
     def prev_case(self):
@@ -172,14 +333,8 @@ class MainWindow(BaseWindow):
         token : str
         strlen : int, how many columns highlight should span
         """
-        # Handle option -1, -2 etc.. works like list(...)[-1]
-        if token.startswith("-") and len(token) >= 2:
-            try:
-                token = str(len(self.funcmap) + int(token) + 1)
-            except ValueError:
-                pass
-
-        new_index = self.key2index.get(token, None)
+        # Handles keys, options -1, -2 etc. (works like list(...)[-1]), names and prefixes of names
+        new_index = self.key2index.get(self.cli.resolve_case(token), None)
 
         if new_index is None:  # Index not in funcmap
             if self.curr_index is not None:
@@ -271,6 +426,8 @@ class MainWindow(BaseWindow):
     def notify_invalid_case(self, first_token: str):
         if first_token in self.available_cases or not first_token:
             return
+        if self.cli.case_index.has_prefix(first_token) or self.cli.resolve_case(first_token):
+            return
 
         y, x = self._window.getyx()
         message = "Invalid choice"
@@ -278,6 +435,89 @@ class MainWindow(BaseWindow):
         self._window.addstr("Invalid choice")
         self._window.chgat(y + 1, x, len(message), curses.color_pair(1))
 
+    @recover_cursor
+    def show_search(self, inputfield: InputField):
+        """Shows reverse search status under input field"""
+        y, _ = self._window.getyx()
+        self._window.move(y + 1, 0)
+        self._window.clrtoeol()
+        message = f"(reverse-i-search)`{inputfield.search_query}'"
+        self._window.addstr(message)
+        if inputfield.search_failed:
+            self._window.addstr(": no match", curses.color_pair(1))
+
+    @recover_cursor
+    def show_completions(self, names: List[str]):
+        """Shows names of the cases that match the completion under input field"""
+        y, _ = self._window.getyx()
+        self._window.move(y + 1, 0)
+        self._window.clrtoeol()
+        self._window.addstr("  ".join(names)[: self.width - 1], curses.A_BOLD)
+
+    @property
+    def output_rows(self) -> int:
+        """Number of lines of output that fits under the output pane header"""
+        return self.height - self.output_y - 1
+
+    def scroll_output(self, up: bool):
+        """Scrolls output pane a page up or down"""
+        output = self.cli.output
+        if output is None or self.output_rows < 1:
+            return
+        scroll = self.output_scroll + (self.output_rows if up else -self.output_rows)
+        self.output_scroll = min(max(scroll, 0), max(len(output) - self.output_rows, 0))
+        self.show_output()
+
+    @recover_cursor
+    def show_output(self):
+        """Shows the output of previous cases in a pane under the input field"""
+        output = self.cli.output
+        if output is None or not len(output) or self.output_rows < 1:
+            return
+        header = f"Output ({len(output)} lines"
+        if output.dropped:
+            header += f", {output.dropped} older lines dropped"
+        if self.output_scroll:
+            header += f", scrolled up {self.output_scroll} lines"
+        header += ", PgUp/PgDn to scroll, Ctrl-F to page)"
+        self._window.move(self.output_y, 0)
+        self._window.clrtobot()
+        self._window.addstr(header[: self.width - 1], curses.A_UNDERLINE)
+        for i, line in enumerate(output.tail(self.output_rows, self.output_scroll)):
+            self._window.addstr(self.output_y + 1 + i, 0, line[: self.width - 1])
+
+    def page_output(self):
+        """Shows the output of previous cases in the pager, see meny.pager"""
+        output = self.cli.output
+        if output is None or not len(output) or self.screen is None:
+            return
+        index = pager.LineIndex(output.tail(len(output)))
+        try:
+            pager.Pager(index, "Output").run(self.screen)
+        finally:
+            index.close()
+        self.screen.clear()
+        self.screen.refresh()
+        self._window.touchwin()  # The pad is drawn again in full when refreshed
+
+    def read_keys(self) -> List[Union[int, str]]:
+        """
+        Waits for a key, then reads the keys that are already pending (e.g. from a paste or from typing
+        ahead of a slow connection) without blocking, such that they can be rendered at once. Stops
+        after enter, such that input meant for after the current input is left alone.
+        """
+        keys = [self._window.get_wch()]
+        self._window.nodelay(True)
+        try:
+            while keys[-1] != "\n" and len(keys) < MAX_TYPEAHEAD:
+                try:
+                    keys.append(self._window.get_wch())
+                except curses.error:  # No pending keys
+                    break
+        finally:
+            self._window.nodelay(False)
+        return keys
+
     def run(self, window: "curses._CursesWindow"):
         """
         Will do almost all work on a padded window, which
@@ -289,6 +529,8 @@ class MainWindow(BaseWindow):
         curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_RED)
         curses.init_pair(2, curses.COLOR_YELLOW, curses.COLOR_BLACK)
         super().__init__(curses.newpad(2048, 2048))  # This will populate the self._window attribute
+        self.height, self.width = window.getmaxyx()
+        self.screen = window
 
         def refresh_pad():
             lines, cols = window.getmaxyx()
@@ -305,6 +547,8 @@ class MainWindow(BaseWindow):
         self.cprint("")
 
         inputfield = InputField(self)
+        self.output_y = inputfield.begin_y + 3
+        self.show_output()
         if cng.DEFAULT_REMEMBER and (self.prev_case is not None):
             inputfield.inp = self.prev_case + " "
             inputfield.sync_window_with_inp()
@@ -313,10 +557,12 @@ class MainWindow(BaseWindow):
         refresh_pad()
         while not inputfield._inp.endswith("\n"):
             # Get input using window instead of pad, using pad gives unexpected output
-            k = self._window.get_wch()
-            y, x = self._window.getyx()
-            inputfield.handle_input(k, y, x)
+            inputfield.handle_keys(self.read_keys())
             self.highlight_funcmap(inputfield.first_token, maxstrlen)
+            if inputfield.search_query is not None:
+                self.show_search(inputfield)
+                refresh_pad()
+                continue
             self.hint_args(inputfield.inp)
 
             self.notify_special_token(inputfield.inp, "r", "restart")
@@ -324,8 +570,12 @@ class MainWindow(BaseWindow):
             self.notify_special_token(inputfield.inp, "h", "display help")
             self.notify_special_token(inputfield.inp, "..", "go back")
             self.notify_special_token(inputfield.inp, "a", "run all cases")
+            if "m" in self.cli.special_cases:
+                self.notify_special_token(inputfield.inp, "m", "show memory growth")
 
             self.notify_invalid_case(inputfield.first_token)
+            if inputfield.completions:
+                self.show_completions(inputfield.completions)
             refresh_pad()
         return inputfield._inp
 
@@ -1,6 +1,6 @@
 from types import FunctionType
 
-from meny.config import _CASE_IGNORE, _CASE_TITLE
+from meny.config import _CASE_IGNORE, _CASE_STREAM, _CASE_TIMEOUT, _CASE_TITLE
 
 
 def title(title: str):
@@ -26,6 +26,42 @@ def ignore(func: FunctionType):
     return func
 
 
+def timeout(seconds: float):
+    """
+    Sets case timeout. The case is cancelled if it has not returned after the given number of seconds
+    """
+
+    def _timeout_appender(func: FunctionType):
+        vars(func)[_CASE_TIMEOUT] = seconds
+        return func
+
+    if isinstance(seconds, (int, float)) and not isinstance(seconds, bool) and seconds > 0:
+        return _timeout_appender
+    else:
+        raise ValueError(f"Timeout must be a positive number, got: {seconds!r}")
+
+
+def stream(record: str = "tail", items: int = 100, show: bool = True):
+    """
+    Sets how the result of a case is streamed if it is an iterator (e.g. if the case is a generator). The
+    items are consumed one at a time, printed as they arrive if show is True, and record is what is kept as
+    the return value of the case: "none", "count" (number of items), "head" or "tail" (the given number of
+    first or last items) or "spill" (all items pickled to a temporary file), see meny.streaming
+    """
+    # Import here to fix circular imports
+    from meny.streaming import RECORD_MODES
+
+    def _stream_appender(func: FunctionType):
+        vars(func)[_CASE_STREAM] = (record, items, show)
+        return func
+
+    if record not in RECORD_MODES:
+        raise ValueError(f"Unsupported record mode {record!r}, supported modes are {RECORD_MODES}")
+    if not isinstance(items, int) or isinstance(items, bool) or items < 0:
+        raise ValueError(f"Number of items must be a non-negative integer, got: {items!r}")
+    return _stream_appender
+
+
 if __name__ == "__main__":
 
     @title("Catdog")
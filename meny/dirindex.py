@@ -0,0 +1,126 @@
+"""
+Index of the directory trees that are opened as menus with the meny CLI (meny path/to/dir).
+
+A directory menu shows the subdirectories that contain Python or JSON files (at any depth) and the
+Python and JSON files of the directory. Knowing which subdirectories to show requires a listing of
+the whole tree, so the listings are persisted in an index file along with the modification time of
+every directory. A listing is reused as long as the modification time of its directory is
+unchanged, such that a repeated launch only has to stat the directories.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from meny import config as cng
+
+INDEX_VERSION = 1
+SUFFIXES = (".py", ".json")
+
+
+def index_dir() -> Path:
+    if cng.INDEX_DIR is not None:
+        return Path(cng.INDEX_DIR)
+    cachedir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cachedir) / "meny" / "index"
+
+
+def join(relpath: str, name: str) -> str:
+    return f"{relpath}/{name}" if relpath else name
+
+
+def _scan(directory: Path, mtime: Optional[int]) -> dict:
+    """
+    Lists directory. Hidden entries and entries starting with an underscore (e.g. __pycache__ and
+    __init__.py) are left out, and so are symlinked directories, to avoid cycles.
+    """
+    dirs, files = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith((".", "_")):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.name.endswith(SUFFIXES) and entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return {"mtime": mtime, "dirs": sorted(dirs), "files": sorted(files)}
+
+
+class DirectoryIndex:
+    """
+    Listings of the directories under root, addressed by their path relative to root ("" is root)
+    """
+
+    def __init__(self, root: Path, path: Optional[Path] = None):
+        self.root = Path(root).resolve()
+        if path is None:
+            path = index_dir() / (hashlib.sha1(str(self.root).encode()).hexdigest() + ".json")
+        self.path = Path(path)
+        self._listings: Dict[str, dict] = {}
+        self._validated: Set[str] = set()
+        self._has_cases: Dict[str, bool] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION and data.get("root") == str(self.root):
+            self._listings = data.get("dirs", {})
+
+    def save(self):
+        """
+        Writes the index atomically if it has changed. Listings of directories that have not been
+        seen since the index was loaded (e.g. removed directories) are dropped.
+        """
+        if not self._dirty:
+            return
+        listings = {relpath: self._listings[relpath] for relpath in self._validated}
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "root": str(self.root), "dirs": listings}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            return  # The index is only a cache, so failing to write it is not an error
+        self._dirty = False
+
+    def listing(self, relpath: str) -> Tuple[List[str], List[str]]:
+        """Names of subdirectories and of Python and JSON files in the directory at relpath"""
+        listing = self._listings.get(relpath)
+        if relpath not in self._validated:
+            try:
+                mtime = os.stat(self.root / relpath).st_mtime_ns
+            except OSError:
+                mtime = None
+            if listing is None or listing["mtime"] != mtime:
+                listing = self._listings[relpath] = _scan(self.root / relpath, mtime)
+                self._dirty = True
+            self._validated.add(relpath)
+        return listing["dirs"], listing["files"]
+
+    def has_cases(self, relpath: str) -> bool:
+        """True if the directory at relpath contains Python or JSON files, directly or in subdirectories"""
+        has_cases = self._has_cases.get(relpath)
+        if has_cases is None:
+            dirs, files = self.listing(relpath)
+            has_cases = bool(files) or any(self.has_cases(join(relpath, name)) for name in dirs)
+            self._has_cases[relpath] = has_cases
+        return has_cases
+
+    def entries(self, relpath: str) -> Tuple[List[str], List[str]]:
+        """Subdirectories that have cases, and files, of the directory at relpath"""
+        dirs, files = self.listing(relpath)
+        return [name for name in dirs if self.has_cases(join(relpath, name))], files
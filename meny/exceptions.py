@@ -9,3 +9,10 @@ class MenuQuit(Exception):
     """
     For exiting all console instances
     """
+
+
+class CaseCancelled(Exception):
+    """
+    A case was cancelled because it timed out or was interrupted. Is stored as the return value
+    of the cancelled case.
+    """
@@ -0,0 +1,205 @@
+"""
+File arguments: an argument @path (or @"path with spaces") gives a case the contents of the file at path, without
+reading it into memory up front. What the case gets depends on the annotation of the parameter:
+
+- bytes, memoryview or no annotation: a read-only memoryview of the file, which is memory-mapped such that the data
+  is not copied into Python objects, and only the pages the case touches are read from disk
+- numpy.ndarray: a read-only numpy.memmap, of the array in the file if it is a .npy file, else of its bytes
+- TextIO, Iterable[str] or Iterator[str]: a LineStream, which reads the lines of the file as they are iterated over.
+  path can also be - for stdin, or a glob (e.g. @logs/*.log) for the matching files one after another, and files
+  compressed with gzip, bz2 or xz are decompressed
+
+Parameters annotated with str are given the argument as is.
+"""
+
+import collections.abc
+import glob
+import io
+import mmap
+import os
+import sys
+from pathlib import Path
+from typing import Any, BinaryIO, List, Optional, Sequence, TextIO, Tuple
+
+from meny.exceptions import MenuError
+
+FILE_ARG_PREFIX = "@"
+# Path of stdin in file arguments of line streams
+STDIN = "-"
+# Files starting with these bytes are decompressed by line streams
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def is_file_arg(arg: str) -> bool:
+    return arg.startswith(FILE_ARG_PREFIX) and len(arg) > len(FILE_ARG_PREFIX)
+
+
+def _is_ndarray(annotation: Any) -> bool:
+    # Without importing numpy, which is only needed if a case is annotated with it
+    return getattr(annotation, "__module__", None) == "numpy" and getattr(annotation, "__name__", None) == "ndarray"
+
+
+def _is_line_stream(annotation: Any) -> bool:
+    if annotation in (TextIO, io.TextIOBase):
+        return True
+    origin = getattr(annotation, "__origin__", None)  # E.g. collections.abc.Iterable for Iterable[str]
+    return origin in (collections.abc.Iterable, collections.abc.Iterator) and annotation.__args__ == (str,)
+
+
+def _open_text(path: str) -> Tuple[BinaryIO, io.TextIOWrapper]:
+    """
+    Opens the file at path (stdin if path is STDIN) as text, which is decompressed if it is compressed. Returns the
+    file, and the text read from it
+    """
+    raw = sys.stdin.buffer if path == STDIN else open(path, "rb")
+    peek = getattr(raw, "peek", None)  # Not every replacement of stdin can peek
+    head = peek(len(XZ_MAGIC))[: len(XZ_MAGIC)] if peek is not None else b""
+    binary: BinaryIO = raw
+    if head.startswith(GZIP_MAGIC):
+        import gzip
+
+        binary = gzip.GzipFile(fileobj=raw)
+    elif head.startswith(BZ2_MAGIC):
+        import bz2
+
+        binary = bz2.BZ2File(raw)
+    elif head.startswith(XZ_MAGIC):
+        import lzma
+
+        binary = lzma.LZMAFile(raw)
+    return raw, io.TextIOWrapper(binary, encoding="utf-8", errors="replace")
+
+
+class LineStream(io.TextIOBase):
+    """
+    Lines of the files at paths, one file after another, read as they are iterated over or read such that files of
+    any size are streamed in constant memory. The lines end with their newlines, as when iterating over a file.
+    Only one file is open at a time, and stdin (path STDIN) is not closed.
+    """
+
+    def __init__(self, paths: Sequence[str]):
+        super().__init__()
+        self.paths = list(paths)
+        self._next = 0  # Index of the next file to open
+        self._file: Optional[io.TextIOWrapper] = None
+        self._raw: Optional[BinaryIO] = None  # Underlying file of self._file, before decompression
+
+    def readable(self) -> bool:
+        return True
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        binary = self._file.detach()
+        if binary is not self._raw:  # Decompressors do not close the file they read from
+            binary.close()
+        if self._raw is not sys.stdin.buffer:
+            self._raw.close()
+        self._file = self._raw = None
+
+    def _open_next(self) -> bool:
+        """Closes the current file and opens the next one, returns False if there are no more files"""
+        self._close_file()
+        if self._next >= len(self.paths):
+            return False
+        self._raw, self._file = _open_text(self.paths[self._next])
+        self._next += 1
+        return True
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        self._checkClosed()
+        if size == 0:
+            return ""
+        while True:
+            if self._file is not None:
+                line = self._file.readline(-1 if size is None else size)
+                if line:
+                    return line
+            if not self._open_next():
+                return ""
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            return "".join(iter(self.readline, ""))
+        self._checkClosed()
+        chunks: List[str] = []
+        while size > 0:
+            if self._file is not None:
+                chunk = self._file.read(size)
+                if chunk:
+                    chunks.append(chunk)
+                    size -= len(chunk)
+                    continue
+            if not self._open_next():
+                break
+        return "".join(chunks)
+
+    def close(self):
+        if not self.closed:
+            self._close_file()
+        super().close()
+
+    def __repr__(self) -> str:
+        return f"LineStream({self.paths!r})"
+
+
+def line_stream(pattern: str) -> LineStream:
+    """
+    LineStream of the file at path pattern, of stdin if pattern is STDIN, or of the files matching pattern if it is
+    a glob. Raises MenuError if there are no such files.
+    """
+    if pattern == STDIN:
+        return LineStream([STDIN])
+    pattern = os.path.expanduser(pattern)
+    if any(c in pattern for c in "*?["):
+        paths = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        if not paths:
+            raise MenuError(f"No files match {pattern}")
+        return LineStream(paths)
+    if not os.path.isfile(pattern):
+        raise MenuError(f"Could not find file {pattern}")
+    return LineStream([pattern])
+
+
+def map_file(path: Path) -> memoryview:
+    """Read-only memoryview of the file at path, which is memory-mapped"""
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            return memoryview(b"")
+    # The map stays open (also after the file is closed) for as long as the memoryview is referenced
+    return memoryview(mapped)
+
+
+def map_array(path: Path):
+    """Read-only numpy.memmap of the array in the .npy file at path, or of the bytes of any other file"""
+    import numpy
+
+    if path.suffix == ".npy":
+        return numpy.load(path, mmap_mode="r")
+    return numpy.memmap(path, dtype=numpy.uint8, mode="r")
+
+
+def file_arg(arg: str, annotation: Any = None) -> Any:
+    """
+    Value of the file argument arg (e.g. @data.npy) for a parameter with annotation (None if not annotated),
+    see the module docstring. Raises MenuError if the file cannot be mapped or the annotation is not supported.
+    """
+    path_or_pattern = arg[len(FILE_ARG_PREFIX) :].strip("\"'")
+    if _is_line_stream(annotation):
+        return line_stream(path_or_pattern)
+    path = Path(path_or_pattern).expanduser()
+    try:
+        if _is_ndarray(annotation):
+            return map_array(path)
+        if annotation in (None, bytes, memoryview):
+            return map_file(path)
+    except (OSError, ValueError) as e:
+        raise MenuError(f"Could not map file argument {path}: {e}") from e
+    raise MenuError(
+        f"Got file argument {arg}, but file arguments can only be given to parameters annotated with bytes, "
+        f"memoryview, numpy.ndarray, TextIO or Iterable[str], or without annotation, not {annotation}"
+    )
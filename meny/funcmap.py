@@ -7,7 +7,7 @@ and the values are the cases (which are functions).
 
 from inspect import unwrap
 from types import FunctionType
-from typing import Callable, Dict, Iterable, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from meny.config import _CASE_TITLE, _DICT_KEY
 
@@ -49,6 +49,105 @@ def construct_funcmap(
     return {str(i): (_get_case_name(func), decorator(func)) for i, func in enumerate(funcs, start=1)}
 
 
+class _TrieNode:
+    __slots__ = ("children", "key", "exact")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.key: Optional[str] = None  # Key of the cases with names under this node, _AMBIGUOUS if several
+        self.exact: Optional[str] = None  # Key of the case with the name ending at this node
+
+
+_AMBIGUOUS = "__meny_ambiguous__"
+
+
+class CaseIndex:
+    """
+    Trie of the names of the cases in a funcmap, that is their titles and function names. Resolves
+    names and unique prefixes of names to keys, in time proportional to the length of the name
+    rather than the number of cases.
+    """
+
+    def __init__(self, funcmap: Dict[str, Tuple[str, FunctionType]]):
+        self.funcmap = funcmap
+        self._root = _TrieNode()
+        for key, (name, func) in funcmap.items():
+            for name_ in (name, getattr(unwrap(func), "__name__", None)):
+                if name_:
+                    self._insert(name_, key)
+
+    def _insert(self, name: str, key: str):
+        node = self._root
+        for char in name:
+            node = node.children.setdefault(char, _TrieNode())
+            node.key = key if node.key in (None, key) else _AMBIGUOUS
+        if node.exact is None:  # The first case with a given name wins
+            node.exact = key
+
+    def _find(self, prefix: str) -> Optional[_TrieNode]:
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def resolve(self, token: str) -> Optional[str]:
+        """
+        Returns the funcmap key that token refers to, or None if there is no such case.
+
+        token can be a key ("3"), a reversed index ("-1" is the last case), the name of a case, that
+        is its title or its function name, or a prefix of names of only one case.
+        """
+        if token in self.funcmap:
+            return token
+
+        # If token starts with '-', indicates reverse choice (like np.ndarray[-1])
+        if token.startswith("-"):
+            try:
+                key = str(len(self.funcmap) + int(token) + 1)
+            except ValueError:
+                pass
+            else:
+                return key if key in self.funcmap else None
+
+        node = self._find(token) if token else None
+        if node is None:
+            return None
+        if node.exact is not None:
+            return node.exact
+        return node.key if node.key != _AMBIGUOUS else None
+
+    def has_prefix(self, prefix: str) -> bool:
+        """Whether any names start with prefix"""
+        return self._find(prefix) is not None
+
+    def complete(self, prefix: str) -> List[str]:
+        """
+        Sorted names that start with prefix. Names with whitespace are left out, as they cannot be
+        given as a single token.
+        """
+        node = self._find(prefix)
+        if node is None:
+            return []
+        names = []
+        stack = [(prefix, node)]
+        while stack:
+            name, node = stack.pop()
+            if node.exact is not None and name:
+                names.append(name)
+            stack.extend((name + char, child) for char, child in node.children.items() if not char.isspace())
+        return sorted(names)
+
+
+def resolve_case_key(funcmap: Dict[str, Tuple[str, FunctionType]], token: str) -> Optional[str]:
+    """
+    Returns the funcmap key that token refers to, or None if there is no such case, see
+    CaseIndex.resolve. Use a CaseIndex directly to resolve many tokens for the same funcmap.
+    """
+    return CaseIndex(funcmap).resolve(token)
+
+
 if __name__ == "__main__":
     import subprocess
 
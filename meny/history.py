@@ -0,0 +1,198 @@
+"""
+Persistent command history for menus.
+
+Every menu (identified by its title and the source file of its cases) gets an append-only
+history file with one input line per line. The file is read once, when the history is first
+needed, into an in-memory index. Duplicate lines are collapsed such that only the most recent
+occurrence of a line is kept, and the file is compacted when it grows beyond twice the number
+of entries that are kept. As inputs can contain secrets, the history directory is only accessible to
+its owner (0700), as are the history files (0600).
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from meny import config as cng
+
+# Cache of loaded histories, such that reopening a (nested) menu does not read the file again
+_histories: Dict[Path, "History"] = {}
+
+
+def history_dir() -> Path:
+    if cng.HISTORY_DIR is not None:
+        return Path(cng.HISTORY_DIR)
+    cachedir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cachedir) / "meny" / "history"
+
+
+def _open_private(path: Path, flags: int):
+    """Opens path for writing as text, such that only its owner can read it, also if it already exists"""
+    fd = os.open(path, flags | os.O_WRONLY | os.O_CREAT, 0o600)
+    if hasattr(os, "fchmod"):  # Not on Windows
+        os.fchmod(fd, 0o600)
+    return os.fdopen(fd, "w", encoding="utf-8")
+
+
+def _make_private_dir(path: Path):
+    """Creates the directory at path such that only its owner can access it, also if it already exists"""
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    try:
+        os.chmod(path, 0o700)
+    except OSError:
+        pass  # E.g. a directory of another user, which this user can still write to
+
+
+def get_history(title: str, source: str) -> "History":
+    """Get the history for the menu with the given title and source file"""
+    key = hashlib.sha1(f"{source}\0{title}".encode()).hexdigest()
+    path = history_dir() / key
+    history = _histories.get(path)
+    if history is None:
+        history = _histories[path] = History(path)
+    return history
+
+
+class History:
+    """
+    Command history backed by an append-only file
+
+    Entries are addressed by positions, where larger positions are more recent. Positions of
+    entries that are superseded by a more recent duplicate are left empty (None) until the
+    history is compacted.
+    """
+
+    def __init__(self, path: Path, max_entries: Optional[int] = None):
+        self.path = Path(path)
+        self.max_entries = max_entries or cng.HISTORY_MAX_ENTRIES
+        self.version = 0  # Incremented on every change, used by frontends to know when to resync
+        self._entries: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {}
+        self._file_lines = 0
+        self._loaded = False
+        self._dir_private = False  # Whether the directory of path has been made private
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        # Keep the most recent occurrence of every line, in order of recency
+        entries = list(dict.fromkeys(reversed(lines)))[: self.max_entries]
+        entries.reverse()
+        self._entries = entries
+        self._positions = {entry: i for i, entry in enumerate(entries)}
+        self._file_lines = len(lines)
+        if self._file_lines > 2 * self.max_entries:
+            self.compact()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+
+    def _add(self, line: str):
+        position = self._positions.get(line)
+        if position is not None:
+            self._entries[position] = None
+        self._positions[line] = len(self._entries)
+        self._entries.append(line)
+
+    def _compact_memory(self):
+        """Drops empty positions and entries beyond max_entries"""
+        entries = [entry for entry in self._entries if entry is not None][-self.max_entries :]
+        self._entries = entries
+        self._positions = {entry: i for i, entry in enumerate(entries)}
+
+    def append(self, line: str):
+        """Add line to history, both in memory and on disk"""
+        line = line.strip()
+        if not line or "\n" in line:
+            return
+        self._ensure_loaded()
+        self._add(line)
+        self.version += 1
+
+        if len(self._entries) > 2 * self.max_entries:
+            self._compact_memory()
+
+        try:
+            if not self._dir_private:
+                _make_private_dir(self.path.parent)
+                self._dir_private = True
+            with _open_private(self.path, os.O_APPEND) as f:
+                f.write(line + "\n")
+        except OSError:
+            return  # History is best effort, should never stop the menu
+        self._file_lines += 1
+        if self._file_lines > 2 * self.max_entries:
+            self.compact()
+
+    def compact(self):
+        """Rewrites history file such that it only contains the kept entries"""
+        self._ensure_loaded()
+        self._compact_memory()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with _open_private(tmp, os.O_TRUNC) as f:
+                f.writelines(entry + "\n" for entry in self._entries)
+            os.replace(tmp, self.path)
+        except OSError:
+            return
+        self._file_lines = len(self._entries)
+        self.version += 1
+
+    def __getitem__(self, position: int) -> str:
+        self._ensure_loaded()
+        entry = self._entries[position]
+        if entry is None:
+            raise IndexError(f"No history entry at position {position}")
+        return entry
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._positions)
+
+    def recent(self, n: int) -> List[str]:
+        """Returns the n most recent entries, oldest first"""
+        self._ensure_loaded()
+        entries = []
+        for entry in reversed(self._entries):
+            if len(entries) == n:
+                break
+            if entry is not None:
+                entries.append(entry)
+        return entries[::-1]
+
+    def previous(self, position: Optional[int] = None) -> Optional[int]:
+        """Position of the entry before position, or of the most recent entry if position is None"""
+        self._ensure_loaded()
+        start = len(self._entries) if position is None else position
+        for i in range(start - 1, -1, -1):
+            if self._entries[i] is not None:
+                return i
+        return None
+
+    def next(self, position: int) -> Optional[int]:
+        """Position of the entry after position, None if position is the most recent entry"""
+        self._ensure_loaded()
+        for i in range(position + 1, len(self._entries)):
+            if self._entries[i] is not None:
+                return i
+        return None
+
+    def search(self, query: str, position: Optional[int] = None) -> Optional[int]:
+        """
+        Reverse search: position of the most recent entry before position (or among all entries if
+        position is None) that contains query
+        """
+        self._ensure_loaded()
+        start = len(self._entries) if position is None else position
+        entries = self._entries
+        for i in range(start - 1, -1, -1):
+            entry = entries[i]
+            if entry is not None and query in entry:
+                return i
+        return None
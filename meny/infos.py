@@ -32,6 +32,19 @@ def _error_info_case(error: Exception, func: FunctionType) -> None:
     input()
 
 
+def _cancel_info_case(cancelled: Exception, func: FunctionType) -> None:
+    """Used to tell that a case was cancelled"""
+    print()
+    print(
+        strings.BOLD
+        + strings.YELLOW
+        + f'Cancelled case "{_get_case_name(func)}": {cancelled}'
+        + strings.END
+    )
+    print(strings.INPUT_WAIT_PROMPT_MSG)
+    input()
+
+
 def _error_info_parse(error: Exception):
     lenerror = max(map(len, str(error).split("\n")))
     print(strings.BOLD + strings.RED + f"{' ARGUMENT PARSE ERROR ':#^{lenerror}}" + strings.END)
@@ -57,6 +70,17 @@ def print_help(*args, **kwargs) -> None:
 
         Enter 'a' to run all the cases from top to bottom
 
+        Cases can be entered by name or by a prefix of a name that only one case starts with,
+        press tab to complete names
+
+        Separate cases with '|' to give the return value of a case as the first argument to the
+        next case, e.g. 1 "x" | 2 | 3 10
+
+        Enter 'map', a case and a CSV or JSON lines file to run the case for every row of the
+        file, e.g. map 3 rows.csv
+
+        Enter 'm' to see memory growth per case (only when memory tracing is enabled)
+
         Press enter to exit help screen
         """
     )
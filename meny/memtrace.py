@@ -0,0 +1,123 @@
+"""
+Tracking of memory growth per case with tracemalloc.
+
+While a memory tracker is active, tracemalloc snapshots are taken before and after every case
+call, and the change in resident memory (RSS) and in memory traced by tracemalloc is recorded per
+case, along with the allocation sites that grew the most during the call.
+"""
+
+import linecache
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from meny import config as cng
+from meny import strings
+from meny.utils import get_rss
+
+# Filter out allocations done by tracemalloc itself and by the import machinery
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+
+def _format_stat(stat: tracemalloc.StatisticDiff) -> str:
+    frame = stat.traceback[0]
+    line = linecache.getline(frame.filename, frame.lineno).strip()
+    return f"{frame.filename}:{frame.lineno}: {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks) {line}"
+
+
+class MemoryTracker:
+    """Records memory growth of case calls, see Menu(memory_trace=True)"""
+
+    def __init__(self):
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        self.baseline = _snapshot()
+        self.start_rss = get_rss()
+        self.cases: Dict[str, dict] = {}
+
+    @contextmanager
+    def measure(self, case: str) -> Iterator[None]:
+        before = _snapshot()
+        rss_before = get_rss()
+        try:
+            yield
+        finally:
+            after = _snapshot()
+            rss_delta = get_rss() - rss_before
+            stats = after.compare_to(before, "lineno")
+            record = self.cases.setdefault(case, {"calls": 0, "rss_delta": 0, "traced_delta": 0, "top": []})
+            record["calls"] += 1
+            record["rss_delta"] += rss_delta
+            record["traced_delta"] += sum(stat.size_diff for stat in stats)
+            record["top"] = [_format_stat(stat) for stat in stats[: cng.MEMTRACE_TOP] if stat.size_diff > 0]
+
+    def top_growth(self, limit: Optional[int] = None) -> List[tracemalloc.StatisticDiff]:
+        """Allocation sites that grew the most since the tracker started"""
+        stats = _snapshot().compare_to(self.baseline, "lineno")
+        return [stat for stat in stats[: limit or cng.MEMTRACE_TOP] if stat.size_diff > 0]
+
+    def summary(self) -> Dict[str, dict]:
+        """Memory deltas (in bytes) per case, summed over all calls of the case"""
+        return {case: dict(record) for case, record in self.cases.items()}
+
+    def print_report(self):
+        print(strings.BOLD + "Memory growth per case (summed over calls)" + strings.END)
+        for case, record in self.cases.items():
+            print(
+                f"  {case}: {record['calls']} call(s), RSS {record['rss_delta'] / 1024:+.1f} KiB, "
+                f"traced {record['traced_delta'] / 1024:+.1f} KiB"
+            )
+        print()
+        print(
+            strings.BOLD
+            + f"Top allocation sites since start (RSS {(get_rss() - self.start_rss) / 1024:+.1f} KiB)"
+            + strings.END
+        )
+        for stat in self.top_growth():
+            print("  " + _format_stat(stat))
+
+    def stop(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+
+_tracker: Optional[MemoryTracker] = None
+
+
+def get_tracker() -> Optional[MemoryTracker]:
+    """The active memory tracker, None if memory tracing is disabled"""
+    return _tracker
+
+
+def start_tracker() -> MemoryTracker:
+    global _tracker
+    _tracker = MemoryTracker()
+    return _tracker
+
+
+def stop_tracker():
+    global _tracker
+    if _tracker is not None:
+        _tracker.stop()
+    _tracker = None
+
+
+def show_memory_report(*args, **kwargs) -> None:
+    """Special case that shows the memory report of the active tracker"""
+    if _tracker is None:
+        print("Memory tracing is not enabled")
+    else:
+        _tracker.print_report()
+    print()
+    print(strings.INPUT_WAIT_PROMPT_MSG)
+    input()
@@ -4,13 +4,15 @@ menu()
 """
 
 from importlib.util import find_spec
-from time import sleep
+from inspect import unwrap
+from time import perf_counter, sleep
 from types import FunctionType, ModuleType
 from typing import Any, Callable, Dict, Iterable, List, Optional, Union, Sequence
 
 from meny import config as cng
 from meny import strings
-from meny.funcmap import construct_funcmap
+from meny import memtrace, recording, tracing
+from meny.funcmap import CaseIndex, construct_funcmap
 from meny.utils import (
     _assert_supported,
     extract_and_preprocess_functions,
@@ -18,8 +20,14 @@ from meny.utils import (
     input_splitter,
     clear_screen,
 )
-from meny.infos import _error_info_parse, print_help
-from meny.exceptions import MenuQuit
+from meny.history import History, get_history
+from meny.session import Session, _session, current_session
+from meny.batch import MAP, Batch
+from meny.output import OutputBuffer, capture_output
+from meny.infos import _error_info_case, _error_info_parse, print_help
+from meny.workers import WorkerPool, in_worker
+from meny.exceptions import MenuError, MenuQuit
+from meny.cancellation import nested_menu
 import os
 
 
@@ -58,6 +66,12 @@ def _menu_curses(instance) -> str:
     return curses_interface.interface(instance)
 
 
+def _cases_source(cases: List[FunctionType]) -> str:
+    """Source file of the first case, used to tell apart menus with the same title"""
+    code = getattr(unwrap(cases[0]), "__code__", None)
+    return code.co_filename if code is not None else ""
+
+
 def _restart() -> None:
     """
     Restart application
@@ -68,15 +82,14 @@ def _restart() -> None:
     os.execv(sys.executable, [sys.executable] + sys.argv)
 
 
+PIPE = "|"
+
+
 class Menu:
     """
     Command Line Interface class
     """
 
-    _return: Optional[dict] = None
-    _depth: int = 0
-    _return_mode: Optional[str] = None
-
     def __init__(
         self,
         cases: Iterable[FunctionType],
@@ -90,6 +103,9 @@ class Menu:
         on_kbinterrupt: str,
         once: bool,
         return_mode: str,
+        executor: str = "inline",
+        timeout: Optional[float] = None,
+        memory_trace: bool = False,
     ):
         """
         Input
@@ -108,14 +124,27 @@ class Menu:
         _assert_supported(on_blank, "on_blank", ("return", "pass"))
         _assert_supported(frontend, "frontend", ("simple", "fancy", "auto"))
         _assert_supported(return_mode, "return_mode", ("flat", "tree"))
+        _assert_supported(executor, "executor", ("inline", "fork"))
 
         self.funcmap = construct_funcmap(cases, decorator=decorator)
+        self.case_index = CaseIndex(self.funcmap)
         self.title = title
         self.once = once
         self.on_kbinterrupt = on_kbinterrupt
         self.case_args = case_args
         self.case_kwargs = case_kwargs
+        self.return_mode = return_mode
+        self.timeout = timeout
+        self.memory_trace = memory_trace
         self.case: Optional[str] = None  # Last registered case entered
+        self.history: Optional[History] = None
+        if cng.DEFAULT_HISTORY:
+            self.history = get_history(title, _cases_source(cases))
+
+        # Cases run in forked worker processes if not inline. Nested menus in a worker run inline
+        self.worker_pool: Optional[WorkerPool] = None
+        if executor == "fork" and not in_worker():
+            self.worker_pool = WorkerPool(func for _, func in self.funcmap.values())
 
         if self.case_args is None:
             self.case_args = {}
@@ -129,6 +158,8 @@ class Menu:
 
         # Special options
         self.special_cases = {"..": self.on_blank, "q": _quit, "h": print_help, "r": _restart, "a": self.run_all_cases}
+        if memory_trace or memtrace.get_tracker() is not None:
+            self.special_cases["m"] = memtrace.show_memory_report
 
         if frontend == "auto":
             self._frontend = _menu_simple
@@ -140,17 +171,13 @@ class Menu:
         elif frontend == "simple":
             self._frontend = _menu_simple
 
-        if Menu._return_mode is None:
-            Menu._return_mode = return_mode
+        # Output of cases, shown in the output pane of the fancy frontend
+        self.output: Optional[OutputBuffer] = None
+        if cng.CAPTURE_OUTPUT and self._frontend is _menu_curses:
+            self.output = OutputBuffer()
 
-        if Menu._return_mode == "flat":
-            from meny.casehandlers import _FlatHandler
-
-            self._case_handler: Callable = _FlatHandler()
-        elif Menu._return_mode == "tree":
-            from meny.casehandlers import _TreeHandler
-
-            self._case_handler: Callable = _TreeHandler()
+        # Decided when the menu runs, as nested menus use the return mode of the root menu
+        self._case_handler: Optional[Callable] = None
 
     def _deactivate(self):
         self.active = False
@@ -159,50 +186,149 @@ class Menu:
         """
         Menu loop
         """
+        depth = current_session().depth
         while self.active:
-            inputstring: str = self._frontend(self)
+            asked = perf_counter()
+            if recording._replayer is not None:
+                inputstring = recording._replayer.next_input(self, depth)
+            else:
+                inputstring: str = self._frontend(self)
 
-            if cng.DEFAULT_CLEAR:
-                clear_screen()
+            with recording.step(self, depth, inputstring, perf_counter() - asked):
+                self._handle_input(inputstring)
 
-            if (not inputstring) or inputstring == "\n":
-                self.on_blank()
-                continue
+    def _handle_input(self, inputstring: str):
+        """
+        Handles an input line given to the menu
+        """
+        if cng.DEFAULT_CLEAR:
+            clear_screen()
 
-            # Tokenize input
-            try:
-                inputlist: List[str] = input_splitter(inputstring)
-            except ValueError as e:  # E.g. missing closing quotation or something
-                _error_info_parse(e)
-                continue
-
-            # Get case
-            self.case = inputlist.pop(0)
-
-            # If self.case starts with '-', indicates reverse choice (like np.ndarray[-1])
-            if self.case.startswith("-"):
-                try:
-                    self.case = str(len(self.funcmap) + int(self.case) + 1)
-                except ValueError:
-                    pass
-
-            if self.case in self.funcmap:
-                # Obtain self.case function from funcmap and
-                # calls said function. Recall that items are
-                # (description, function), hence the [1]
-                casefunc = self.funcmap[self.case][1]
-                self._case_handler(self, casefunc, inputlist)
-            elif self.case in self.special_cases:
-                # Items in special_cases are not tuples, but the
-                # actual functions, so no need to do [1]
-                casefunc = self.special_cases[self.case]
-                self._case_handler(self, casefunc, inputlist)
+        if (not inputstring) or inputstring == "\n":
+            self.on_blank()
+            return
+
+        if self.history is not None and recording._replayer is None:
+            self.history.append(inputstring)
+
+        # Tokenize input
+        try:
+            inputlist: List[str] = input_splitter(inputstring)
+        except ValueError as e:  # E.g. missing closing quotation or something
+            _error_info_parse(e)
+            return
+
+        with capture_output(self.output):
+            self._dispatch(inputlist)
+
+        if self.once:
+            self._deactivate()
+
+    def _dispatch(self, inputlist: List[str]):
+        """
+        Runs the case, pipeline or map given as tokenized input
+        """
+        if inputlist[0] == MAP:
+            self._run_map(inputlist[1:])
+            return
+
+        if PIPE in inputlist:
+            self._run_pipeline(inputlist)
+            return
+
+        # Get case
+        self.case = inputlist.pop(0)
+        key = self.resolve_case(self.case)
+
+        if key is not None:
+            # Obtain self.case function from funcmap and
+            # calls said function. Recall that items are
+            # (description, function), hence the [1]
+            self.case = key
+            casefunc = self.funcmap[self.case][1]
+            self._case_handler(self, casefunc, inputlist)
+        elif self.case in self.special_cases:
+            # Items in special_cases are not tuples, but the
+            # actual functions, so no need to do [1]
+            casefunc = self.special_cases[self.case]
+            self._case_handler(self, casefunc, inputlist)
+        else:
+            print(strings.INVALID_TERMINAL_INPUT_MSG)
+            sleep(cng.MSG_WAIT_TIME)
+
+    def resolve_case(self, token: str) -> Optional[str]:
+        """
+        Returns the funcmap key of the case token refers to (key, reversed index, name or unique prefix
+        of name, see CaseIndex.resolve), or None if there is no such case or token is a special case
+        """
+        if token in self.special_cases:
+            return None
+        return self.case_index.resolve(token)
+
+    def _run_pipeline(self, inputlist: List[str]):
+        """
+        Runs pipeline given as input, e.g. 3 "q1" | 5 | 7 10, where every stage gets the return value of
+        the previous stage as its first argument
+        """
+        tokens: List[List[str]] = [[]]
+        for token in inputlist:
+            if token == PIPE:
+                tokens.append([])
             else:
+                tokens[-1].append(token)
+
+        stages = []
+        for stage in tokens:
+            key = self.resolve_case(stage[0]) if stage else None
+            if key is None:
                 print(strings.INVALID_TERMINAL_INPUT_MSG)
                 sleep(cng.MSG_WAIT_TIME)
+                return
+            stages.append((self.funcmap[key][1], stage[1:]))
+            self.case = key
+        self._case_handler.pipe(self, stages)
+
+    def _run_map(self, tokens: List[str]):
+        """
+        Runs a case for every row of an argument source, given as input like: map <case> [source] [concurrency],
+        see meny.batch
+        """
+        key = self.resolve_case(tokens[0]) if tokens else None
+        source, concurrency = tokens[1:2], tokens[2:]
+        if source and source[0].isdigit() and not concurrency:  # Only concurrency is given
+            source, concurrency = [], source
+        if key is None or len(tokens) > 3 or not all(token.isdigit() for token in concurrency):
+            print(strings.INVALID_TERMINAL_INPUT_MSG)
+            sleep(cng.MSG_WAIT_TIME)
+            return
+        self.case = key
+        casefunc = self.funcmap[key][1]
+
+        try:
+            batch = Batch.from_source(casefunc, source[0] if source else None, self)
+        except MenuError as e:
+            _error_info_case(e, casefunc)
+            return
+        if concurrency:
+            batch.concurrency = max(int(concurrency[0]), 1)
+        self._case_handler(self, casefunc, [batch])
+
+    def run_case(self, case: str, args: List[str]) -> Any:
+        """
+        Runs a single case without the menu loop, that is no frontend is used. Errors are raised
+        instead of being displayed.
+
+        case: key, reversed index (e.g. "-1"), name or unique prefix of name of case
+        args: argument strings, converted with the same rules as input given in the menu
+        """
+        # Import here to fix circular imports
+        from meny.casehandlers import _handle_casefunc
 
-            if self.once:
-                self._deactivate()
+        key = self.case_index.resolve(case)
+        if key is None:
+            raise MenuError(f"Could not find case {case!r}, available cases are: {list(self.funcmap)}")
+        self.case = key
+        return _handle_casefunc(self.funcmap[key][1], args, self)
 
     def run_all_cases(self):
         for case in self.funcmap.values():
@@ -214,28 +340,55 @@ class Menu:
         - call menu loop
         - handle MenuQuit and KeyboardInterrupt
         - count depth
+        - start a new session if this is a root menu, nested menus run in the session of the root menu
+        - hold the case that opened the menu if it is nested, see nested_menu
         """
         os.system("")  # Said to enable asci escape codes in terminal
         self.active = True
-        Menu._depth += 1
 
-        try:
-            self._menu_loop()
-        except KeyboardInterrupt:
-            if self.on_kbinterrupt == "raise":
-                self._deactivate()
-                raise
-            elif self.on_kbinterrupt == "return":
-                print()
-        except MenuQuit:
-            if Menu._depth > 1:
-                raise
-        finally:
-            Menu._depth -= 1
-            if Menu._depth == 0:
-                Menu._return_mode = None
-
-        return Menu._return or {}
+        with nested_menu():
+            session = current_session()
+            session_token = None
+            if session is None or session.depth == 0:
+                session = Session(self.return_mode)
+                session_token = _session.set(session)
+            session.depth += 1
+
+            # Import here to fix circular imports
+            from meny.casehandlers import _FlatHandler, _TreeHandler
+
+            self._case_handler = _FlatHandler() if session.return_mode == "flat" else _TreeHandler()
+
+            # The outermost menu with memory_trace=True owns the tracker, nested menus use it as well
+            tracker = None
+            if self.memory_trace and memtrace.get_tracker() is None:
+                tracker = memtrace.start_tracker()
+
+            try:
+                with tracing.span(self.title.strip(), "menu", depth=session.depth):
+                    self._menu_loop()
+            except KeyboardInterrupt:
+                if self.on_kbinterrupt == "raise":
+                    self._deactivate()
+                    raise
+                elif self.on_kbinterrupt == "return":
+                    print()
+            except MenuQuit:
+                if session.depth > 1:
+                    raise
+            finally:
+                if self.worker_pool is not None:
+                    self.worker_pool.close()
+                session.depth -= 1
+                if session_token is not None:
+                    _session.reset(session_token)
+                if tracker is not None:
+                    memtrace.stop_tracker()
+
+        returns = session.returns or {}
+        if tracker is not None:
+            returns = {**returns, cng._MEMORY_KEY: tracker.summary()}
+        return returns
 
 
 def build_menu(
@@ -250,6 +403,9 @@ def build_menu(
     on_kbinterrupt: Optional[str] = None,
     once: Optional[bool] = None,
     return_mode: Optional[str] = None,
+    executor: Optional[str] = None,
+    timeout: Optional[float] = None,
+    memory_trace: bool = False,
 ) -> Menu:
     """
     This is a factory for the Menu class to reduce boilerplate.
@@ -291,6 +447,9 @@ def build_menu(
         on_kbinterrupt=on_kbinterrupt or cng.DEFAULT_ON_INTERRUPT,
         once=once,
         return_mode=return_mode or cng.DEFAULT_RETURN_MODE,
+        executor=executor or cng.DEFAULT_EXECUTOR,
+        timeout=timeout if timeout is not None else cng.DEFAULT_TIMEOUT,
+        memory_trace=memory_trace,
     )
 
 
@@ -306,6 +465,9 @@ def menu(
     on_kbinterrupt: Optional[str] = None,
     once: Optional[bool] = None,
     return_mode: Optional[str] = None,
+    executor: Optional[str] = None,
+    timeout: Optional[float] = None,
+    memory_trace: bool = False,
 ) -> Dict[str, Any]:
     """
     Factory function for the CLI class. This function initializes a menu.
@@ -315,6 +477,8 @@ def menu(
         - `Dict[str, FunctionType]`: a dictionary where keys are functions names and values are functions
         - `Iterable[FunctionType]` an iterable of functions
         - `ModuleType`: a module containing functions
+        Use `meny.get_package_cases(package)` to also get the submodules of a package as submenus, which are
+        imported when opened.
 
     - `title`: title of menu
 
@@ -351,6 +515,25 @@ def menu(
         - `"tree"`: Returns a nested dictionary structure, representing the structure of nested menus
                   (if you have that).
 
+    - `executor`: where to run the case functions:
+        - `"inline"`: In the menu process (default)
+        - `"fork"`: In a pool of worker processes forked from the menu process (requires `os.fork`, i.e. not
+                  Windows). A case that crashes, leaks memory or calls `sys.exit` will then not take down the
+                  menu. Arguments and return values must be picklable. Workers are recycled after
+                  `meny.config.WORKER_MAX_CALLS` calls or when using more than `meny.config.WORKER_MAX_RSS`
+                  bytes of memory.
+
+    - `timeout`: Default timeout in seconds for the cases in the menu (can be overridden per case with the
+        `meny.timeout` decorator). A case that times out, or is interrupted with Ctrl-C, is cancelled and its
+        return value will be a `meny.CaseCancelled` exception. Cases with a timeout run in a separate thread,
+        and can check `meny.cancellation_token()` to stop when cancelled. Cases that run in worker processes
+        are killed when cancelled.
+
+    - `memory_trace`: If `True`, tracemalloc snapshots are taken around every case call (also in nested menus),
+        and the change in resident memory and traced memory per case is added to the returned dictionary
+        under the key `"__meny_memory__"`. Enter `m` in the menu to see the allocation sites that have grown
+        the most since the menu started. Makes case calls considerably slower, so only use it for debugging.
+
     ## Returns
     `Dict[str, Any]`: Dictionary where functions names are keys, and values are anything. Represents return
     values of case functions.
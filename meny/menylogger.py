@@ -1,5 +1,23 @@
+"""
+Logging of meny internals.
+
+getLogger gives a logger a single handler, however many times it is called for the same name. The
+handler formats records in the thread that logs them, as colored text or as JSON lines (see
+set_log_format), and puts them on a queue. A listener thread writes them to stderr, such that
+writing logs never blocks the menu loop.
+"""
+
+import atexit
+import json
 import logging
-from typing import Optional
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Union
+
+from meny.session import current_session
+from meny.utils import RE_ANSI, _assert_supported
 
 DEBUG = logging.DEBUG
 INFO = logging.INFO
@@ -15,6 +33,8 @@ RED = '\x1b[31m'
 BOLD_RED = '\x1b[31;1m'
 RESET = '\x1b[0m'
 
+LOG_FORMATS = ("text", "json")
+
 class CustomFormatter(logging.Formatter):
 
     def __init__(self, fmt):
@@ -27,20 +47,112 @@ class CustomFormatter(logging.Formatter):
             logging.ERROR: RED + "[%(levelname)s] " + RESET + self.fmt + RESET,
             logging.CRITICAL: BOLD_RED + "[%(levelname)s] "+ RESET + self.fmt + RESET
         }
+        # Created once rather than for every record
+        self.formatters = {level: logging.Formatter(log_fmt) for level, log_fmt in self.formats.items()}
+        self.default_formatter = logging.Formatter()
 
     def format(self, record):
-        log_fmt = self.formats.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        return self.formatters.get(record.levelno, self.default_formatter).format(record)
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as JSON lines with time, level, logger and message, and the case, menu, menu depth
+    and duration, which are given as extra fields of the record (e.g. logger.info(..., extra={"case": name})).
+    The depth is that of the current menu session if not given.
+    """
+
+    FIELDS = ("case", "menu", "depth", "duration")
+
+    def format(self, record):
+        line = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": RE_ANSI.sub("", record.getMessage()),
+        }
+        for field in self.FIELDS:
+            line[field] = getattr(record, field, None)
+        if line["depth"] is None:
+            session = current_session()
+            line["depth"] = 0 if session is None else session.depth
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=repr)
+
+_json_formatter = JsonFormatter()
+_log_format = "text"
+
+# Records are put on _queue by the handlers of the loggers, and written to stderr by _listener
+_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler()
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+_loggers: Dict[str, logging.Logger] = {}
+
+class _QueueHandler(QueueHandler):
+    """Formats records in the thread that logs them, and leaves writing them to the listener thread"""
+
+    def format(self, record):
+        formatter = _json_formatter if _log_format == "json" else self.formatter
         return formatter.format(record)
 
+    def enqueue(self, record):
+        if _listener is None:
+            _start_listener()
+        _queue.put_nowait(record)  # Not self.queue, which is replaced in forked processes
+
+def _start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = QueueListener(_queue, _stream_handler)
+            _listener.start()
+
+def flush_logs():
+    """Waits until the logged records have been written, the listener thread is started again when needed"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def _forget_listener():
+    """The listener thread does not exist in a forked process, which gets a queue and listener of its own"""
+    global _queue, _listener, _listener_lock
+    _queue = queue.SimpleQueue()
+    _listener = None
+    _listener_lock = threading.Lock()
+
+atexit.register(flush_logs)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_listener)
+
 def getLogger(name: str, level: int, fmt: Optional[str] = None):
+    """
+    Logger with a handler that writes to stderr from the listener thread. Calling it again for the same
+    name sets the level and format of the existing handler rather than adding another.
+    """
     if fmt is None:
         fmt = '%(message)s'
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    stdout_handler = logging.StreamHandler()
-    stdout_handler.setLevel(level)
-    stdout_handler.setFormatter(CustomFormatter(fmt))
-    logger.addHandler(stdout_handler)
+    handler = next((handler for handler in logger.handlers if isinstance(handler, _QueueHandler)), None)
+    if handler is None:
+        handler = _QueueHandler(_queue)
+        logger.addHandler(handler)
+    if not (isinstance(handler.formatter, CustomFormatter) and handler.formatter.fmt == fmt):
+        handler.setFormatter(CustomFormatter(fmt))
+    _loggers[name] = logger
     return logger
+
+def set_log_level(level: Union[int, str]):
+    """Sets the level of all loggers from getLogger, e.g. to DEBUG to log the duration of every case"""
+    for logger in _loggers.values():
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+def set_log_format(log_format: str):
+    """Format of all loggers from getLogger, "text" (default) or "json" for JSON lines"""
+    global _log_format
+    _assert_supported(log_format, "log_format", LOG_FORMATS)
+    _log_format = log_format
@@ -0,0 +1,160 @@
+"""
+Metrics for case calls: number of calls, errors by exception type and latency histograms per case.
+
+Metrics are disabled by default. When enabled with enable_metrics, they can be written as a
+Prometheus text file (e.g. for the textfile collector of node_exporter), which is rewritten
+atomically after every case call, and as JSON lines that are appended for every call.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+# Same as the default buckets of the official Prometheus clients, extended with larger buckets
+# since cases are often long running
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10, 30, 60, 300, 900)
+
+PathLike = Union[str, Path]
+
+
+class _CaseMetrics:
+    def __init__(self, n_buckets: int):
+        self.calls = 0
+        self.errors: Dict[str, int] = {}
+        self.bucket_counts = [0] * n_buckets
+        self.duration_sum = 0.0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Collects metrics of case calls, see enable_metrics"""
+
+    def __init__(
+        self,
+        prometheus_path: Optional[PathLike] = None,
+        jsonl_path: Optional[PathLike] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.prometheus_path = None if prometheus_path is None else Path(prometheus_path)
+        self.buckets = tuple(sorted(buckets))
+        self._cases: Dict[Tuple[str, str], _CaseMetrics] = {}
+        self._lock = threading.Lock()
+        self._jsonl = None
+        if jsonl_path is not None:
+            self._jsonl = open(jsonl_path, "a", encoding="utf-8", buffering=1)
+
+    def observe(self, menu: str, case: str, duration: float, error: Optional[BaseException] = None):
+        """
+        Record a call of case in menu that took duration seconds, and raised error if not None. Writing the
+        files is best-effort: OSErrors are ignored.
+        """
+        with self._lock:
+            metrics = self._cases.get((menu, case))
+            if metrics is None:
+                metrics = self._cases[(menu, case)] = _CaseMetrics(len(self.buckets))
+            metrics.calls += 1
+            metrics.duration_sum += duration
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    metrics.bucket_counts[i] += 1
+                    break
+            if error is not None:
+                name = type(error).__name__
+                metrics.errors[name] = metrics.errors.get(name, 0) + 1
+
+            if self._jsonl is not None:
+                record = {
+                    "time": time.time(),
+                    "menu": menu,
+                    "case": case,
+                    "duration": duration,
+                    "error": None if error is None else type(error).__name__,
+                }
+                try:
+                    self._jsonl.write(json.dumps(record) + "\n")
+                except OSError:
+                    pass  # Failing to write metrics must not fail the case, e.g. when the disk is full
+
+            if self.prometheus_path is not None:
+                try:
+                    self.write_prometheus()
+                except OSError:
+                    pass  # The counters are kept, and the file is rewritten after the next call
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        calls = ["# HELP meny_case_calls_total Number of case calls", "# TYPE meny_case_calls_total counter"]
+        errors = [
+            "# HELP meny_case_errors_total Number of case calls that raised an exception, by exception type",
+            "# TYPE meny_case_errors_total counter",
+        ]
+        durations = [
+            "# HELP meny_case_duration_seconds Duration of case calls",
+            "# TYPE meny_case_duration_seconds histogram",
+        ]
+        for (menu, case), metrics in self._cases.items():
+            labels = f'menu="{_escape(menu)}",case="{_escape(case)}"'
+            calls.append(f"meny_case_calls_total{{{labels}}} {metrics.calls}")
+            for exception, count in metrics.errors.items():
+                errors.append(f'meny_case_errors_total{{{labels},exception="{_escape(exception)}"}} {count}')
+            cumulative = 0
+            for bound, count in zip(self.buckets, metrics.bucket_counts):
+                cumulative += count
+                durations.append(f'meny_case_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            durations.append(f'meny_case_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.calls}')
+            durations.append(f"meny_case_duration_seconds_sum{{{labels}}} {metrics.duration_sum}")
+            durations.append(f"meny_case_duration_seconds_count{{{labels}}} {metrics.calls}")
+        return "\n".join(calls + errors + durations) + "\n"
+
+    def write_prometheus(self):
+        """Writes metrics to prometheus_path atomically, such that readers never see a partial file"""
+        tmp = self.prometheus_path.with_name(f".{self.prometheus_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, self.prometheus_path)
+
+    def close(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+
+_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Optional[Metrics]:
+    """The enabled metrics, None if metrics are disabled"""
+    return _metrics
+
+
+def enable_metrics(
+    prometheus_path: Optional[PathLike] = None,
+    jsonl_path: Optional[PathLike] = None,
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Metrics:
+    """
+    Start collecting metrics for all case calls
+
+    prometheus_path: if given, metrics are written to this file in the Prometheus text format after
+                     every case call
+    jsonl_path: if given, a JSON line with menu, case, duration and error is appended to this file for
+                every case call
+    buckets: upper bounds in seconds of the latency histogram buckets
+    """
+    global _metrics
+    disable_metrics()
+    _metrics = Metrics(prometheus_path, jsonl_path, buckets)
+    return _metrics
+
+
+def disable_metrics():
+    global _metrics
+    if _metrics is not None:
+        _metrics.close()
+    _metrics = None
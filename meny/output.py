@@ -0,0 +1,142 @@
+"""
+Capture of the output of cases, shown in the output pane of the fancy frontend.
+
+While a case runs, sys.stdout and sys.stderr are replaced with streams that write to the terminal as
+usual and to an OutputBuffer, a ring buffer that keeps the most recent lines up to a number of lines
+and characters, such that a case that prints millions of lines cannot exhaust memory. Output written
+directly to the file descriptors, e.g. by subprocesses and worker processes, is not captured, such
+that interactive programs keep their terminal.
+"""
+
+import io
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, List, Optional
+
+from meny import config as cng
+from meny.utils import RE_ANSI
+
+
+def _clean(line: str) -> str:
+    """Line as it would appear in a terminal, without escape codes and overwritten text (e.g. progress bars)"""
+    line = line.rstrip("\r")
+    line = line[line.rfind("\r") + 1 :]
+    return RE_ANSI.sub("", line).replace("\x00", "").expandtabs()
+
+
+class OutputBuffer:
+    """Keeps the most recent lines of output, at most max_lines lines and max_chars characters"""
+
+    def __init__(self, max_lines: Optional[int] = None, max_chars: Optional[int] = None):
+        self.max_lines = max_lines or cng.OUTPUT_MAX_LINES
+        self.max_chars = max_chars or cng.OUTPUT_MAX_CHARS
+        self.dropped = 0  # Number of lines dropped to stay within the limits
+        self._lines: Deque[str] = deque()
+        self._size = 0
+        self._partial: List[str] = []  # Chunks of the last line, which has not ended yet
+        self._partial_size = 0
+        self._lock = threading.Lock()
+
+    def write(self, text: str):
+        with self._lock:
+            if "\n" not in text:
+                self._partial.append(text)
+                self._partial_size += len(text)
+                if self._partial_size > self.max_chars:
+                    self._partial = ["".join(self._partial)[-self.max_chars :]]
+                    self._partial_size = len(self._partial[0])
+                return
+
+            *lines, last = text.split("\n")
+            last = last[-self.max_chars :]
+            if self._partial:
+                lines[0] = "".join(self._partial) + lines[0]
+            self._partial = [last] if last else []
+            self._partial_size = len(last)
+            if len(lines) > self.max_lines:
+                self.dropped += len(lines) - self.max_lines
+                lines = lines[-self.max_lines :]
+            for line in lines:
+                self._append(line[-self.max_chars :])
+
+    def _append(self, line: str):
+        if len(self._lines) == self.max_lines:
+            self._size -= len(self._lines.popleft())
+            self.dropped += 1
+        self._lines.append(line)
+        self._size += len(line)
+        while self._size > self.max_chars:
+            self._size -= len(self._lines.popleft())
+            self.dropped += 1
+
+    def __len__(self) -> int:
+        return len(self._lines) + bool(self._partial)
+
+    def tail(self, n: int, skip: int = 0) -> List[str]:
+        """The n lines before the last skip lines, cleaned of escape codes"""
+        with self._lock:
+            lines = list(self._lines)[-(n + skip) :] if n + skip > 0 else []
+            if self._partial:
+                lines = (lines + ["".join(self._partial)])[-(n + skip) :]
+        return [_clean(line) for line in lines[: max(len(lines) - skip, 0)]]
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._size = 0
+            self._partial = []
+            self._partial_size = 0
+            self.dropped = 0
+
+
+class TeeStream(io.TextIOBase):
+    """
+    Text stream that writes to stream and to capture. The binary buffer, encoding and errors are those of stream,
+    such that bytes written to the buffer (e.g. sys.stdout.buffer.write) go to stream only and are not captured
+    """
+
+    def __init__(self, stream, capture: OutputBuffer):
+        self.stream = stream
+        self._capture = capture
+
+    def write(self, text: str) -> int:
+        self.stream.write(text)
+        self._capture.write(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self) -> bool:
+        return self.stream.isatty()
+
+    def fileno(self) -> int:
+        return self.stream.fileno()
+
+    @property
+    def buffer(self):
+        return self.stream.buffer  # AttributeError if stream has no binary buffer, like io.StringIO
+
+    @property
+    def encoding(self):
+        return getattr(self.stream, "encoding", "utf-8")
+
+    @property
+    def errors(self):
+        return getattr(self.stream, "errors", None)
+
+
+@contextmanager
+def capture_output(buffer: Optional[OutputBuffer]) -> Iterator[None]:
+    """Writes sys.stdout and sys.stderr to buffer as well within the with block, does nothing if buffer is None"""
+    if buffer is None:
+        yield
+        return
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = TeeStream(stdout, buffer), TeeStream(stderr, buffer)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
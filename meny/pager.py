@@ -0,0 +1,313 @@
+"""
+Pager for output that does not fit on the screen: return values printed by the meny command, streamed
+results of cases (see meny.streaming) and the output pane of the fancy frontend (Ctrl-F).
+
+Lines are taken from their source only as far as they are shown or searched, and lines from iterators
+are spilled to a temporary file. The offsets of the lines are indexed as they are read, such that
+output of any size can be paged, searched and jumped in without holding it in memory.
+
+Keys: q quit, arrows / j k scroll a line, space / b / PgDn / PgUp scroll a page, g / G go to the top /
+bottom, / and ? search forwards and backwards, n / N repeat the search, : go to a line.
+"""
+
+import pprint
+import re
+import shutil
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Union
+
+from meny import config as cng
+from meny.output import _clean
+
+# Number of lines read at a time when searching
+SEARCH_BLOCK = 1024
+# Bytes read at a time when indexing a file
+READ_BLOCK = 1 << 20
+
+
+def _text_lines(items: Iterable[Any]) -> Iterator[str]:
+    for item in items:
+        yield from str(item).split("\n")
+
+
+class LineIndex:
+    """
+    Lines of a file, or of an iterable of lines or items (shown with str) that is spilled to a temporary
+    file, with the offsets of the lines indexed as far as they have been read
+    """
+
+    def __init__(self, source: Union[str, Path, Iterable[Any]]):
+        if isinstance(source, (str, Path)):
+            self._file = open(source, "rb")
+            self._lines: Optional[Iterator[str]] = None
+        else:
+            self._file = tempfile.TemporaryFile()
+            self._lines = _text_lines(source)
+        self.offsets = array("Q", [0])  # Offset of every line, and of the end of the last line
+        self.complete = False  # Whether all lines have been indexed
+        self._end = 0  # Offset up to which the file has been read when indexing a file
+
+    def __len__(self) -> int:
+        """Number of lines indexed so far, all lines if complete"""
+        return len(self.offsets) - 1
+
+    def ensure(self, n: Optional[int] = None) -> int:
+        """Indexes lines until there are n lines (all lines if n is None), returns the number of lines indexed"""
+        while not self.complete and (n is None or len(self) < n):
+            if self._lines is None:
+                self._index_file()
+            else:
+                self._spill(n)
+        return len(self)
+
+    def _index_file(self):
+        self._file.seek(self._end)
+        block = self._file.read(READ_BLOCK)
+        if not block:
+            if self._end > self.offsets[-1]:  # Last line without newline
+                self.offsets.append(self._end)
+            self.complete = True
+            return
+        start = 0
+        while True:
+            newline = block.find(b"\n", start)
+            if newline == -1:
+                break
+            self.offsets.append(self._end + newline + 1)
+            start = newline + 1
+        self._end += len(block)
+
+    def _spill(self, n: Optional[int]):
+        self._file.seek(0, 2)
+        for _ in range(SEARCH_BLOCK if n is None else max(n - len(self), 1)):
+            line = next(self._lines, None)
+            if line is None:
+                self.complete = True
+                break
+            data = line.encode("utf-8", "replace") + b"\n"
+            self._file.write(data)
+            self.offsets.append(self.offsets[-1] + len(data))
+
+    def lines(self, start: int, stop: int) -> List[str]:
+        """Lines from start up to stop, or up to the last line"""
+        stop = min(self.ensure(stop), stop)
+        if start >= stop:
+            return []
+        self._file.seek(self.offsets[start])
+        data = self._file.read(self.offsets[stop] - self.offsets[start])
+        return [line.rstrip("\r") for line in data.decode("utf-8", "replace").split("\n")[: stop - start]]
+
+    def search(self, pattern: "re.Pattern", start: int, backwards: bool = False) -> Optional[int]:
+        """Number of the first line from start (or the last line up to start if backwards) that matches pattern"""
+        if backwards:
+            stop = min(start + 1, self.ensure(start + 1))
+            while stop > 0:
+                begin = max(stop - SEARCH_BLOCK, 0)
+                for i, line in reversed(list(enumerate(self.lines(begin, stop), begin))):
+                    if pattern.search(line):
+                        return i
+                stop = begin
+            return None
+        while True:
+            lines = self.lines(start, start + SEARCH_BLOCK)
+            for i, line in enumerate(lines, start):
+                if pattern.search(line):
+                    return i
+            if not lines:
+                return None
+            start += len(lines)
+
+    def close(self):
+        self._file.close()
+
+
+class Pager:
+    """Shows the lines of a LineIndex on a curses window, see the module docstring for the keys"""
+
+    def __init__(self, index: LineIndex, title: str = ""):
+        self.index = index
+        self.title = title
+        self.top = 0  # First line shown
+        self.pattern: Optional["re.Pattern"] = None
+        self.message = ""
+
+    def run(self, window: "curses._CursesWindow"):
+        window.keypad(True)
+        while True:
+            self.draw(window)
+            if not self.handle(window, window.get_wch(), window.getmaxyx()[0] - 1):
+                return
+
+    def draw(self, window: "curses._CursesWindow"):
+        import curses
+
+        rows, cols = window.getmaxyx()
+        lines = self.index.lines(self.top, self.top + rows - 1)
+        window.erase()
+        for y, line in enumerate(lines):
+            line = _clean(line)[: cols - 1]
+            if self.pattern is not None and self.pattern.search(line):
+                window.addstr(y, 0, line, curses.A_BOLD)
+            else:
+                window.addstr(y, 0, line)
+        total = f"{len(self.index)}" if self.index.complete else f"{len(self.index)}+"
+        status = f"{self.title}  lines {self.top + 1}-{self.top + len(lines)} of {total}"
+        status += f"  {self.message}" if self.message else "  (q quit, / ? search, n N next, : line)"
+        window.addstr(rows - 1, 0, status[: cols - 1], curses.A_REVERSE)
+        window.refresh()
+
+    def prompt(self, window: "curses._CursesWindow", prefix: str) -> Optional[str]:
+        """Reads a line at the bottom of the window, None if cancelled with escape"""
+        import curses
+
+        rows, cols = window.getmaxyx()
+        text = ""
+        while True:
+            window.move(rows - 1, 0)
+            window.clrtoeol()
+            window.addstr(rows - 1, 0, (prefix + text)[-(cols - 1) :])
+            window.refresh()
+            k = window.get_wch()
+            if k in ("\n", "\r", curses.KEY_ENTER):
+                return text
+            if k == "\x1b":
+                return None
+            if k in ("\x7f", "\b", curses.KEY_BACKSPACE):
+                text = text[:-1]
+            elif isinstance(k, str) and k.isprintable():
+                text += k
+
+    def scroll_to(self, line: int, page: int):
+        """Scrolls such that line is the first line shown, without scrolling past the last page"""
+        self.top = max(min(line, self.index.ensure(line + page) - page), 0)
+
+    def find(self, backwards: bool):
+        if self.pattern is None:
+            self.message = "No search"
+            return
+        start = self.top - 1 if backwards else self.top + 1
+        found = self.index.search(self.pattern, start, backwards) if start >= 0 else None
+        if found is None:
+            self.message = f"Pattern not found: {self.pattern.pattern}"
+        else:
+            self.top = found
+
+    def handle(self, window: "curses._CursesWindow", k, page: int) -> bool:
+        """Handles key k, returns False if the pager should quit"""
+        import curses
+
+        self.message = ""
+        if k in ("q", "Q", "\x1b"):
+            return False
+        if k in ("j", "\n", curses.KEY_DOWN):
+            self.scroll_to(self.top + 1, page)
+        elif k in ("k", curses.KEY_UP):
+            self.scroll_to(self.top - 1, page)
+        elif k in (" ", "f", curses.KEY_NPAGE):
+            self.scroll_to(self.top + page, page)
+        elif k in ("b", curses.KEY_PPAGE):
+            self.scroll_to(self.top - page, page)
+        elif k in ("g", curses.KEY_HOME):
+            self.top = 0
+        elif k in ("G", curses.KEY_END):
+            self.scroll_to(self.index.ensure(), page)
+        elif k in ("/", "?"):
+            query = self.prompt(window, k)
+            if query:
+                try:
+                    self.pattern = re.compile(query)
+                except re.error as e:
+                    self.message = f"Invalid pattern: {e}"
+                    return True
+                self.find(backwards=k == "?")
+        elif k in ("n", "N"):
+            self.find(backwards=k == "N")
+        elif k == ":":
+            line = self.prompt(window, ":")
+            if line and line.strip().isdigit():
+                self.scroll_to(int(line) - 1, page)
+        return True
+
+
+def _has_curses() -> bool:
+    # curses is imported only when paging, such that e.g. running a case directly does not import it
+    try:
+        import curses
+    except ImportError:  # E.g. Windows without windows-curses
+        return False
+    return True
+
+
+def enabled() -> bool:
+    """Whether output is paged, which requires curses and that stdout is a terminal"""
+    return cng.PAGER and sys.stdout.isatty() and sys.stdin.isatty() and _has_curses()
+
+
+def page(
+    source: Union[str, Path, Iterable[Any]], title: str = "", fallback: Optional[Callable[[], None]] = None
+) -> bool:
+    """
+    Shows source (the path of a file, or an iterable of lines or items) in the pager if it has more lines
+    than fit on the screen. Else it is printed, or fallback is called instead if given. Without fallback,
+    lines are printed as they arrive until they fill the screen. Lines are not read further than shown.
+
+    Returns whether the pager was used.
+    """
+    if not enabled():
+        if fallback is not None:
+            fallback()
+        elif isinstance(source, (str, Path)):
+            with open(source, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    print(line, end="")
+        else:
+            for line in _text_lines(source):
+                print(line)
+        return False
+
+    index = LineIndex(source)
+    try:
+        rows = shutil.get_terminal_size().lines
+        if fallback is not None:
+            if index.ensure(rows) < rows:
+                fallback()
+                return False
+        else:
+            # Lines are printed as they arrive until they fill the screen, e.g. for slow generators
+            for i in range(rows - 1):
+                if index.ensure(i + 1) <= i:
+                    return False
+                print(index.lines(i, i + 1)[0], flush=True)
+            if index.ensure(rows) < rows:
+                return False
+        sys.stdout.flush()
+        import curses
+
+        curses.wrapper(Pager(index, title).run)
+        return True
+    finally:
+        index.close()
+
+
+def pformat_lines(value: Any) -> Iterator[str]:
+    """
+    Lines of pprint.pformat(value), except that dicts, lists and tuples are formatted an item at a time,
+    such that large values are formatted as far as they are shown
+    """
+    if isinstance(value, dict):
+        opening, closing = "{", "}"
+        items: Iterable[str] = (f"{pprint.pformat(k)}: {pprint.pformat(v)}" for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        opening, closing = ("[", "]") if isinstance(value, list) else ("(", ")")
+        items = (pprint.pformat(v) for v in value)
+    else:
+        yield from pprint.pformat(value).split("\n")
+        return
+    yield opening
+    for item in items:
+        for line in f"{item},".split("\n"):
+            yield f" {line}"
+    yield closing
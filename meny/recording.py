@@ -0,0 +1,258 @@
+"""
+Recording and replay of menu sessions.
+
+When recording, a JSON line is written for every input line given to a menu (including blank input
+and special cases), with the depth of the menu, the time waited for the input, the time it took to
+handle the input and the outcome. A recording can be replayed, which feeds the input lines back to
+the menus without a frontend, either at the pace of the recording or as fast as possible, and
+compares the time every input takes with the recording:
+
+    meny cases.py --record session.jsonl
+    meny cases.py --replay session.jsonl --max-slowdown 1.5
+
+The duration of an input that opens a nested menu does not include the time spent waiting for input
+in the nested menu. Input read by cases themselves (e.g. with input()) is not recorded, the time
+waiting for it is part of the duration, and it is answered with empty lines when replaying.
+"""
+
+import io
+import itertools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import meny
+from meny import config as cng
+from meny.exceptions import MenuQuit
+
+PACES = ("fast", "original")
+
+
+class Recorder:
+    """Writes a JSON line for every input given to a menu, see enable_recording"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "w", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._steps = itertools.count()
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=repr) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _EmptyInput(io.TextIOBase):
+    """Stands in for sys.stdin when replaying, such that input() gets empty lines instead of blocking"""
+
+    def readable(self) -> bool:
+        return True
+
+    def readline(self, size: int = -1) -> str:
+        return "\n"
+
+    def isatty(self) -> bool:
+        return False
+
+
+class Replayer:
+    """Gives the input lines of a recording to menus, and keeps the time every input takes"""
+
+    def __init__(self, path: Union[str, Path], pace: str = "fast"):
+        if pace not in PACES:
+            raise ValueError(f"Unsupported pace {pace!r}, supported paces are {PACES}")
+        self.pace = pace
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        self.records: List[dict] = sorted(records, key=lambda record: record["step"])
+        self.position = 0
+        # Step of the recording the replay stopped at because the menus were not as in the recording
+        self.diverged: Optional[int] = None
+        self.replayed: Dict[int, Tuple[float, str]] = {}  # step: (duration, outcome)
+
+    def next_input(self, menu: "meny.Menu", depth: int) -> str:
+        """Next input line of the recording, raises MenuQuit when done or if the menus have changed"""
+        if self.position >= len(self.records):
+            raise MenuQuit
+        record = self.records[self.position]
+        if record["depth"] != depth or record["menu"] != menu.title.strip():
+            self.diverged = record["step"]
+            raise MenuQuit
+        if self.pace == "original":
+            time.sleep(record["wait"])
+        self.position += 1
+        return record["input"]
+
+    def report(self) -> List[dict]:
+        """Duration of every replayed input compared with the recording"""
+        rows = []
+        for record in self.records:
+            if record["step"] not in self.replayed:
+                continue
+            duration, outcome = self.replayed[record["step"]]
+            rows.append(
+                {
+                    "step": record["step"],
+                    "depth": record["depth"],
+                    "menu": record["menu"],
+                    "input": record["input"],
+                    "recorded": record["duration"],
+                    "replayed": duration,
+                    "delta": duration - record["duration"],
+                    "outcome": outcome,
+                    "recorded_outcome": record["outcome"],
+                }
+            )
+        return rows
+
+    def slower(self, max_slowdown: float) -> List[dict]:
+        """
+        Rows of the report of inputs that took more than max_slowdown times as long as in the recording.
+        Durations shorter than meny.config.REPLAY_MIN_DURATION are counted as that, to leave out noise.
+        """
+        return [
+            row
+            for row in self.report()
+            if row["replayed"] > max_slowdown * max(row["recorded"], cng.REPLAY_MIN_DURATION)
+        ]
+
+    def print_report(self, stream=None):
+        """Prints the report as a table, along with the total durations"""
+        stream = stream or sys.stdout
+        rows = self.report()
+        width = max([len(repr(row["input"])) for row in rows] + [5])
+        header = f"{'step':>4}  {'depth':>5}  {'input':<{width}}  {'recorded':>9}  {'replayed':>9}  {'delta':>9}"
+        print(header, file=stream)
+        for row in rows:
+            line = (
+                f"{row['step']:>4}  {row['depth']:>5}  {repr(row['input']):<{width}}  "
+                f"{row['recorded']:>8.3f}s  {row['replayed']:>8.3f}s  {row['delta']:>+8.3f}s"
+            )
+            if row["outcome"] != row["recorded_outcome"]:
+                line += f"  {row['recorded_outcome']} -> {row['outcome']}"
+            print(line, file=stream)
+        recorded = sum(row["recorded"] for row in rows)
+        replayed = sum(row["replayed"] for row in rows)
+        print(
+            f"Replayed {len(rows)} of {len(self.records)} inputs: {recorded:.3f}s recorded, "
+            f"{replayed:.3f}s replayed ({replayed - recorded:+.3f}s)",
+            file=stream,
+        )
+        if self.diverged is not None:
+            print(f"Stopped at step {self.diverged}, as the menus are not the same as when recording", file=stream)
+
+
+_recorder: Optional[Recorder] = None
+_replayer: Optional[Replayer] = None
+# [outcome, time waited for input in nested menus] of the inputs that are being handled, innermost last
+_open: List[list] = []
+
+
+@contextmanager
+def _step(menu: "meny.Menu", depth: int, inputstring: str, wait: float) -> Iterator[None]:
+    if _replayer is not None:
+        step = _replayer.records[_replayer.position - 1]["step"]
+    else:
+        step = next(_recorder._steps)
+    for enclosing in _open:
+        enclosing[1] += wait  # Waiting for input is not part of the duration of the input that opened the menu
+    current = ["ok", 0.0]
+    _open.append(current)
+    start = time.perf_counter()
+    try:
+        yield
+    except MenuQuit:
+        current[0] = "quit"
+        raise
+    except BaseException as e:
+        current[0] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start - current[1]
+        _open.pop()
+        if _replayer is not None:
+            _replayer.replayed[step] = (duration, current[0])
+        if _recorder is not None:
+            _recorder.write(
+                {
+                    "step": step,
+                    "t": start - _recorder._start,
+                    "depth": depth,
+                    "menu": menu.title.strip(),
+                    "input": inputstring,
+                    "wait": wait,
+                    "duration": duration,
+                    "outcome": current[0],
+                }
+            )
+
+
+class _NullStep:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STEP = _NullStep()
+
+
+def step(menu: "meny.Menu", depth: int, inputstring: str, wait: float):
+    """
+    Context manager that records the handling of an input line of a menu, if recording or replaying.
+    wait is the time spent waiting for the input.
+    """
+    if _recorder is None and _replayer is None:
+        return _NULL_STEP
+    return _step(menu, depth, inputstring, wait)
+
+
+def fail(error: BaseException):
+    """Sets the outcome of the input that is being handled, for errors that are shown rather than raised"""
+    if _open:
+        _open[-1][0] = f"{type(error).__name__}: {error}"
+
+
+def enable_recording(path: Union[str, Path]) -> Recorder:
+    """Start writing the input given to menus, and how long it took to handle, to path"""
+    global _recorder
+    disable_recording()
+    _recorder = Recorder(path)
+    return _recorder
+
+
+def disable_recording():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+
+
+@contextmanager
+def replay(path: Union[str, Path], pace: str = "fast") -> Iterator[Replayer]:
+    """
+    Context manager within which menus get their input from the recording at path instead of a
+    frontend. pace is "fast" (no waiting) or "original" (waits as long as when recording).
+    """
+    global _replayer
+    replayer = Replayer(path, pace)
+    stdin = sys.stdin
+    _replayer, sys.stdin = replayer, _EmptyInput()
+    try:
+        yield replayer
+    finally:
+        _replayer, sys.stdin = None, stdin
@@ -0,0 +1,61 @@
+"""
+Menu sessions.
+
+A session is the state shared by a root menu and the menus nested in it: the menu depth, the return
+mode and the return values of the cases. The current session is kept in a context variable, such
+that menus that run in different threads (or in different contexts) have independent sessions, and
+such that every root menu starts with a fresh session.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+_session: "contextvars.ContextVar[Optional[Session]]" = contextvars.ContextVar("meny_session", default=None)
+
+
+class Session:
+    """
+    State of a menu session
+
+    depth: number of menus that are running in the session
+    return_mode: "flat" or "tree", decided by the root menu
+    flat: return values by case function name, used in flat return mode
+    stack: scopes of nested case calls, used in tree return mode. The first element is the root scope
+    returns: what Menu.run returns, updated after every case call
+    """
+
+    def __init__(self, return_mode: str):
+        self.depth = 0
+        self.return_mode = return_mode
+        self.flat: dict = {}
+        self.stack: List[dict] = [{}]
+        self.returns: Optional[dict] = None
+
+    @contextmanager
+    def activate(self) -> Iterator["Session"]:
+        """Make this the current session within the with block"""
+        token = _session.set(self)
+        try:
+            yield self
+        finally:
+            _session.reset(token)
+
+
+def current_session() -> Optional[Session]:
+    """The session of the running menu, None if no menu session is active in this context"""
+    return _session.get()
+
+
+def get_session() -> Session:
+    """
+    The current session. If there is none, e.g. when case handlers are used without a menu, a session
+    is created for the current context
+    """
+    session = _session.get()
+    if session is None:
+        from meny import config as cng
+
+        session = Session(cng.DEFAULT_RETURN_MODE)
+        _session.set(session)
+    return session
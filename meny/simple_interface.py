@@ -1,6 +1,17 @@
 import meny
 import meny.strings as strings
-from typing import Dict, Tuple, Callable
+from meny import config as cng
+from typing import Dict, List, Tuple, Callable, Optional
+
+try:
+    import readline
+except ImportError:  # E.g. Windows
+    readline = None
+
+# (history, version) that readline was last synced with
+_readline_synced: Tuple[Optional[object], int] = (None, -1)
+# (prefix, names) of the last completion, as readline asks for the matches one at a time
+_completions: Tuple[Optional[str], List[str]] = (None, [])
 
 
 def print_funcmap(funcmap: Dict[str, Tuple[str, Callable]]) -> None:
@@ -25,7 +36,49 @@ def show_cases(funcmap: dict, title=strings.LOGO_TITLE) -> None:
     print_funcmap(funcmap)
 
 
+def sync_readline_history(cli: meny.Menu) -> None:
+    """
+    Gives the most recent entries of the menu history to readline, which provides recall with
+    up/down arrows and reverse search with Ctrl-R
+    """
+    global _readline_synced
+    history = cli.history
+    if readline is None or history is None or _readline_synced == (history, history.version):
+        return
+    readline.clear_history()
+    for entry in history.recent(cng.HISTORY_READLINE_ENTRIES):
+        readline.add_history(entry)
+    _readline_synced = (history, history.version)
+
+
+def complete_case(cli: meny.Menu, text: str, state: int) -> Optional[str]:
+    """readline completer, completes names of cases"""
+    global _completions
+    if readline.get_begidx() > 0:  # Only the case is completed, not its arguments
+        return None
+    if state == 0 or _completions[0] != text:
+        _completions = (text, cli.case_index.complete(text))
+    names = _completions[1]
+    if state >= len(names):
+        return None
+    # Python's readline does not add a space after a unique match
+    return names[state] + " " if len(names) == 1 else names[state]
+
+
+def set_readline_completer(cli: meny.Menu) -> None:
+    """Lets readline complete names of the cases of cli with tab"""
+    if readline is None:
+        return
+    readline.set_completer(lambda text, state: complete_case(cli, text, state))
+    if "libedit" in (readline.__doc__ or ""):  # E.g. macOS
+        readline.parse_and_bind("bind ^I rl_complete")
+    else:
+        readline.parse_and_bind("tab: complete")
+
+
 def interface(cli: meny.Menu):
+    sync_readline_history(cli)
+    set_readline_completer(cli)
     print("\x1b[s", end="")  # Save current position
     show_cases(cli.funcmap, cli.title)
     retval = input(f"{strings.ENTER_PROMPT}: ")
@@ -0,0 +1,132 @@
+"""
+Result sinks write the return value of every case as soon as the case returns, such that other
+programs can consume the results of a menu session incrementally.
+
+Every result is written as a record {"menu": ..., "case": ..., "value": ...} in one of the formats:
+- "jsonl": one JSON object per line
+- "msgpack": a stream of msgpack maps (requires the msgpack package)
+- "pickle": a stream of pickles, read them with repeated calls to pickle.load
+
+Values that cannot be serialized in the chosen format are replaced with a compact description:
+{"__type__": "module.QualName", "__repr__": "<shortened repr>"}
+"""
+
+import json
+import pickle
+import reprlib
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Optional
+
+_repr = reprlib.Repr()
+_repr.maxstring = 200
+_repr.maxother = 200
+
+
+def compact(value: Any) -> dict:
+    """Compact description of value, used for values that cannot be serialized"""
+    cls = type(value)
+    return {"__type__": f"{cls.__module__}.{cls.__qualname__}", "__repr__": _repr.repr(value)}
+
+
+class ResultSink(ABC):
+    """Base class of result sinks, subclasses implement encode"""
+
+    def __init__(self, stream: BinaryIO, close_stream: bool = True):
+        self.stream = stream
+        self.close_stream = close_stream
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def encode(self, record: dict) -> bytes:
+        """Serializes record"""
+
+    def emit(self, menu: str, case: str, value: Any):
+        data = self.encode({"menu": menu, "case": case, "value": value})
+        with self._lock:
+            self.stream.write(data)
+            self.stream.flush()
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class JSONLinesSink(ResultSink):
+    def encode(self, record: dict) -> bytes:
+        try:
+            line = json.dumps(record, default=compact)
+        except (TypeError, ValueError):
+            # E.g. dictionaries with keys that are not strings, or circular references
+            line = json.dumps({**record, "value": compact(record["value"])})
+        return (line + "\n").encode("utf-8")
+
+
+class MsgpackSink(ResultSink):
+    def __init__(self, stream: BinaryIO, close_stream: bool = True):
+        try:
+            import msgpack
+        except ImportError as e:
+            raise ImportError(
+                f"Got error :\n\t{e}\n" "The msgpack result format requires the msgpack package:\n\tpip install msgpack"
+            ) from e
+        super().__init__(stream, close_stream)
+        self._packer = msgpack.Packer(default=compact)
+
+    def encode(self, record: dict) -> bytes:
+        try:
+            return self._packer.pack(record)
+        except (TypeError, ValueError, OverflowError):
+            # E.g. dictionaries with keys that msgpack does not support
+            return self._packer.pack({**record, "value": compact(record["value"])})
+
+
+class PickleSink(ResultSink):
+    def encode(self, record: dict) -> bytes:
+        try:
+            return pickle.dumps(record)
+        except Exception:  # Pickling can fail with about any exception
+            return pickle.dumps({**record, "value": compact(record["value"])})
+
+
+SINKS = {"jsonl": JSONLinesSink, "msgpack": MsgpackSink, "pickle": PickleSink}
+
+
+def open_sink(format: str, path: str = "-") -> ResultSink:
+    """
+    Opens result sink that writes to path, which can be a file or a FIFO, or stdout if path is "-"
+    """
+    if format not in SINKS:
+        raise ValueError(f"Unsupported result format {format!r}, available formats are: {tuple(SINKS)}")
+    if path == "-":
+        return SINKS[format](sys.stdout.buffer, close_stream=False)
+    return SINKS[format](open(path, "ab"))
+
+
+_sink: Optional[ResultSink] = None
+
+
+def get_result_sink() -> Optional[ResultSink]:
+    return _sink
+
+
+def enable_result_sink(format: str = "jsonl", path: str = "-") -> ResultSink:
+    """
+    Write the return value of every case call to path (stdout if "-") in the given format
+    ("jsonl", "msgpack" or "pickle") as soon as the case returns
+    """
+    global _sink
+    sink = open_sink(format, path)
+    disable_result_sink()
+    _sink = sink
+    return sink
+
+
+def disable_result_sink():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+    _sink = None
@@ -0,0 +1,237 @@
+"""
+Dependency aware, incremental execution of the commands of JSON menus, e.g.
+
+    "Fetch": "curl -o data.csv https://example.com/data.csv",
+    "Clean": {"__command__": "python clean.py", "__needs__": ["Fetch"],
+              "__inputs__": ["data.csv", "clean.py"], "__outputs__": ["clean.csv"]},
+    "Report": {"__command__": "python report.py", "__needs__": ["Clean"], "__inputs__": ["clean.csv"]}
+
+Selecting a step runs the steps it needs first, in topological order, and steps that do not depend
+on each other run concurrently. A step with inputs (glob patterns relative to the working
+directory) is skipped if the hash of its command and the contents of its inputs is the same as when
+it last succeeded, and its outputs exist. The hashes are kept in a state file in the working
+directory, along with the hashes of the input files, which are reused as long as the size and
+modification time of a file are unchanged.
+"""
+
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Union
+
+import meny
+from meny import config as cng
+from meny.cancellation import INTERRUPT_MESSAGE, interruptible
+from meny.exceptions import CaseCancelled, MenuError
+
+STATE_VERSION = 1
+COMMAND = "__command__"
+NEEDS = "__needs__"
+INPUTS = "__inputs__"
+OUTPUTS = "__outputs__"
+
+# Outcomes of steps that did not run
+UP_TO_DATE = "up to date"
+NEED_FAILED = "not run, a step it needs failed"
+
+
+def _patterns(entry: dict, key: str) -> List[str]:
+    patterns = entry.get(key, [])
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not (isinstance(patterns, list) and all(isinstance(pattern, str) for pattern in patterns)):
+        raise MenuError(f"{key} must be a glob pattern or a list of glob patterns")
+    return patterns
+
+
+def _files(patterns: List[str]) -> Set[str]:
+    return {path for pattern in patterns for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)}
+
+
+class Step:
+    """A command of a JSON menu, along with the steps it needs and the files it reads and writes"""
+
+    def __init__(self, name: str, command: str, needs: List[str], inputs: List[str], outputs: List[str]):
+        self.name = name
+        self.command = command
+        self.needs = needs
+        self.inputs = inputs
+        self.outputs = outputs
+
+    @classmethod
+    def from_entry(cls, name: str, entry: Union[str, dict]) -> "Step":
+        """Step of an entry of a JSON spec, which is a command or an object with a __command__"""
+        if isinstance(entry, str):
+            return cls(name, entry, [], [], [])
+        needs = entry.get(NEEDS, [])
+        if isinstance(needs, str):
+            needs = [needs]
+        if not (isinstance(needs, list) and all(isinstance(need, str) for need in needs)):
+            raise MenuError(f"{NEEDS} of {name!r} must be a title or a list of titles of other entries")
+        return cls(name, entry[COMMAND], needs, _patterns(entry, INPUTS), _patterns(entry, OUTPUTS))
+
+
+def is_step(entry) -> bool:
+    return isinstance(entry, dict) and isinstance(entry.get(COMMAND), str)
+
+
+def parse_steps(spec: dict) -> Dict[str, Step]:
+    """Steps of the entries of a level of a JSON spec, that is of its commands and objects with a __command__"""
+    return {
+        name: Step.from_entry(name, entry) for name, entry in spec.items() if isinstance(entry, str) or is_step(entry)
+    }
+
+
+def graph(steps: Dict[str, Step], target: str) -> List[str]:
+    """
+    Names of target and the steps it needs (directly or indirectly) in topological order. Raises
+    MenuError if a needed step does not exist or if the steps need each other in a cycle.
+    """
+    order: List[str] = []
+    visiting: List[str] = []
+
+    def visit(name: str):
+        if name in order:
+            return
+        if name in visiting:
+            cycle = " -> ".join(visiting[visiting.index(name) :] + [name])
+            raise MenuError(f"Steps need each other in a cycle: {cycle}")
+        if name not in steps:
+            raise MenuError(f"{visiting[-1]!r} needs {name!r}, which is not a command in the same menu")
+        visiting.append(name)
+        for need in steps[name].needs:
+            visit(need)
+        visiting.pop()
+        order.append(name)
+
+    visit(target)
+    return order
+
+
+class StepState:
+    """Hashes of the steps at their last successful run, and of the files they read"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path if path is not None else cng.STEP_STATE_FILE)
+        self.steps: Dict[str, str] = {}
+        self.files: Dict[str, list] = {}  # path: [size, mtime, digest]
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == STATE_VERSION:
+            self.steps = data.get("steps", {})
+            self.files = data.get("files", {})
+
+    def save(self):
+        """Writes the state atomically if it has changed"""
+        if not self._dirty:
+            return
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": STATE_VERSION, "steps": self.steps, "files": self.files}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            return  # Failing to write the state only means that steps run again next time
+        self._dirty = False
+
+    def file_digest(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._dirty = True
+        return digest.hexdigest()
+
+    def digest(self, command: str, inputs: List[str], outputs: List[str]) -> Optional[str]:
+        """
+        Hash of command and the files that match the patterns of inputs but not of outputs. None if
+        there are no inputs, in which case the step always runs.
+        """
+        if not inputs:
+            return None
+        digest = hashlib.sha256(command.encode())
+        for path in sorted(_files(inputs) - _files(outputs)):
+            digest.update(f"\0{path}\0{self.file_digest(path)}".encode())
+        return digest.hexdigest()
+
+    def is_up_to_date(self, key: str, digest: Optional[str], outputs: List[str]) -> bool:
+        if digest is None or self.steps.get(key) != digest:
+            return False
+        return all(glob.glob(pattern, recursive=True) for pattern in outputs)
+
+    def record(self, key: str, digest: Optional[str]):
+        if digest is not None:
+            self.steps[key] = digest
+            self._dirty = True
+
+
+def run_steps(
+    steps: Dict[str, Step],
+    target: str,
+    runner: "meny.cli.CommandRunner",
+    fill: Callable[[str], str],
+    *,
+    key_prefix: str = "",
+    concurrency: Optional[int] = None,
+    state: Optional[StepState] = None,
+) -> Dict[str, Union[int, str]]:
+    """
+    Runs target and the steps it needs, with at most concurrency steps at a time (default is
+    meny.config.JSON_CONCURRENCY). runner runs the commands and shows their output, and fill gives
+    a command or glob pattern with the arguments of the case substituted. Steps are recorded in state by
+    key_prefix + name.
+
+    Returns the return code of every step that ran, or why it did not run.
+    """
+    order = graph(steps, target)
+    state = state if state is not None else StepState()
+    pending = list(order)
+    outcomes: Dict[str, Union[int, str]] = {}
+    running: Dict[Future, tuple] = {}
+
+    with ThreadPoolExecutor(concurrency or cng.JSON_CONCURRENCY) as pool, interruptible():
+        try:
+            while pending or running:
+                for name in [name for name in pending if all(need in outcomes for need in steps[name].needs)]:
+                    pending.remove(name)
+                    step = steps[name]
+                    if any(outcomes[need] not in (0, UP_TO_DATE) for need in step.needs):
+                        outcomes[name] = NEED_FAILED
+                        continue
+                    command = fill(step.command)
+                    outputs = [fill(pattern) for pattern in step.outputs]
+                    digest = state.digest(command, [fill(pattern) for pattern in step.inputs], outputs)
+                    if state.is_up_to_date(key_prefix + name, digest, outputs):
+                        outcomes[name] = UP_TO_DATE
+                        runner.show(name, UP_TO_DATE)
+                        continue
+                    running[pool.submit(runner.run, name, command)] = (name, digest)
+
+                if not running:
+                    continue  # Outcomes of steps that did not run may let other steps start
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, digest = running.pop(future)
+                    outcomes[name] = future.result()
+                    if outcomes[name] == 0:
+                        state.record(key_prefix + name, digest)
+        except KeyboardInterrupt:
+            for future in running:
+                future.cancel()
+            runner.terminate()
+            raise CaseCancelled(INTERRUPT_MESSAGE) from None
+        finally:
+            state.save()
+    return {name: outcomes[name] for name in order}
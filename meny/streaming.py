@@ -0,0 +1,153 @@
+"""
+Streaming of case results that are iterators, e.g. of cases that are generators.
+
+Rather than recording the iterator, which nothing would consume, the case handlers consume it one item at a
+time: every item is printed as it arrives and written to the result sink if there is one, and what is recorded
+as the return value of the case depends on the record mode of the case (see meny.stream):
+
+- "none": nothing, the return value is None
+- "count": the number of items
+- "head" / "tail": a StreamedItems list of the first / last items
+- "spill": a SpillFile, to which all items are pickled, and which can be read back lazily
+
+An item is not taken from the iterator until the previous one has been printed, such that a generator never
+runs ahead of the terminal (or of what reads the output). If there are more items than fit on the screen, they
+are shown in the pager (see meny.pager), which takes items as they are shown, and quitting it stops the stream.
+"""
+
+import io
+import os
+import pickle
+import sys
+import tempfile
+import weakref
+from collections import deque
+from collections.abc import Iterator
+from inspect import unwrap
+from pathlib import Path
+from types import FunctionType
+from typing import Any, Iterable, Union
+
+import meny
+from meny import config as cng
+from meny import pager as _pager
+from meny import sinks as _sinks
+from meny.cancellation import INTERRUPT_MESSAGE, interruptible
+from meny.exceptions import CaseCancelled
+from meny.funcmap import _get_case_name
+
+RECORD_MODES = ("none", "count", "head", "tail", "spill")
+
+
+class StreamedItems(list):
+    """First or last items of a streamed result, count is the number of items there were in total"""
+
+    def __init__(self, items: Iterable, count: int):
+        super().__init__(items)
+        self.count = count
+
+
+def _remove(path: Path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+class SpillFile:
+    """
+    Items of a streamed result pickled to path, iterating reads them back one at a time. The file is deleted when
+    the SpillFile is garbage collected, or at exit.
+    """
+
+    def __init__(self, path: Union[str, Path], count: int):
+        self.path = Path(path)
+        self.count = count
+        weakref.finalize(self, _remove, self.path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for _ in range(self.count):
+                yield pickle.load(f)
+
+    def __repr__(self) -> str:
+        return f"SpillFile({str(self.path)!r}, count={self.count})"
+
+
+def is_stream(value: Any) -> bool:
+    """Whether value is a result that is streamed, that is an iterator which is not a file"""
+    return isinstance(value, Iterator) and not isinstance(value, io.IOBase)
+
+
+def _pickle(item: Any) -> bytes:
+    try:
+        return pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+    except Exception:  # Pickling can raise almost anything
+        return pickle.dumps(_sinks.compact(item), pickle.HIGHEST_PROTOCOL)
+
+
+def consume(menu: "meny.Menu", casefunc: FunctionType, iterator: Iterator) -> Any:
+    """
+    Consumes the iterator returned by casefunc, see the module docstring. Returns what to record as the
+    return value of the case. Raises CaseCancelled if interrupted with Ctrl-C, after closing the iterator.
+    """
+    record, n, show = getattr(
+        unwrap(casefunc), cng._CASE_STREAM, (cng.STREAM_RECORD, cng.STREAM_RECORD_ITEMS, cng.STREAM_SHOW)
+    )
+    sink = _sinks._sink
+    title = getattr(menu, "title", "").strip()
+    name = _get_case_name(casefunc)
+    kept = deque(maxlen=n) if record == "tail" else []
+    spill = spilled = None
+    if record == "spill":
+        fd, path = tempfile.mkstemp(prefix="meny-stream-", suffix=".pickle", dir=cng.STREAM_SPILL_DIR)
+        spill = os.fdopen(fd, "wb")
+        spilled = SpillFile(path, 0)  # Deletes the file also if the stream fails
+
+    count = 0
+
+    def pulled() -> Iterator:
+        nonlocal count
+        for item in iterator:
+            count += 1
+            if sink is not None:
+                sink.emit(title, name, item)
+            if record == "tail" or (record == "head" and len(kept) < n):
+                kept.append(item)
+            elif spill is not None:
+                spill.write(_pickle(item))
+            yield item
+
+    close = getattr(iterator, "close", None)
+    try:
+        with interruptible():
+            if show and _pager.enabled():
+                # Items are taken as the pager shows them, and quitting the pager stops the stream
+                _pager.page(pulled(), name)
+                if close is not None:
+                    close()
+            else:
+                for item in pulled():
+                    if show:
+                        print(item)
+    except KeyboardInterrupt:
+        if close is not None:
+            close()
+        raise CaseCancelled(INTERRUPT_MESSAGE) from None
+    finally:
+        if spill is not None:
+            spill.close()
+        if show:
+            sys.stdout.flush()
+
+    if record == "none":
+        return None
+    if record == "count":
+        return count
+    if spilled is not None:
+        spilled.count = count
+        return spilled
+    return StreamedItems(kept, count)
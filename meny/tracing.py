@@ -0,0 +1,134 @@
+"""
+Span based tracing of menu sessions.
+
+When enabled, a span is recorded for every Menu.run, every case call and every shell command from
+JSON menus. Spans are written as "complete" events in the Chrome trace event format, one event per
+line, such that the file can be opened in Chrome's trace viewer (chrome://tracing) or Perfetto
+(https://ui.perfetto.dev) to see nested menus and cases on a timeline. The file is a JSON array
+whose closing bracket is written when tracing is disabled, both viewers also load files that lack
+it (e.g. if the process crashed).
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+_parent_span: "contextvars.ContextVar[Optional[int]]" = contextvars.ContextVar("meny_parent_span", default=None)
+
+
+class Span:
+    """Handle to a span that is being recorded, use set() to add arguments (e.g. the outcome)"""
+
+    def __init__(self, args: Dict[str, Any]):
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class _NullSpan:
+    def set(self, **args):
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Writes spans to a trace file, see enable_tracing"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "w", encoding="utf-8", buffering=1)
+        self._file.write("[\n")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pid = os.getpid()
+        # Timestamps are relative to the start of tracing, in microseconds
+        self._start = time.perf_counter()
+
+    def _write(self, event: dict):
+        # Values that are not JSON serializable, e.g. arguments of cases, are written as their repr
+        line = json.dumps(event, default=repr) + ",\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args) -> Iterator[Span]:
+        span_id = next(self._ids)
+        span = Span({**args, "span_id": span_id, "parent_id": _parent_span.get()})
+        token = _parent_span.set(span_id)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.args.setdefault("outcome", type(e).__name__)
+            raise
+        finally:
+            end = time.perf_counter()
+            _parent_span.reset(token)
+            span.args.setdefault("outcome", "ok")
+            self._write(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": (start - self._start) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": self._pid,
+                    "tid": threading.get_ident(),
+                    "args": span.args,
+                }
+            )
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            # A metadata event as the last element, such that the array does not end with a comma
+            metadata = {"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": "meny"}}
+            self._file.write(json.dumps(metadata) + "\n]\n")
+            self._file.close()
+            self._file = None
+
+
+_tracer: Optional[Tracer] = None
+
+
+def span(name: str, cat: str, **args):
+    """
+    Context manager that records a span if tracing is enabled. Spans opened within the span become
+    its children.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, cat, **args)
+
+
+def enable_tracing(path: Union[str, Path]) -> Tracer:
+    """Start writing spans of menus, cases and shell commands to the trace file at path"""
+    global _tracer
+    disable_tracing()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def disable_tracing():
+    """Stop tracing and finish the trace file"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = None
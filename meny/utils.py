@@ -1,12 +1,16 @@
 """
 Common stuff for console stuff
 """
+import importlib
 import os
+import pkgutil
 import re
+import sys
+import weakref
 from meny import config as cng
-from inspect import getmodule, isfunction
+from inspect import isfunction
 from types import FunctionType, ModuleType
-from typing import Any, Container, Dict, List
+from typing import Any, Container, Dict, List, Optional, Tuple
 from meny import strings
 
 # *Nix uses clear, windows uses cls
@@ -14,7 +18,8 @@ _CLEAR_COMMAND = "cls" if os.name == "nt" else "clear"
 
 RE_ANSI = re.compile(r"\x1b\[[;\d]*[A-Za-z]")  # Taken from tqdm source code, matches escape codes
 
-RE_INPUT = re.compile(r"[\w.-]+|\[.*?\]|\{.*?\}|\(.*?\)|\".*?\"|'.*?'")
+# A "|" outside of brackets and quotes separates the stages of a pipeline, @path is a file argument (see meny.fileargs)
+RE_INPUT = re.compile(r"@\".*?\"|@'.*?'|@[^\s|]+|[\w.-]+|\[.*?\]|\{.*?\}|\(.*?\)|\".*?\"|'.*?'|\|")
 
 
 def _assert_supported(arg: Any, paramname: str, supported: Container):
@@ -63,6 +68,12 @@ def set_default_remember(remember: bool):
     cng.DEFAULT_REMEMBER = remember
 
 
+def set_default_history(history: bool):
+    """Toggle for persistent input history"""
+    _assert_supported(type(history), "history", (bool,))
+    cng.DEFAULT_HISTORY = history
+
+
 def set_default_clear(remember: bool):
     """Toggle for clearing console before showing menu"""
     _assert_supported(type(remember), "remember", (bool,))
@@ -105,13 +116,90 @@ def input_splitter(argstring: str) -> List[str]:
     return RE_INPUT.findall(argstring)
 
 
+def get_rss() -> int:
+    """Resident set size of current process in bytes, 0 if it cannot be determined"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # E.g. Windows
+        return 0
+    # Not the current, but the peak resident set size. Is in kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _defined_in(func: Any, module: ModuleType) -> bool:
+    """
+    True if func is a function defined in module. Compares the module name of the function, and then
+    the file of its code, which is much cheaper than inspect.getmodule that may scan sys.modules.
+    """
+    if not isfunction(func):
+        return False
+    if func.__module__ == module.__name__:
+        return True
+    filename = getattr(module, "__file__", None)
+    return filename is not None and func.__code__.co_filename == filename
+
+
+# Cases by module, along with the spec of the module they were found in. Reloading a module gives it a new spec,
+# which is checked in constant time. Functions that are rebound (e.g. by monkeypatching) are not noticed, call
+# clear_case_cache after rebinding
+_module_cases: "weakref.WeakKeyDictionary[ModuleType, Tuple[Any, List[FunctionType]]]" = weakref.WeakKeyDictionary()
+
+
 def get_module_cases(module: ModuleType) -> List[FunctionType]:
     """Get all functions defined in module"""
-    def inModule(f):
-        moduleOfF = getmodule(f)
-        # If moduleOfF is None, assume that it is loaded using load_module_from_path found in cli.py
-        return isfunction(f) and (moduleOfF == module or moduleOfF is None)
-    return [func for func in vars(module).values() if inModule(func)]
+    spec = getattr(module, "__spec__", None)
+    cached = _module_cases.get(module)
+    if cached is not None and cached[0] is spec:
+        return list(cached[1])
+    cases = [func for func in vars(module).values() if _defined_in(func, module)]
+    _module_cases[module] = (spec, cases)
+    return list(cases)
+
+
+def clear_case_cache(module: Optional[ModuleType] = None):
+    """
+    Forget the cases found by get_module_cases in module (in all modules if None), e.g. after rebinding or
+    adding functions of the module
+    """
+    if module is None:
+        _module_cases.clear()
+    else:
+        _module_cases.pop(module, None)
+
+
+def _submodule_case(package: ModuleType, name: str, ispkg: bool) -> FunctionType:
+    """Case that imports the submodule of package and opens it as a submenu"""
+    fullname = f"{package.__name__}.{name}"
+
+    def submenu():
+        # Import here to fix circular imports
+        from meny.menu import menu
+
+        module = importlib.import_module(fullname)
+        return menu(get_package_cases(module) if ispkg else module, title=f" {fullname} ")
+
+    submenu.__name__ = name
+    vars(submenu)[cng._CASE_TITLE] = name
+    return submenu
+
+
+def get_package_cases(package: ModuleType) -> List[FunctionType]:
+    """
+    Get all functions defined in package (i.e. in its __init__), followed by a submenu case for every
+    submodule and subpackage whose name does not start with an underscore. Submodules are not imported
+    before their submenu is opened.
+    """
+    cases = get_module_cases(package)
+    for info in pkgutil.iter_modules(getattr(package, "__path__", ())):
+        if not info.name.startswith("_"):
+            cases.append(_submodule_case(package, info.name, info.ispkg))
+    return cases
 
 
 if __name__ == "__main__":
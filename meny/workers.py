@@ -0,0 +1,237 @@
+"""
+Pool of forked worker processes that cases can run in, such that a case that segfaults, leaks
+memory or calls sys.exit does not take down the menu process.
+
+Workers are forked from the menu process after the cases are imported, so case functions do
+not need to be pickled: a worker finds the case function by its id in the registry it inherited
+from the menu process. Arguments and return values are sent over pipes, and thus have to be
+picklable. Streams (e.g. of generator cases) are consumed in the worker, and their items are sent
+all at once.
+"""
+
+import gc
+import os
+import signal
+import threading
+import traceback
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from types import FunctionType
+from typing import Any, Dict, Iterable, List, Optional
+
+from meny import config as cng
+from meny.cancellation import timeout_message
+from meny.exceptions import CaseCancelled, MenuError
+from meny.utils import get_rss
+
+# Is True in worker processes, where cases always run inline
+_in_worker = False
+
+
+def in_worker() -> bool:
+    return _in_worker
+
+
+def fork_supported() -> bool:
+    return hasattr(os, "fork")
+
+
+def _worker_main(conn: Connection, registry: Dict[int, FunctionType], max_calls: Optional[int]):
+    """Loop of worker process: receive case calls, run them and send the outcomes back"""
+    # Import here to fix circular imports
+    from meny.streaming import is_stream
+
+    global _in_worker
+    _in_worker = True
+    # Ctrl-C is handled by the menu process, which kills the worker if necessary
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    calls = 0
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+
+        func_id, args, kwargs = message
+        try:
+            value = registry[func_id](*args, **kwargs)
+            if is_stream(value):
+                # Iterators such as generators cannot be sent, so the items are taken here, within the timeout of
+                # the call, and sent as an iterator over a list that the menu process streams
+                value = iter(list(value))
+            outcome = ("return", value)
+        except SystemExit as e:
+            outcome = ("exit", e.code)
+        except BaseException as e:
+            outcome = ("raise", e, traceback.format_exc())
+
+        calls += 1
+        try:
+            conn.send((*outcome, get_rss()))
+        except Exception as e:  # Typically pickling errors
+            conn.send(("unsendable", f"{type(e).__name__}: {e}", get_rss()))
+
+        if max_calls is not None and calls >= max_calls:
+            return
+
+
+class _Worker:
+    def __init__(self, registry: Dict[int, FunctionType], max_calls: Optional[int]):
+        self.conn, child_conn = Pipe()
+        self.calls = 0
+
+        # Freeze objects that exist before the fork such that the garbage collector of the
+        # worker does not touch them, which would copy the memory pages they live in
+        gc.disable()
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:  # Worker process
+            gc.enable()
+            try:
+                self.conn.close()
+                _worker_main(child_conn, registry, max_calls)
+            finally:
+                os._exit(0)
+
+        gc.unfreeze()
+        gc.enable()
+        child_conn.close()
+        self.pid = pid
+
+    def call(self, func_id: int, args: Iterable, kwargs: dict, timeout: Optional[float] = None):
+        self.conn.send((func_id, tuple(args), kwargs))
+        self.calls += 1
+        if timeout is not None and not self.conn.poll(timeout):
+            raise CaseCancelled(timeout_message(timeout))
+        return self.conn.recv()
+
+    def exit_description(self) -> str:
+        """Waits for worker to exit, and returns a description of why it exited"""
+        _, status = os.waitpid(self.pid, 0)
+        if os.WIFSIGNALED(status):
+            signum = os.WTERMSIG(status)
+            try:
+                return f"killed by signal {signal.Signals(signum).name}"
+            except ValueError:
+                return f"killed by signal {signum}"
+        return f"exited with code {os.WEXITSTATUS(status)}"
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+        os.waitpid(self.pid, 0)
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.conn.close()
+        os.waitpid(self.pid, 0)
+
+
+class WorkerPool:
+    """
+    Runs cases in forked worker processes
+
+    Workers are forked lazily, when a case is called and no worker is idle. A worker is recycled
+    after max_calls calls, or when its resident memory exceeds max_rss bytes. A worker that
+    crashes is replaced on the next call.
+    """
+
+    def __init__(
+        self,
+        funcs: Iterable[FunctionType],
+        *,
+        size: Optional[int] = None,
+        max_calls: Optional[int] = None,
+        max_rss: Optional[int] = None,
+    ):
+        if not fork_supported():
+            raise MenuError("The fork executor requires os.fork, which is not available on this platform")
+        self.registry = {id(func): func for func in funcs}
+        self.size = size or cng.WORKER_POOL_SIZE or os.cpu_count() or 1
+        self.max_calls = max_calls if max_calls is not None else cng.WORKER_MAX_CALLS
+        self.max_rss = max_rss if max_rss is not None else cng.WORKER_MAX_RSS
+        self._idle: List[_Worker] = []
+        self._n_workers = 0
+        self._cond = threading.Condition()
+
+    def __contains__(self, func: FunctionType) -> bool:
+        return id(func) in self.registry
+
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            while not self._idle and self._n_workers >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._n_workers += 1
+        try:
+            return _Worker(self.registry, self.max_calls)
+        except BaseException:
+            self._discard()
+            raise
+
+    def _release(self, worker: _Worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._n_workers -= 1
+            self._cond.notify()
+
+    def call(
+        self, func: FunctionType, args: Iterable = (), kwargs: Optional[dict] = None, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Call func in a worker process, and return its return value or raise its exception. If func
+        has not returned within timeout seconds the worker is killed and CaseCancelled is raised.
+        """
+        worker = self._acquire()
+        try:
+            kind, value, *rest = worker.call(id(func), args, kwargs or {}, timeout)
+        except (EOFError, OSError):
+            self._discard()
+            worker.conn.close()
+            raise MenuError(f"Worker process {worker.exit_description()} while running case")
+        except BaseException:
+            # Timeout or e.g. KeyboardInterrupt while waiting, the worker is in an unknown state
+            self._discard()
+            worker.kill()
+            raise
+
+        rss = rest[-1]
+        if (self.max_calls is not None and worker.calls >= self.max_calls) or (
+            self.max_rss is not None and rss > self.max_rss
+        ):
+            self._discard()
+            worker.stop()
+        else:
+            self._release(worker)
+
+        if kind == "return":
+            return value
+        if kind == "exit":
+            raise MenuError(f"Case called sys.exit({value!r})")
+        if kind == "unsendable":
+            raise MenuError(f"Could not send return value from worker process: {value}")
+        # kind == "raise"
+        value.__cause__ = MenuError(f"Traceback from worker process:\n{rest[0]}")
+        raise value
+
+    def close(self):
+        """Stops all idle workers"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._n_workers -= len(idle)
+        for worker in idle:
+            worker.stop()
@@ -1,7 +1,31 @@
 import unittest
+import importlib.util
+import inspect
 import meny as meny
 import random
+import tempfile
+from pathlib import Path
 import meny.cli
+import meny.history
+import meny.workers
+import meny.memtrace
+import meny.sinks
+import meny.session
+import meny.output
+import meny.pager
+import meny.fileargs
+import meny.menylogger
+import os
+import sys
+
+
+class DummyMenu:
+    """Stands in for a menu when calling the case handlers directly"""
+
+    def __init__(self, title: str = ""):
+        self.title = title
+        self.case_args = {}
+        self.case_kwargs = {}
 
 
 class TestUtils(unittest.TestCase):
@@ -123,6 +147,76 @@ class TestUtils(unittest.TestCase):
         args2 = meny.casehandlers._handle_args(function, [repr(arg) for arg in args])
         self.assertListEqual(args, args2)
 
+    def test_file_arguments(self):
+        """@path arguments are given as memory-mapped files, according to the annotation of the parameter"""
+
+        def function(a, b: bytes, c: str):
+            pass
+
+        def number(a: int):
+            pass
+
+        tokens = meny.input_splitter('1 @data.bin @"a b.bin" | 2')
+        self.assertListEqual(tokens, ["1", "@data.bin", '@"a b.bin"', "|", "2"])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "data.bin"
+            path.write_bytes(b"abc\x00def")
+            (Path(tmpdir) / "empty.bin").touch()
+            a, b, c = meny.casehandlers._handle_args(function, [f"@{path}", f'@"{tmpdir}/empty.bin"', f"@{path}"])
+            self.assertEqual(bytes(a), b"abc\x00def")
+            self.assertTrue(a.readonly)
+            self.assertEqual(bytes(b), b"")
+            self.assertEqual(c, f"@{path}")
+            a.release()
+
+            with self.assertRaises(meny.MenuError):
+                meny.casehandlers._handle_args(number, [f"@{path}"])
+            with self.assertRaises(meny.MenuError):
+                meny.casehandlers._handle_args(function, [f"@{tmpdir}/missing.bin"])
+
+            if importlib.util.find_spec("numpy") is not None:
+                import numpy
+
+                def array(a: numpy.ndarray):
+                    pass
+
+                numpy.save(Path(tmpdir) / "data.npy", numpy.arange(6).reshape(2, 3))
+                (mapped,) = meny.casehandlers._handle_args(array, [f"@{tmpdir}/data.npy"])
+                self.assertIsInstance(mapped, numpy.memmap)
+                self.assertListEqual(mapped.tolist(), [[0, 1, 2], [3, 4, 5]])
+                del mapped
+
+    def test_line_stream_arguments(self):
+        """@path arguments to TextIO and Iterable[str] parameters are streamed lines of files, globs or stdin"""
+        import gzip
+        import io
+        from typing import Iterable, TextIO
+        from unittest import mock
+
+        def function(a: Iterable[str], b: TextIO):
+            pass
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            (Path(tmpdir) / "1.log").write_text("a\nb\n")
+            with gzip.open(Path(tmpdir) / "2.log.gz", "wt") as f:
+                f.write("c\nd\n")
+            a, b = meny.casehandlers._handle_args(function, [f"@{tmpdir}/*.log*", f'@"{tmpdir}/1.log"'])
+            self.assertIsInstance(a, meny.fileargs.LineStream)
+            self.assertEqual(next(a), "a\n")
+            self.assertListEqual(list(a), ["b\n", "c\n", "d\n"])
+            self.assertEqual(b.read(3), "a\nb")
+            b.close()
+
+            with self.assertRaises(meny.MenuError):
+                meny.casehandlers._handle_args(function, [f"@{tmpdir}/*.csv"])
+
+        stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(gzip.compress(b"x\ny\n"))))
+        with mock.patch("sys.stdin", stdin):
+            (a,) = meny.casehandlers._handle_args(function, ["@-"])
+            self.assertListEqual(list(a), ["x\n", "y\n"])
+            a.close()
+            self.assertFalse(stdin.closed)
+
     def test__funcmap_output(self):
         """
         Test funcmap output
@@ -150,13 +244,6 @@ class TestUtils(unittest.TestCase):
         _TreeHandler returns correct tree structure
         """
 
-        class DummyMenu:
-            _return = None
-
-            def __init__(self):
-                self.case_args = {}
-                self.case_kwargs = {}
-
         dum = DummyMenu()
 
         handler = meny.casehandlers._TreeHandler()
@@ -173,22 +260,17 @@ class TestUtils(unittest.TestCase):
             handler(dum, func1, [f"{val+1}"])
             return val
 
-        handler(dum, func1, [])
+        with meny.session.Session("tree").activate() as session:
+            handler(dum, func1, [])
         returns = {"func1": {"func2": {"func1": {"return": 2}, "return": 1}, "return": 0}}
-        self.assertDictEqual(returns, handler._stack[0])
+        self.assertDictEqual(returns, session.stack[0])
+        self.assertDictEqual(returns, session.returns)
 
     def test__FlatHandler(self):
         """
         _FlatHandler returns correct flat structure
         """
 
-        class DummyMenu:
-            _return = None
-
-            def __init__(self):
-                self.case_args = {}
-                self.case_kwargs = {}
-
         dum = DummyMenu()
 
         handler = meny.casehandlers._FlatHandler()
@@ -205,18 +287,14 @@ class TestUtils(unittest.TestCase):
             handler(dum, func1, [f"{val+1}"])
             return val
 
-        handler(dum, func1, [])
+        with meny.session.Session("flat").activate() as session:
+            handler(dum, func1, [])
         returns = {"func1": 0, "func2": 1}
-        self.assertDictEqual(returns, handler._return)
+        self.assertDictEqual(returns, session.flat)
 
     def test__handle_casefunc(self):
         """Handle casfunc works as expected"""
 
-        class DummyMenu:
-            def __init__(self):
-                self.case_args = {}
-                self.case_kwargs = {}
-
         menu = DummyMenu()
 
         def func(a, b, c):
@@ -240,11 +318,1071 @@ class TestUtils(unittest.TestCase):
         returns = meny._handle_casefunc(func, [], menu)
         self.assertTupleEqual(returns, (1, 2, 4))
 
+    def test_resolve_case_key(self):
+        """resolve_case_key resolves keys, reversed indices and names"""
+
+        @meny.title("Second case")
+        def second():
+            pass
+
+        def first():
+            pass
+
+        def third():
+            pass
+
+        funcmap = meny._menu.construct_funcmap([first, second, third])
+        self.assertEqual(meny.funcmap.resolve_case_key(funcmap, "2"), "2")
+        self.assertEqual(meny.funcmap.resolve_case_key(funcmap, "-1"), "3")
+        self.assertEqual(meny.funcmap.resolve_case_key(funcmap, "Second case"), "2")
+        self.assertEqual(meny.funcmap.resolve_case_key(funcmap, "third"), "3")
+        self.assertIsNone(meny.funcmap.resolve_case_key(funcmap, "-4"))
+        self.assertIsNone(meny.funcmap.resolve_case_key(funcmap, "fourth"))
+
+    def test_case_index(self):
+        """Cases can be given by unique prefixes of names, and names are completed, special cases take precedence"""
+
+        def fizz():
+            pass
+
+        def fizzbuzz():
+            pass
+
+        @meny.title("Random integer")
+        def random_integer():
+            pass
+
+        def add():
+            pass
+
+        index = meny.funcmap.CaseIndex(meny._menu.construct_funcmap([fizz, fizzbuzz, random_integer, add]))
+        self.assertEqual(index.resolve("fizz"), "1")
+        self.assertEqual(index.resolve("fizzb"), "2")
+        self.assertEqual(index.resolve("Rand"), "3")
+        self.assertEqual(index.resolve("rand"), "3")
+        self.assertIsNone(index.resolve("f"))
+        self.assertListEqual(index.complete("fi"), ["fizz", "fizzbuzz"])
+        self.assertListEqual(index.complete(""), ["add", "fizz", "fizzbuzz", "random_integer"])
+
+        menu = meny.build_menu([fizz, add], frontend="simple")
+        self.assertEqual(menu.resolve_case("ad"), "2")
+        self.assertIsNone(menu.resolve_case("a"))
+
+    def test_get_module_cases(self):
+        """Cases of modules are cached until the module is reloaded or the cache is cleared, submodules load lazily"""
+        import importlib
+
+        with tempfile.TemporaryDirectory() as tmp:
+            package = Path(tmp, "menypkg")
+            (package / "sub").mkdir(parents=True)
+            (package / "__init__.py").write_text("from os.path import join\n\ndef top():\n    return 1\n")
+            (package / "mod.py").write_text("def first():\n    pass\n")
+            (package / "_private.py").write_text("")
+            (package / "sub" / "__init__.py").write_text("")
+            sys.path.insert(0, tmp)
+            try:
+                pkg = importlib.import_module("menypkg")
+                cases = meny.get_package_cases(pkg)
+                self.assertListEqual([case.__name__ for case in cases], ["top", "mod", "sub"])
+                self.assertNotIn("menypkg.mod", sys.modules)
+
+                mod = importlib.import_module("menypkg.mod")
+                self.assertListEqual([case.__name__ for case in meny.utils.get_module_cases(mod)], ["first"])
+                (package / "mod.py").write_text("def first():\n    pass\n\ndef second():\n    pass\n")
+                importlib.invalidate_caches()
+                importlib.reload(mod)
+                cases = meny.utils.get_module_cases(mod)
+                self.assertListEqual([case.__name__ for case in cases], ["first", "second"])
+
+                # Rebinding a function is seen after clearing the cache
+                exec("def second():\n    return 2\n", vars(mod))
+                self.assertIsNone(meny.utils.get_module_cases(mod)[1]())
+                meny.utils.clear_case_cache(mod)
+                self.assertEqual(meny.utils.get_module_cases(mod)[1](), 2)
+            finally:
+                sys.path.remove(tmp)
+                for name in [name for name in sys.modules if name.startswith("menypkg")]:
+                    del sys.modules[name]
+
+    def test_run_case(self):
+        """Menu.run_case runs a single case with converted arguments"""
+
+        def add(a, b):
+            return a + b
+
+        def concat(a: str, b: str):
+            return a + b
+
+        menu = meny.build_menu([add, concat], frontend="simple")
+        self.assertEqual(menu.run_case("1", ["1", "2"]), 3)
+        self.assertEqual(menu.run_case("concat", ["1", "2"]), "12")
+
+        with self.assertRaises(meny.MenuError):
+            menu.run_case("3", [])
+
+    def test_sessions_do_not_share_returns(self):
+        """Menus that run one after another, or concurrently in threads, return only their own results"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def run_menu(name: str, value: int, return_mode: str):
+            def case():
+                return value
+
+            case.__name__ = name
+            menu = meny.build_menu([case], frontend="simple", once=True, return_mode=return_mode)
+            menu.history = None
+            menu._frontend = lambda _: "1"
+            return menu.run()
+
+        self.assertDictEqual(run_menu("first", 1, "flat"), {"first": 1})
+        self.assertDictEqual(run_menu("second", 2, "tree"), {"second": {"return": 2}})
+
+        with ThreadPoolExecutor(8) as pool:
+            returns = list(pool.map(run_menu, [f"case{i}" for i in range(32)], range(32), ["flat"] * 32))
+        self.assertListEqual(returns, [{f"case{i}": i} for i in range(32)])
+
+    def test_pipeline(self):
+        """Stages of a pipeline get the previous return value as is, only the last return value is recorded"""
+
+        def numbers(n):
+            return (i for i in range(n))
+
+        def double(values):
+            return (2 * value for value in values)
+
+        def total(values, extra):
+            return sum(values) + extra
+
+        self.assertListEqual(meny.input_splitter('1 "a|b" | 2'), ["1", '"a|b"', "|", "2"])
+
+        menu = meny.build_menu([numbers, double, total], frontend="simple", once=True, return_mode="flat")
+        menu.history = None
+        menu._frontend = lambda _: "1 4 | 2 | total 10"
+        self.assertDictEqual(menu.run(), {"total": 22})
+
     def test_get_casefunc(self):
         f, txt = meny.cli.get_casefunc("echo '@a @{b} @{c}s Number: @{d=123}'", None)
-        expected = "def f(a: str, b: str, c: str, d: str='123'): subprocess.call(template.safe_substitute(a=a, b=b, c=c, d=d), shell=True, executable=None)"
+        expected = "f(a: str, b: str, c: str, d: str = '123')"
         self.assertEqual(expected, txt)
 
+    @unittest.skipIf(sys.platform == "win32", "Uses POSIX shell commands")
+    def test_json_command_defaults(self):
+        """Commands fill in given arguments and defaults, also with a default before a required parameter"""
+        import json
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cmds.json"
+            out = Path(tmpdir) / "out.txt"
+            path.write_text(json.dumps({"hello": f"echo hi @{{who=world}} @{{x}} >> '{out}'"}))
+            meny.cli.run_json_case(path, "hello", ["bob"], None)
+            meny.cli.run_json_case(path, "hello", ["bob", "alice"], None)
+            self.assertListEqual(out.read_text().splitlines(), ["hi world bob", "hi alice bob"])
+
+    @unittest.skipIf(sys.platform == "win32", "Uses POSIX shell commands")
+    def test_json_command_groups(self):
+        """Commands of __parallel__ and __matrix__ groups run concurrently with output prefixed by command"""
+        import io
+        from contextlib import redirect_stdout
+
+        matrix = meny.cli.get_group_casefunc(
+            {"__matrix__": {"x": ["1", "2"], "y": ["a"]}, "__command__": "echo @x@{y} @{z=default}"}, None
+        )
+        self.assertListEqual(list(inspect.signature(matrix).parameters), ["z"])
+        parallel = meny.cli.get_group_casefunc({"__parallel__": {"ok": "echo @z", "fails": "exit 3"}}, None)
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertDictEqual(matrix(), {"x=1 y=a": 0, "x=2 y=a": 0})
+            self.assertDictEqual(parallel("hi"), {"ok": 0, "fails": 3})
+        lines = output.getvalue().splitlines()
+        self.assertIn("[x=1 y=a] 1a default", lines)
+        self.assertIn("[x=2 y=a] 2a default", lines)
+        self.assertIn("[ok   ] hi", lines)
+
+        with self.assertRaises(meny.MenuError):
+            meny.cli.get_group_casefunc({"__matrix__": {"x": []}, "__command__": "echo @x"}, None)
+
+    @unittest.skipIf(sys.platform == "win32", "Uses POSIX shell commands")
+    def test_template_parameters_with_defaults_first(self):
+        """Parameters with defaults may come before required ones in templates, invalid names raise MenuError"""
+        import io
+        from contextlib import redirect_stdout
+
+        group = meny.cli.get_group_casefunc({"__parallel__": {"echo": "echo @{who=world} @{x}"}}, None)
+        self.assertEqual(str(inspect.signature(group)), "(x: str, who: str = 'world')")
+        self.assertListEqual(meny.casehandlers._handle_args(group, ["1"]), ["1"])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertDictEqual(group("a"), {"echo": 0})
+            self.assertDictEqual(group("b", who="bob"), {"echo": 0})
+        self.assertListEqual(output.getvalue().splitlines(), ["[echo] world a", "[echo] bob b"])
+
+        with self.assertRaises(meny.MenuError):
+            meny.cli.get_group_casefunc({"__parallel__": ["echo @{class}"]}, None)
+
+
+class TestSteps(unittest.TestCase):
+    def test_steps_run_in_order_and_are_skipped_when_up_to_date(self):
+        """Steps run after the steps they need, and are skipped if their command and inputs are unchanged"""
+        import meny.steps
+
+        class Runner:
+            def __init__(self):
+                self.ran = []
+
+            def run(self, name, command):
+                self.ran.append(name)
+                return 1 if command == "fail" else 0
+
+            def show(self, name, line):
+                pass
+
+        with tempfile.TemporaryDirectory() as tmp:
+            data = Path(tmp, "data.csv")
+            data.write_text("1,2\n")
+            spec = {
+                "fetch": "fetch",
+                "clean": {"__command__": "clean @n", "__needs__": "fetch", "__inputs__": [str(data)]},
+                "report": {"__command__": "report", "__needs__": ["clean", "fetch"]},
+                "broken": {"__command__": "fail"},
+                "after_broken": {"__command__": "never", "__needs__": ["broken"]},
+                "cycle": {"__command__": "cycle", "__needs__": ["cycle"]},
+            }
+            steps = meny.steps.parse_steps(spec)
+            self.assertListEqual(meny.steps.graph(steps, "report"), ["fetch", "clean", "report"])
+            with self.assertRaises(meny.MenuError):
+                meny.steps.graph(steps, "cycle")
+
+            def run(target, n="1"):
+                runner = Runner()
+                state = meny.steps.StepState(Path(tmp, "state.json"))
+                outcomes = meny.steps.run_steps(steps, target, runner, lambda text: text.replace("@n", n), state=state)
+                return runner.ran, outcomes
+
+            self.assertEqual(run("report")[0], ["fetch", "clean", "report"])
+            ran, outcomes = run("report")
+            self.assertEqual(ran, ["fetch", "report"])
+            self.assertEqual(outcomes["clean"], meny.steps.UP_TO_DATE)
+            self.assertIn("clean", run("report", n="2")[0])
+            data.write_text("1,2\n3,4\n")
+            self.assertIn("clean", run("report", n="2")[0])
+            ran, outcomes = run("after_broken")
+            self.assertEqual(ran, ["broken"])
+            self.assertEqual(outcomes["after_broken"], meny.steps.NEED_FAILED)
+
+
+class TestRecording(unittest.TestCase):
+    def test_record_and_replay(self):
+        """Inputs are recorded with their depth and outcome, and replayed without a frontend"""
+        import json
+
+        calls = []
+
+        def work(n: int):
+            calls.append(n)
+            return n
+
+        def frontend(_):
+            raise AssertionError("The frontend should not be used when replaying")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "session.jsonl")
+            inputs = iter(["work 2", "1 3", "q"])
+            # Inputs go to a history in the temporary directory, if history is on, not to the user's history
+            historydir = meny.config.HISTORY_DIR
+            meny.config.HISTORY_DIR = Path(tmp, "history")
+            try:
+                menu = meny.build_menu([work], "Session", once=False)
+                menu._frontend = lambda _: next(inputs)
+                meny.enable_recording(path)
+                try:
+                    menu.run()
+                finally:
+                    meny.disable_recording()
+            finally:
+                meny.config.HISTORY_DIR = historydir
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+            self.assertListEqual([record["input"] for record in records], ["work 2", "1 3", "q"])
+            self.assertListEqual([record["outcome"] for record in records], ["ok", "ok", "quit"])
+            self.assertListEqual([record["depth"] for record in records], [1, 1, 1])
+
+            with meny.replay(path) as replayer:
+                menu = meny.build_menu([work], "Session", once=False)
+                menu._frontend = frontend
+                menu.run()
+            self.assertListEqual(calls, [2, 3, 2, 3])
+            self.assertListEqual([row["step"] for row in replayer.report()], [0, 1, 2])
+            self.assertIsNone(replayer.diverged)
+
+            with meny.replay(path) as replayer:
+                menu = meny.build_menu([work], "Another menu", once=False)
+                menu._frontend = frontend
+                menu.run()
+            self.assertEqual(replayer.diverged, 0)
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "history"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_history_persists_and_deduplicates(self):
+        """History is persisted to disk, and only the most recent occurrence of a line is kept"""
+        history = meny.history.History(self.path)
+        for line in ["1 2", "3 'a'", "1 2", "4"]:
+            history.append(line)
+
+        reloaded = meny.history.History(self.path)
+        self.assertEqual(reloaded.recent(10), ["3 'a'", "1 2", "4"])
+        self.assertEqual(len(reloaded), 3)
+
+    def test_history_navigation_and_search(self):
+        """previous, next and search walk the history from newest to oldest"""
+        history = meny.history.History(self.path)
+        for line in ["1 'cat'", "2 'dog'", "1 'cow'"]:
+            history.append(line)
+
+        newest = history.previous()
+        self.assertEqual(history[newest], "1 'cow'")
+        self.assertEqual(history[history.previous(newest)], "2 'dog'")
+        self.assertIsNone(history.next(newest))
+
+        match = history.search("1 '")
+        self.assertEqual(history[match], "1 'cow'")
+        self.assertEqual(history[history.search("1 '", match)], "1 'cat'")
+        self.assertIsNone(history.search("horse"))
+
+    def test_history_compaction(self):
+        """History file is compacted when it grows beyond twice the number of kept entries"""
+        history = meny.history.History(self.path, max_entries=10)
+        for i in range(25):
+            history.append(str(i))
+
+        self.assertLessEqual(len(self.path.read_text().splitlines()), 20)
+        self.assertEqual(meny.history.History(self.path, max_entries=10).recent(3), ["22", "23", "24"])
+
+    @unittest.skipIf(sys.platform == "win32", "POSIX file modes")
+    def test_history_is_private(self):
+        """History directory and files are only accessible to their owner, and history is opt-in for meny.menu"""
+        import stat
+
+        self.assertFalse(meny.config.DEFAULT_HISTORY)
+        path = Path(self.tmpdir.name) / "history" / "menu"
+        path.parent.mkdir(mode=0o755)  # Existing directories are made private as well
+        history = meny.history.History(path, max_entries=1)
+        for line in ["1", "2", "3"]:  # Also compacts
+            history.append(line)
+        self.assertEqual(stat.S_IMODE(path.parent.stat().st_mode), 0o700)
+        self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+
+
+class TestCancellation(unittest.TestCase):
+    def test_timeout_cancels_case(self):
+        """Cases that time out are cancelled, and their cancellation token is set"""
+        tokens = []
+
+        @meny.timeout(0.2)
+        def hang():
+            token = meny.cancellation_token()
+            tokens.append(token)
+            while not token.wait(0.01):
+                pass
+            return "stopped"
+
+        with self.assertRaises(meny.CaseCancelled):
+            meny._handle_casefunc(hang, [], DummyMenu())
+        self.assertTrue(tokens[0].cancelled)
+
+    @unittest.skipIf(sys.platform == "win32", "Sends SIGINT with os.kill")
+    def test_ctrl_c_cancels_case_without_timeout(self):
+        """Ctrl-C cancels a case without timeout, also when SIGINT is ignored like in the meny CLI"""
+        import signal
+        import time
+
+        def hang():
+            os.kill(os.getpid(), signal.SIGINT)
+            time.sleep(5)
+
+        menu = meny.build_menu([hang], frontend="simple")
+        previous = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            start = time.perf_counter()
+            with self.assertRaises(meny.CaseCancelled):
+                meny._handle_casefunc(hang, [], menu)
+            self.assertLess(time.perf_counter() - start, 2)
+            self.assertIs(signal.getsignal(signal.SIGINT), signal.SIG_IGN)
+        finally:
+            signal.signal(signal.SIGINT, previous)
+
+    def test_nested_menu_is_not_timed_out(self):
+        """The clock of a case stops while a nested menu it opened waits for input"""
+        import time
+        from unittest import mock
+
+        def inner():
+            return "inner"
+
+        def outer():
+            return meny.menu([inner], frontend="simple", once=True)
+
+        def slow_input(menu):
+            time.sleep(0.3)
+            return "1"
+
+        menu = meny.build_menu([outer], frontend="simple", timeout=0.1)
+        with mock.patch("meny.simple_interface.interface", slow_input):
+            self.assertEqual(menu.run_case("outer", []), {"inner": "inner"})
+
+    @unittest.skipIf(sys.platform == "win32", "POSIX signals")
+    def test_nested_menu_handles_ctrl_c(self):
+        """Nested menus handle Ctrl-C with on_kbinterrupt, with the SIGINT handler from outside the case"""
+        import signal
+        from unittest import mock
+
+        handlers = []
+
+        def interrupted(menu):
+            handlers.append(signal.getsignal(signal.SIGINT))
+            raise KeyboardInterrupt
+
+        def returns():
+            return meny.menu([interrupted], frontend="simple", on_kbinterrupt="return")
+
+        def raises():
+            return meny.menu([interrupted], frontend="simple", on_kbinterrupt="raise")
+
+        menu = meny.build_menu([returns, raises], frontend="simple")
+        previous = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            with mock.patch("meny.simple_interface.interface", interrupted):
+                self.assertEqual(menu.run_case("returns", []), {})
+                with self.assertRaises(KeyboardInterrupt):
+                    menu.run_case("raises", [])
+        finally:
+            signal.signal(signal.SIGINT, previous)
+        self.assertListEqual(handlers, [signal.SIG_IGN, signal.SIG_IGN])
+
+    def test_timeout_returns_in_time(self):
+        """Cases with menu timeout that return in time behave like normal cases"""
+
+        def add(a, b):
+            return a + b
+
+        def raises():
+            raise ValueError
+
+        menu = meny.build_menu([add, raises], frontend="simple", timeout=5)
+        self.assertEqual(menu.run_case("add", ["1", "2"]), 3)
+        with self.assertRaises(ValueError):
+            menu.run_case("raises", [])
+
+    def test_timeout_decorator_validates(self):
+        with self.assertRaises(ValueError):
+            meny.timeout(-1)
+        with self.assertRaises(ValueError):
+            meny.timeout("10")
+
+
+class TestMetrics(unittest.TestCase):
+    def tearDown(self):
+        meny.disable_metrics()
+
+    def test_metrics_are_recorded_and_exported(self):
+        """Case calls are counted, errors are counted by type and the Prometheus file is written"""
+
+        def ok():
+            pass
+
+        def fails():
+            raise ValueError
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "meny.prom"
+            jsonl_path = Path(tmpdir) / "meny.jsonl"
+            meny.enable_metrics(path, jsonl_path, buckets=(1, 10))
+            handler = meny.casehandlers._FlatHandler()
+            handler(DummyMenu(" Menu "), ok, [])
+            handler(DummyMenu(" Menu "), ok, [])
+            with self.assertRaises(ValueError):
+                handler(DummyMenu(" Menu "), fails, [])
+
+            text = path.read_text()
+            self.assertIn('meny_case_calls_total{menu="Menu",case="ok"} 2', text)
+            self.assertIn('meny_case_errors_total{menu="Menu",case="fails",exception="ValueError"} 1', text)
+            self.assertIn('meny_case_duration_seconds_bucket{menu="Menu",case="ok",le="+Inf"} 2', text)
+            meny.disable_metrics()
+            self.assertEqual(len(jsonl_path.read_text().splitlines()), 3)
+
+    def test_metrics_are_best_effort(self):
+        """Failing to write the metrics fails neither the case nor replaces its exception"""
+
+        def ok():
+            return "ok"
+
+        def fails():
+            raise ValueError
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            meny.enable_metrics(Path(tmpdir) / "missing" / "meny.prom")
+            handler = meny.casehandlers._FlatHandler()
+            with meny.session.Session("flat").activate() as session:
+                handler(DummyMenu("Menu"), ok, [])
+                with self.assertRaises(ValueError):
+                    handler(DummyMenu("Menu"), fails, [])
+            self.assertEqual(session.flat["ok"], "ok")
+            self.assertIn('meny_case_calls_total{menu="Menu",case="ok"} 1', meny.metrics.get_metrics().to_prometheus())
+
+
+class TestLogging(unittest.TestCase):
+    def setUp(self):
+        self.levels = {name: logger.level for name, logger in meny.menylogger._loggers.items()}
+
+    def tearDown(self):
+        meny.menylogger.set_log_format("text")
+        for name, level in self.levels.items():
+            meny.menylogger._loggers[name].setLevel(level)
+        meny.menylogger._stream_handler.setStream(sys.stderr)
+
+    def test_logging_is_queued_and_structured(self):
+        """Handlers are added once per logger, and case durations are logged as JSON lines by the listener"""
+        import io
+        import json
+
+        def ok():
+            pass
+
+        logger = meny.menylogger.getLogger("meny.test", meny.menylogger.INFO)
+        self.assertIs(meny.menylogger.getLogger("meny.test", meny.menylogger.INFO), logger)
+        self.assertEqual(len(logger.handlers), 1)
+
+        stream = io.StringIO()
+        meny.menylogger._stream_handler.setStream(stream)
+        meny.menylogger.set_log_format("json")
+        meny.menylogger.set_log_level("debug")
+        logger.info("\x1b[33mhello\x1b[0m")
+        meny.casehandlers._FlatHandler()(DummyMenu(" Menu "), ok, [])
+        meny.menylogger.flush_logs()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(lines[0]["message"], "hello")
+        self.assertEqual(lines[1]["case"], "ok")
+        self.assertEqual(lines[1]["menu"], "Menu")
+        self.assertEqual(lines[1]["depth"], 0)
+        self.assertGreaterEqual(lines[1]["duration"], 0)
+
+
+class TestTracing(unittest.TestCase):
+    def tearDown(self):
+        meny.disable_tracing()
+
+    def test_spans_are_nested(self):
+        """Spans of nested case calls are linked to their parents, and the trace file is valid JSON"""
+        import json
+
+        handler = meny.casehandlers._FlatHandler()
+
+        def inner(x):
+            return x
+
+        def outer():
+            handler(DummyMenu("Menu"), inner, ["1"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "trace.json"
+            meny.enable_tracing(path)
+            handler(DummyMenu("Menu"), outer, [])
+            meny.disable_tracing()
+            events = [event for event in json.loads(path.read_text()) if event["ph"] == "X"]
+
+        spans = {event["name"]: event for event in events}
+        self.assertEqual(spans["inner"]["args"]["parent_id"], spans["outer"]["args"]["span_id"])
+        self.assertIsNone(spans["outer"]["args"]["parent_id"])
+        self.assertEqual(spans["inner"]["args"]["outcome"], "ok")
+        self.assertLessEqual(spans["inner"]["dur"], spans["outer"]["dur"])
+
+
+class TestMemtrace(unittest.TestCase):
+    def tearDown(self):
+        meny.memtrace.stop_tracker()
+
+    def test_memory_growth_is_recorded_per_case(self):
+        """Traced memory growth of cases is recorded, and the growing allocation site is reported"""
+
+        leak = []
+
+        def leaks():
+            leak.append(bytearray(1024 * 1024))
+
+        def nothing():
+            pass
+
+        tracker = meny.memtrace.start_tracker()
+        handler = meny.casehandlers._FlatHandler()
+        handler(DummyMenu("Menu"), leaks, [])
+        handler(DummyMenu("Menu"), nothing, [])
+
+        summary = tracker.summary()
+        self.assertGreaterEqual(summary["leaks"]["traced_delta"], 1024 * 1024)
+        self.assertLess(summary["nothing"]["traced_delta"], 1024 * 1024)
+        self.assertIn("bytearray", summary["leaks"]["top"][0])
+        self.assertIn("bytearray", meny.memtrace._format_stat(tracker.top_growth()[0]))
+
+    def test_memory_trace_is_passed_to_nested_menus(self):
+        """--memtrace also applies to nested JSON menus, and to the menus of files and directories"""
+        from unittest import mock
+
+        opened = []
+
+        def menu(cases, title, **kwargs):
+            opened.append((title, kwargs["memory_trace"]))
+            return cases
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch("meny.cli.menu", menu):
+            root = Path(tmp, "scripts")
+            (root / "jobs").mkdir(parents=True)
+            (root / "jobs" / "backup.py").write_text("def run():\n    pass\n")
+            (root / "cmds.json").write_text('{"nested": {"hello": "echo hi"}}')
+            with mock.patch("meny.config.INDEX_DIR", Path(tmp, "index")):
+                cases = meny.cli.menu_from_directory(root, False, None, True)
+                cases["jobs/"]()["backup.py"]()
+                cases["cmds.json"]()["nested"]()
+
+        self.assertListEqual([trace for _, trace in opened], [True] * 5)
+
+
+class TestSinks(unittest.TestCase):
+    def tearDown(self):
+        meny.disable_result_sink()
+
+    def test_results_are_written_as_cases_return(self):
+        """Return values are written to the sink when the case returns, unserializable values are compacted"""
+        import json
+
+        def numbers():
+            return [1, 2, 3]
+
+        def unserializable():
+            return object()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "results.jsonl"
+            meny.enable_result_sink("jsonl", str(path))
+            handler = meny.casehandlers._FlatHandler()
+            handler(DummyMenu("Menu"), numbers, [])
+            self.assertEqual(len(path.read_text().splitlines()), 1)
+            handler(DummyMenu("Menu"), unserializable, [])
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+
+        self.assertEqual(records[0], {"menu": "Menu", "case": "numbers", "value": [1, 2, 3]})
+        self.assertEqual(records[1]["value"]["__type__"], "builtins.object")
+
+    def test_pickle_sink_falls_back_to_compact(self):
+        """Values that cannot be pickled are written in compact form"""
+        import io
+        import pickle
+
+        stream = io.BytesIO()
+        sink = meny.sinks.PickleSink(stream)
+        sink.emit("Menu", "case", {"a": 1})
+        sink.emit("Menu", "case", lambda: None)
+        stream.seek(0)
+        self.assertEqual(pickle.load(stream)["value"], {"a": 1})
+        self.assertIn("__repr__", pickle.load(stream)["value"])
+
+
+class TestStreaming(unittest.TestCase):
+    def tearDown(self):
+        meny.disable_result_sink()
+
+    def test_iterator_results_are_streamed(self):
+        """Items of iterator results are written as they arrive, and the record mode decides what is returned"""
+        import json
+
+        @meny.stream(record="head", items=2, show=False)
+        def head():
+            yield from range(5)
+
+        @meny.stream(record="tail", items=2, show=False)
+        def tail():
+            return iter(range(5))
+
+        @meny.stream(record="count", show=False)
+        def count():
+            return map(str, range(5))
+
+        @meny.stream(record="spill", show=False)
+        def spill():
+            yield from ({"i": i} for i in range(3))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "results.jsonl"
+            meny.enable_result_sink("jsonl", str(path))
+            handler = meny.casehandlers._FlatHandler()
+            with meny.session.Session("flat").activate() as session:
+                for case in (head, tail, count, spill):
+                    handler(DummyMenu("Menu"), case, [])
+            records = [json.loads(line) for line in path.read_text().splitlines()]
+
+        self.assertListEqual(session.flat["head"], [0, 1])
+        self.assertEqual(session.flat["head"].count, 5)
+        self.assertListEqual(session.flat["tail"], [3, 4])
+        self.assertEqual(session.flat["count"], 5)
+        self.assertListEqual(list(session.flat["spill"]), [{"i": 0}, {"i": 1}, {"i": 2}])
+        spill_path = session.flat["spill"].path
+        del session.flat["spill"]
+        self.assertFalse(spill_path.exists())
+        self.assertEqual(len(records), 18)
+        self.assertEqual(records[-1], {"menu": "Menu", "case": "spill", "value": {"i": 2}})
+
+        with self.assertRaises(ValueError):
+            meny.stream(record="everything")
+
+    def test_streams_with_timeout_and_in_workers(self):
+        """Timeouts also apply while items are taken, and streams of cases in worker processes are taken there"""
+
+        def slow():
+            yield 1
+            meny.cancellation_token().wait(5)
+            yield 2
+
+        def numbers():
+            yield from range(3)
+
+        stream = meny.build_menu([slow], frontend="simple", timeout=0.2).run_case("slow", [])
+        self.assertEqual(next(stream), 1)
+        with self.assertRaises(meny.CaseCancelled):
+            next(stream)
+
+        if not meny.workers.fork_supported():
+            return
+        menu = meny.build_menu([numbers], frontend="simple", executor="fork")
+        try:
+            self.assertListEqual(list(menu.run_case("numbers", [])), [0, 1, 2])
+        finally:
+            menu.worker_pool.close()
+
+
+class TestPager(unittest.TestCase):
+    def test_curses_is_imported_when_paging(self):
+        """The meny command does not import curses until it pages or opens the fancy frontend"""
+        import subprocess
+
+        code = "import sys, meny.cli, meny.streaming; print('curses' in sys.modules)"
+        root = Path(meny.__file__).parent.parent
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), "False")
+
+    def test_line_index(self):
+        """Lines are indexed as far as they are read, from files and from iterators, and can be searched"""
+        import io
+        import re
+        from contextlib import redirect_stdout
+
+        taken = []
+
+        def items():
+            for i in range(5000):
+                taken.append(i)
+                yield f"item {i}" if i % 1000 else f"item {i}\nthousand"
+
+        index = meny.pager.LineIndex(items())
+        self.assertListEqual(index.lines(0, 3), ["item 0", "thousand", "item 1"])
+        self.assertLess(len(taken), 10)
+        self.assertEqual(index.search(re.compile("^item 999$"), 0), 1000)
+        self.assertEqual(index.search(re.compile("thousand"), 1000, backwards=True), 1)
+        self.assertIsNone(index.search(re.compile("nowhere"), 0))
+        self.assertEqual(len(index), 5005)
+        self.assertTrue(index.complete)
+        index.close()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "lines.txt"
+            path.write_text("a\nb\r\nc")
+            index = meny.pager.LineIndex(path)
+            self.assertListEqual(index.lines(1, 10), ["b", "c"])
+            self.assertEqual(index.ensure(), 3)
+            index.close()
+
+        value = {"a": list(range(3)), "b": "text"}
+        self.assertEqual("\n".join(meny.pager.pformat_lines(value)), "{\n 'a': [0, 1, 2],\n 'b': 'text',\n}")
+
+        # Not a terminal, so the pager is not used
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            self.assertFalse(meny.pager.page(["x", "y\nz"]))
+        self.assertEqual(stdout.getvalue(), "x\ny\nz\n")
+
+
+@unittest.skipUnless(meny.workers.fork_supported(), "requires os.fork")
+class TestBatch(unittest.TestCase):
+    def tearDown(self):
+        meny.sinks.disable_result_sink()
+
+    def run_map(self, inputstring: str, rows=None) -> dict:
+        import io
+        from contextlib import redirect_stdout
+
+        def scale(x, factor=2):
+            if x < 0:
+                raise ValueError("negative")
+            return x * factor
+
+        case_args = None if rows is None else {scale: rows}
+        menu = meny.build_menu([scale], frontend="simple", once=True, return_mode="flat", case_args=case_args)
+        menu.history = None
+        menu._frontend = lambda _: inputstring
+        with redirect_stdout(io.StringIO()):
+            return menu.run()
+
+    def test_map_over_files(self):
+        """Rows are converted like menu input, failing rows do not stop the batch and results are streamed"""
+        import json
+
+        with tempfile.TemporaryDirectory() as tmp:
+            csvpath = Path(tmp, "rows.csv")
+            csvpath.write_text("x,factor\n1,3\n-1,3\n5,\n" + "".join(f"{i},1\n" for i in range(100)))
+            jsonlpath = Path(tmp, "rows.jsonl")
+            jsonlpath.write_text('[1]\n{"x": 2, "factor": 10}\n\nnot json\n')
+            sinkpath = Path(tmp, "results.jsonl")
+            meny.sinks.enable_result_sink("jsonl", str(sinkpath))
+
+            results = self.run_map(f"map 1 '{csvpath}' 4")["scale"]
+            self.assertEqual(len(results), 103)
+            self.assertEqual(results[0], 3)
+            self.assertIsInstance(results[1], ValueError)
+            self.assertIsInstance(results[2], meny.MenuError)  # Empty string is not a valid literal
+            self.assertListEqual(results[3:], list(range(100)))
+            self.assertListEqual(sorted(results.errors), [1, 2])
+
+            results = self.run_map(f"map 1 '{jsonlpath}'")["scale"]
+            self.assertListEqual(results[:2], [2, 20])
+            self.assertIsInstance(results[2], ValueError)
+
+            meny.sinks.disable_result_sink()
+            records = [json.loads(line)["value"] for line in sinkpath.read_text().splitlines()]
+            self.assertEqual(len(records), 106)
+            self.assertIn({"row": 1, "error": "ValueError: negative"}, records)
+            self.assertIn({"row": 1, "value": 20}, records)
+
+    def test_map_over_case_args(self):
+        """Without a source, the rows are taken from case_args"""
+        results = self.run_map("map 1 2", rows=[1, (2, 5), {"x": 3, "factor": 0}])
+        self.assertListEqual(results["scale"], [2, 10, 0])
+
+    @unittest.skipIf(sys.platform == "win32", "Sends SIGINT with os.kill")
+    def test_ctrl_c_cancels_map_without_waiting(self):
+        """Ctrl-C cancels a batch at once, rows that are running are left to finish on their own"""
+        import io
+        import signal
+        import threading
+        import time
+        from contextlib import redirect_stdout
+
+        started = []
+        release = threading.Event()
+
+        def row(x):
+            started.append(x)
+            if x == 0:  # Once the batch waits for the rows
+                threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGINT)).start()
+            release.wait(5)
+
+        batch = meny.batch.Batch(range(100), meny.batch._python_row, 100)
+        batch.concurrency = 2
+        start = time.perf_counter()
+        try:
+            with redirect_stdout(io.StringIO()), self.assertRaises(meny.CaseCancelled):
+                meny.batch.run_batch(row, batch, meny.build_menu([row], frontend="simple"))
+            self.assertLess(time.perf_counter() - start, 2)
+            self.assertLessEqual(len(started), 2)
+        finally:
+            release.set()
+
+
+class TestDirectoryIndex(unittest.TestCase):
+    def test_listings_are_reused_until_directory_changes(self):
+        """Directories without Python or JSON files are left out, and unchanged listings are read from the index"""
+        import meny.dirindex
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp, "scripts")
+            (root / "jobs").mkdir(parents=True)
+            (root / "docs" / "more").mkdir(parents=True)
+            (root / "__pycache__").mkdir()
+            (root / "jobs" / "backup.py").write_text("def run(n):\n    return n * 2\n")
+            (root / "docs" / "readme.txt").write_text("")
+            (root / "cmds.json").write_text('{"hello": "echo hi"}')
+            indexpath = Path(tmp, "index.json")
+
+            index = meny.dirindex.DirectoryIndex(root, indexpath)
+            self.assertEqual(index.entries(""), (["jobs"], ["cmds.json"]))
+            index.save()
+
+            index = meny.dirindex.DirectoryIndex(root, indexpath)
+            self.assertEqual(index.entries(""), (["jobs"], ["cmds.json"]))
+            self.assertFalse(index._dirty)
+
+            (root / "jobs" / "restore.py").write_text("def run():\n    pass\n")
+            os.utime(root / "jobs", ns=(0, 0))  # Make sure the modification time changes
+            index = meny.dirindex.DirectoryIndex(root, indexpath)
+            self.assertEqual(index.entries("jobs"), ([], ["backup.py", "restore.py"]))
+            self.assertTrue(index._dirty)
+
+            # The index of run_directory_case is written to a temporary directory rather than the user's cache
+            indexdir = meny.config.INDEX_DIR
+            meny.config.INDEX_DIR = Path(tmp, "index")
+            try:
+                self.assertEqual(meny.cli.run_directory_case(root, "jobs/", ["backup.py", "run", "21"], None), 42)
+            finally:
+                meny.config.INDEX_DIR = indexdir
+
+
+class TestOutput(unittest.TestCase):
+    def test_output_buffer_is_bounded(self):
+        """Output buffer keeps the most recent lines within the limits, and shows lines like a terminal would"""
+        output = meny.output.OutputBuffer(max_lines=3, max_chars=50)
+        with meny.output.capture_output(output):
+            for i in range(1000):
+                print(f"line {i}")
+            print("\x1b[31mred\x1b[0m")
+            print("10%\r100%", end="")
+        self.assertListEqual(output.tail(10), ["line 998", "line 999", "red", "100%"])
+        self.assertListEqual(output.tail(2, skip=1), ["line 999", "red"])
+        self.assertEqual(output.dropped, 998)
+
+        output.write("x" * 100 + "\n")
+        self.assertListEqual(output.tail(10), ["x" * 50])
+
+    def test_binary_writes_are_not_captured(self):
+        """Bytes written to sys.stdout.buffer go to the real stdout while output is captured"""
+        import io
+        from unittest import mock
+
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", errors="strict")
+        output = meny.output.OutputBuffer()
+        with mock.patch("sys.stdout", stdout), meny.output.capture_output(output):
+            print("text", flush=True)  # The text layer buffers, as it does without capture
+            sys.stdout.buffer.write(b"bytes\n")
+            self.assertEqual(sys.stdout.encoding, "utf-8")
+            self.assertEqual(sys.stdout.errors, "strict")
+            sys.stdout.flush()
+        self.assertEqual(stdout.buffer.getvalue(), b"text\nbytes\n")
+        self.assertListEqual(output.tail(10), ["text"])
+
+
+def _import_benchmark(name: str):
+    path = Path(__file__).resolve().parent.parent / "benchmarks" / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@unittest.skipIf(sys.platform == "win32", "Requires a pseudo-terminal")
+class TestPtyHarness(unittest.TestCase):
+    def test_screen_model(self):
+        """Screen model follows cursor movement, erasing, scrolling and attributes like a terminal"""
+        harness = _import_benchmark("pty_latency")
+        screen = harness.Screen(rows=3, cols=10)
+        screen.feed(b"one\r\ntwo\r\nthree\r\nfour")
+        self.assertEqual(screen.text(), "two\nthree\nfour")
+        screen.feed(b"\x1b[2;3H\x1b[K\x1b[7mX\x1b[m\x1b[3d\x1b[1G\x1b")
+        screen.feed(b"[2Kend")  # Escape sequences may be split between reads
+        self.assertEqual(screen.text(), "two\nthX\nend")
+        self.assertEqual(screen.attrs[1][2], harness.REVERSE)
+        self.assertEqual((screen.y, screen.x), (2, 3))
+        screen.feed(b"\x1b[?1049h\x1b[Halt")
+        self.assertEqual(screen.text(), "alt")
+        screen.feed(b"\x1b[?1049l")
+        self.assertEqual(screen.text(), "two\nthX\nend")
+
+    def test_simple_frontend_on_pty(self):
+        """Menu is drawn on a pseudo-terminal, and is drawn the same after running a case"""
+        harness = _import_benchmark("pty_latency")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            module = harness.write_cases(Path(tmpdir), 3)
+            env = {"PYTHONPATH": os.pathsep.join([str(harness.ROOT), tmpdir])}
+            argv = [sys.executable, "-c", harness.MENU, module, "simple"]
+            with harness.PtyMenu(argv, rows=10, cols=40, env=env) as menu:
+                menu.wait(lambda screen: "Input:" in screen.text(), timeout=10)
+                self.assertIn("3. case_2", menu.screen.text())
+                frame = menu.screen.snapshot()
+                menu.send(b"2", lambda screen: screen.line(screen.y).endswith("2"), timeout=10)
+                menu.send(b"\n", lambda screen: screen.snapshot() == frame, timeout=10)
+                with self.assertRaises(harness.FrontendExited):
+                    menu.send(b"q\n", timeout=10, settle=1)
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_worker_pool_isolates_cases(self):
+        """Cases run in worker processes, and crashes and sys.exit do not affect the calling process"""
+
+        def pid():
+            return os.getpid()
+
+        def add(a, b):
+            return a + b
+
+        def crash():
+            os._exit(3)
+
+        def exits():
+            sys.exit(1)
+
+        def raises():
+            raise ValueError("from worker")
+
+        pool = meny.workers.WorkerPool([pid, add, crash, exits, raises], size=1)
+        try:
+            self.assertNotEqual(pool.call(pid), os.getpid())
+            self.assertEqual(pool.call(add, (1, 2)), 3)
+            with self.assertRaises(meny.MenuError):
+                pool.call(crash)
+            with self.assertRaises(meny.MenuError):
+                pool.call(exits)
+            with self.assertRaises(ValueError):
+                pool.call(raises)
+            self.assertEqual(pool.call(add, ("a", "b")), "ab")
+        finally:
+            pool.close()
+
+    def test_worker_pool_timeout(self):
+        """A worker that times out is killed and replaced"""
+        import time
+
+        def hang():
+            time.sleep(60)
+
+        def pid():
+            return os.getpid()
+
+        pool = meny.workers.WorkerPool([hang, pid], size=1)
+        try:
+            before = pool.call(pid)
+            with self.assertRaises(meny.CaseCancelled):
+                pool.call(hang, timeout=0.2)
+            self.assertNotEqual(before, pool.call(pid))
+        finally:
+            pool.close()
+
+    def test_worker_pool_recycles_workers(self):
+        """Workers are replaced after max_calls calls"""
+
+        def pid():
+            return os.getpid()
+
+        pool = meny.workers.WorkerPool([pid], size=1, max_calls=2)
+        try:
+            pids = [pool.call(pid) for _ in range(4)]
+        finally:
+            pool.close()
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)